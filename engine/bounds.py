@@ -0,0 +1,83 @@
+'''
+This module implements closed-form bounds of the reach sets over the perturbation box
+
+Every value of a discrete reach set is affine in the perturbation parameters, U_n,i = alpha * V_n,i
++ beta * l_n,i, and the interpolation in space U_n(x) = (a * alpha + b * beta) * x + c * alpha
++ d * beta is multilinear in (x, alpha, beta). A multilinear function on a box reaches its minimum
+and maximum at vertices of the box, so evaluating all vertices gives the exact bounds and their
+points, for all nodes or segments at once, without running an optimizer per node.
+'''
+
+import itertools
+import numpy as np
+
+
+class BoundKernel(object):
+    'exact minimum and maximum of multilinear functions by evaluation at the box vertices'
+
+    @staticmethod
+    def get_vertex_bounds(values, vertices):
+        'min, argmin, max, argmax of values (n, number of vertices) at the vertices (n, number of vertices, dim)'
+
+        n = values.shape[0]
+        rows = np.arange(0, n)
+        i_min = np.argmin(values, axis=1)
+        i_max = np.argmax(values, axis=1)
+
+        return values[rows, i_min], vertices[rows, i_min], values[rows, i_max], vertices[rows, i_max]
+
+    @staticmethod
+    def get_affine_bounds(vector_Vn, vector_ln, alpha_range, beta_range):
+        'bounds of alpha * Vn[i] + beta * ln[i] for all i, return min_vec, min_points, max_vec, max_points'
+
+        # min_points[i] = [alpha, beta] where the minimum is reached, shape (n, 2), the same for max_points
+        Vn = np.asarray(vector_Vn, dtype=float).reshape(-1)
+        ln = np.asarray(vector_ln, dtype=float).reshape(-1)
+        assert Vn.shape == ln.shape, 'inconsistent Vn and ln'
+
+        corners = np.array([[alpha, beta] for alpha in alpha_range for beta in beta_range], dtype=float)
+        values = Vn[:, None] * corners[None, :, 0] + ln[:, None] * corners[None, :, 1]
+        vertices = np.broadcast_to(corners, (Vn.shape[0],) + corners.shape)
+
+        return BoundKernel.get_vertex_bounds(values, vertices)
+
+    @staticmethod
+    def get_inspace_bounds(a_vec, b_vec, c_vec, d_vec, xlist, alpha_range, beta_range):
+        'bounds of (a * alpha + b * beta) * x + c * alpha + d * beta on every segment [x[i], x[i + 1]]'
+
+        # return min_vec, min_points, max_vec, max_points, min_points[i] = [x, alpha, beta], shape (n, 3)
+        x = np.asarray(xlist, dtype=float)
+        assert x.shape[0] == a_vec.shape[0] + 1, 'inconsistency between xlist and coefficients'
+
+        x_ends = np.vstack((x[0:-1], x[1:])).T    # shape (n, 2)
+        corners = np.array([[alpha, beta] for alpha in alpha_range for beta in beta_range], dtype=float)
+
+        # vertices[i, 4 * e + c] = [x_ends[i, e], alpha_c, beta_c]
+        n = a_vec.shape[0]
+        vertices = np.zeros((n, 8, 3), dtype=float)
+        vertices[:, :, 0] = np.repeat(x_ends, 4, axis=1)
+        vertices[:, :, 1:] = np.tile(corners, (2, 1))[None, :, :]
+
+        xv = vertices[:, :, 0]
+        alpha = vertices[:, :, 1]
+        beta = vertices[:, :, 2]
+        values = (a_vec[:, None] * alpha + b_vec[:, None] * beta) * xv + c_vec[:, None] * alpha + d_vec[:, None] * beta
+
+        return BoundKernel.get_vertex_bounds(values, vertices)
+
+    @staticmethod
+    def get_box_bounds(func, lower, upper):
+        'bounds of a multilinear func on the boxes [lower[i], upper[i]], lower and upper have shape (n, dim)'
+
+        # func takes dim arrays of shape (n, 2^dim), the coordinates of the vertices, and returns the
+        # values of shape (n, 2^dim). min_points[i] is the vertex of box i where the minimum is reached
+        lower = np.asarray(lower, dtype=float)
+        upper = np.asarray(upper, dtype=float)
+        assert lower.ndim == 2 and lower.shape == upper.shape, 'inconsistent lower and upper'
+
+        dim = lower.shape[1]
+        corners = np.array(list(itertools.product((False, True), repeat=dim)))    # shape (2^dim, dim)
+        vertices = np.where(corners[None, :, :], upper[:, None, :], lower[:, None, :])
+        values = func(*[vertices[:, :, k] for k in xrange(0, dim)])
+
+        return BoundKernel.get_vertex_bounds(values, vertices)
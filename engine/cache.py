@@ -0,0 +1,225 @@
+'''
+This module implements cache classes used to avoid rebuilding expensive objects
+
+LRUCache is a bounded in-process cache. AssemblyCache adds a persistent tier on top of it: the
+arrays an automaton is built from (matrices, factorizations, load vectors) are stored as compressed
+npz files keyed by a content hash, so a later job on the same mesh and time step skips the assembly.
+'''
+
+import os
+import hashlib
+import zipfile
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse import csc_matrix, issparse
+
+
+class LRUCache(object):
+    'bounded least-recently-used cache'
+
+    # max_size bounds the number of items, max_bytes (optional) the total nbytes of the numpy arrays
+    # and scipy sparse matrices stored, also inside dicts, lists and tuples; other values count as
+    # 0 bytes. An item larger than max_bytes is not stored.
+
+    def __init__(self, max_size, max_bytes=None):
+
+        assert isinstance(max_size, int) and max_size >= 1, 'invalid max_size'
+        assert max_bytes is None or max_bytes > 0, 'invalid max_bytes'
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_nbytes(value):
+        'memory of a cached value, the nbytes of the numpy arrays and sparse matrices it holds'
+
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if issparse(value):
+            return sum([LRUCache.get_nbytes(getattr(value, name, None)) for name in ['data', 'indices', 'indptr',
+                                                                                      'row', 'col', 'offsets']])
+        if isinstance(value, dict):
+            return sum([LRUCache.get_nbytes(item) for item in value.itervalues()])
+        if isinstance(value, (list, tuple)):
+            return sum([LRUCache.get_nbytes(item) for item in value])
+
+        return 0
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key, default=None):
+        'return the cached value of key and mark it as most recently used'
+
+        if key not in self.items:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        value = self.items.pop(key)
+        self.items[key] = value
+
+        return value
+
+    def put(self, key, value):
+        'store value, the least recently used item is dropped when the cache is full'
+
+        if key in self.items:
+            self.num_bytes -= LRUCache.get_nbytes(self.items.pop(key))
+
+        nbytes = LRUCache.get_nbytes(value)
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return
+
+        while len(self.items) >= self.max_size or \
+          (self.max_bytes is not None and self.items and self.num_bytes + nbytes > self.max_bytes):
+            _, old_value = self.items.popitem(last=False)
+            self.num_bytes -= LRUCache.get_nbytes(old_value)
+
+        self.items[key] = value
+        self.num_bytes += nbytes
+
+    def get_or_build(self, key, build_func):
+        'return the cached value of key, build and store it with build_func() if it is missing'
+
+        value = self.get(key)
+        if value is None:
+            value = build_func()
+            self.put(key, value)
+
+        return value
+
+    def clear(self):
+        'remove all items'
+
+        self.items.clear()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+
+class AssemblyCache(object):
+    'two-tier cache of assembled arrays: an in-memory LRU and compressed npz files in a directory'
+
+    # an item is a dict name -> numpy array or scipy sparse matrix, sparse matrices are stored in the
+    # npz file by their csc arrays. Items are keyed by a content hash of everything they depend on,
+    # see get_key. The returned arrays are shared with the cache and should not be modified.
+    # directory = None keeps the in-memory tier only. The in-memory tier holds at most max_size items
+    # and max_bytes of arrays, see LRUCache; max_bytes = None bounds it by the number of items only.
+
+    SPARSE_FIELDS = ['data', 'indices', 'indptr', 'shape']
+
+    def __init__(self, max_size=16, directory=None, max_bytes=256 * 2 ** 20):
+
+        self.memory = LRUCache(max_size, max_bytes)
+        self.directory = directory
+        self.disk_hits = 0
+        self.disk_misses = 0
+
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def get_key(*parts):
+        'content hash of the key parts, numpy arrays are hashed by their bytes, other parts by repr'
+
+        sha = hashlib.sha1()
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                sha.update(np.ascontiguousarray(part).tostring())
+            else:
+                sha.update(repr(part))
+            sha.update('|')
+
+        return sha.hexdigest()
+
+    def get_filename(self, key):
+        'npz file of a key'
+
+        return os.path.join(self.directory, '{}.npz'.format(key))
+
+    def load(self, key):
+        'read an item from the disk tier, None if it is missing or unreadable'
+
+        if self.directory is None:
+            return None
+
+        filename = self.get_filename(key)
+        if not os.path.isfile(filename):
+            self.disk_misses += 1
+            return None
+
+        try:
+            with np.load(filename) as npz:
+                arrays = dict([(name, npz[name]) for name in npz.files])
+        except (IOError, ValueError, zipfile.BadZipfile):
+            # a partially written or corrupted file is rebuilt
+            self.disk_misses += 1
+            return None
+
+        item = {}
+        for name, value in arrays.iteritems():
+            if '__csc_' not in name:
+                item[name] = value
+            elif name.endswith('__csc_data'):
+                name = name[0:-len('__csc_data')]
+                fields = [arrays['{}__csc_{}'.format(name, field)] for field in AssemblyCache.SPARSE_FIELDS]
+                item[name] = csc_matrix((fields[0], fields[1], fields[2]), shape=tuple(fields[3]))
+
+        self.disk_hits += 1
+
+        return item
+
+    def save(self, key, item):
+        'write an item to the disk tier, the file is renamed into place when it is complete'
+
+        if self.directory is None:
+            return
+
+        arrays = {}
+        for name, value in item.iteritems():
+            assert '__csc_' not in name, 'invalid array name {}'.format(name)
+            if issparse(value):
+                value = csc_matrix(value)
+                fields = [value.data, value.indices, value.indptr, np.array(value.shape)]
+                for field, array in zip(AssemblyCache.SPARSE_FIELDS, fields):
+                    arrays['{}__csc_{}'.format(name, field)] = array
+            else:
+                arrays[name] = np.asarray(value)
+
+        filename = self.get_filename(key)
+        tmp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+        with open(tmp_filename, 'wb') as tmp_file:
+            np.savez_compressed(tmp_file, **arrays)
+        os.rename(tmp_filename, filename)
+
+    def get_or_build(self, key, build_func):
+        'return the item of key from memory, then from disk, build and store it with build_func() if it is missing'
+
+        item = self.memory.get(key)
+        if item is None:
+            item = self.load(key)
+            if item is None:
+                item = build_func()
+                self.save(key, item)
+            self.memory.put(key, item)
+
+        return item
+
+    def clear(self, remove_files=False):
+        'remove all items from memory, and the npz files of the directory if remove_files is True'
+
+        self.memory.clear()
+        self.disk_hits = 0
+        self.disk_misses = 0
+
+        if remove_files and self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith('.npz'):
+                    os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,283 @@
+'''
+This module implements a domain decomposition solver whose subdomains are factorized and solved in worker processes
+
+The implicit step of a large 2D/3D automaton is a solve with B (see engine.solver). Here the unknowns
+are split into num_domains subdomains and an interface G: the unknowns are ordered by reverse
+Cuthill-McKee and cut into contiguous chunks, an unknown with a neighbour in a later chunk belongs to
+G, so the subdomains are not coupled to each other. With the unknowns ordered [I_1, ..., I_p, G]
+
+    B = [[B_11,           B_1G],
+         [      ...,       ... ],
+         [          B_pp, B_pG],
+         [B_G1, ..., B_Gp, B_GG]]
+
+and B x = r is solved by the Schur complement S = B_GG - sum B_Gi * inv(B_ii) * B_iG:
+
+    y_i = inv(B_ii) * r_i                          (in parallel)
+    S * x_G = r_G - sum B_Gi * y_i                 (sparse, size of the interface)
+    x_i = inv(B_ii) * (r_i - B_iG * x_G)           (in parallel)
+
+The contributions B_Gi * inv(B_ii) * B_iG are computed in parallel, each is dense only on the interface
+unknowns coupled to subdomain i, so S is assembled as a sparse matrix and factorized by sparse LU.
+For the step operator A = inv(B) * C of the automaton the rows r_i = C_i * x of the product by C are
+computed by the workers too, so a whole step of the Vn, ln (and e) columns runs in parallel except the
+interface rows. This is a direct solve, the result is the same as with one factorization of B up to
+rounding. Each worker process factorizes its B_ii once and keeps it, the columns to solve and the
+solutions are exchanged through shared memory, only short commands go through the pipes.
+'''
+
+import multiprocessing
+import numpy as np
+from scipy.sparse import csr_matrix, csc_matrix, coo_matrix, issparse
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+from scipy.sparse.linalg import splu
+from engine.linear_operator import Operator
+
+
+def subdomain_worker(conn, matrix_ii, matrix_ig, matrix_gi, interface_cols, rows, interface_rows, shared_rhs,
+                     shared_res, max_cols, matrix_ci=None, shared_in=None):
+    'worker loop of a subdomain: factorize B_ii once, then run the commands received on conn'
+
+    # matrix_ig and matrix_gi are B_iG and B_Gi restricted to the interface unknowns coupled to the subdomain,
+    # matrix_ci the rows C_i of C (all columns, permuted) applied to the input columns in shared_in
+
+    # commands: ('schur',) returns B_Gi * inv(B_ii) * B_iG on the interface columns of the subdomain,
+    # ('forward', m, with_c) writes y_i (and r_i = C_i * x first if with_c), ('backward', m) writes x_i
+    # in the rows of the subdomain, None stops
+    rhs = np.frombuffer(shared_rhs, dtype=float).reshape(-1, max_cols)
+    res = np.frombuffer(shared_res, dtype=float).reshape(-1, max_cols)
+    inp = None if shared_in is None else np.frombuffer(shared_in, dtype=float).reshape(-1, max_cols)
+
+    try:
+        factor = splu(csc_matrix(matrix_ii))
+    except Exception as err:    # reported to the main process when the first command arrives
+        factor = err
+
+    while True:
+        command = conn.recv()
+        if command is None:
+            break
+
+        try:
+            if isinstance(factor, Exception):
+                raise factor
+
+            if command[0] == 'schur':
+                # B_ii is solved for 256 columns of B_iG at a time to bound the memory
+                contribution = np.zeros((interface_cols.shape[0], interface_cols.shape[0]), dtype=float)
+                for j in xrange(0, interface_cols.shape[0], 256):
+                    contribution[:, j:j + 256] = matrix_gi * factor.solve(matrix_ig[:, j:j + 256].toarray())
+                conn.send(('ok', contribution))
+                continue
+
+            m = command[1]
+            if command[0] == 'forward':
+                if command[2]:
+                    rhs[rows, 0:m] = matrix_ci * inp[:, 0:m]
+                res[rows, 0:m] = factor.solve(np.ascontiguousarray(rhs[rows, 0:m]))
+            else:
+                interface_x = res[interface_rows, 0:m][interface_cols]
+                local_rhs = rhs[rows, 0:m] - np.asarray(matrix_ig * interface_x)
+                res[rows, 0:m] = factor.solve(np.ascontiguousarray(local_rhs))
+            conn.send(('ok', None))
+
+        except Exception as err:
+            conn.send(('error', '{}: {}'.format(type(err).__name__, err)))
+
+    conn.close()
+
+
+class DomainDecompositionSolver(object):
+    'Schur complement domain decomposition of a square sparse matrix, the subdomains are solved in worker processes'
+
+    # max_cols columns are solved at once, more columns are solved in chunks. With matrix_c, solve
+    # can apply inv(B) * C (see DecomposedStepOperator). The workers are daemon processes, close()
+    # stops them; it is called when the solver is garbage collected (e.g. dropped from the step
+    # operator cache of an automaton), at the end of a with block, or by DPdeAutomaton.close().
+
+    def __init__(self, matrix, num_domains=None, max_cols=4, matrix_c=None):
+
+        assert issparse(matrix) and matrix.shape[0] == matrix.shape[1], 'invalid matrix'
+
+        if num_domains is None:
+            num_domains = multiprocessing.cpu_count()
+        assert isinstance(num_domains, int) and num_domains >= 1, 'invalid num_domains'
+        assert isinstance(max_cols, int) and max_cols >= 1, 'invalid max_cols'
+
+        matrix = csr_matrix(matrix)
+        n = matrix.shape[0]
+        self.shape = matrix.shape
+        self.max_cols = max_cols
+        self.conns = []
+        self.workers = []
+
+        domains, interface = DomainDecompositionSolver.partition(matrix, num_domains)
+        self.perm = np.concatenate(domains + [interface])    # new position -> old unknown
+        self.num_interior = n - interface.shape[0]
+        self.num_domains = len(domains)
+
+        permuted = csr_matrix(matrix[self.perm][:, self.perm])
+        m_i = self.num_interior
+        self.matrix_gi = permuted[m_i:, 0:m_i]    # B_GI, used for the interface right hand side
+        matrix_gg = permuted[m_i:, m_i:]
+
+        self.shared_rhs = multiprocessing.RawArray('d', n * max_cols)
+        self.shared_res = multiprocessing.RawArray('d', n * max_cols)
+        self.rhs = np.frombuffer(self.shared_rhs, dtype=float).reshape(n, max_cols)
+        self.res = np.frombuffer(self.shared_res, dtype=float).reshape(n, max_cols)
+
+        self.matrix_cg = None    # interface rows C_G of C, None without matrix_c
+        self.shared_in = None
+        if matrix_c is not None:
+            assert issparse(matrix_c) and matrix_c.shape == matrix.shape, 'invalid matrix_c'
+            permuted_c = csr_matrix(csr_matrix(matrix_c)[self.perm][:, self.perm])
+            self.matrix_cg = permuted_c[m_i:]
+            self.shared_in = multiprocessing.RawArray('d', n * max_cols)
+            self.inp = np.frombuffer(self.shared_in, dtype=float).reshape(n, max_cols)
+
+        interface_parts = []    # interface columns of each subdomain
+        start = 0
+        for domain in domains:
+            rows = slice(start, start + domain.shape[0])
+            start += domain.shape[0]
+            matrix_ig = csc_matrix(permuted[rows, m_i:])
+            matrix_gi = csr_matrix(permuted[m_i:, rows])
+            interface_cols = np.flatnonzero(np.diff(matrix_ig.indptr) + np.diff(matrix_gi.indptr))
+            interface_parts.append(interface_cols)
+
+            conn, worker_conn = multiprocessing.Pipe()
+            matrix_ci = None if matrix_c is None else permuted_c[rows]
+            worker = multiprocessing.Process(target=subdomain_worker,
+                                             args=(worker_conn, permuted[rows, rows], matrix_ig[:, interface_cols],
+                                                   matrix_gi[interface_cols], interface_cols, rows, slice(m_i, n),
+                                                   self.shared_rhs, self.shared_res, max_cols, matrix_ci,
+                                                   self.shared_in))
+            worker.daemon = True
+            worker.start()
+            self.conns.append(conn)
+            self.workers.append(worker)
+
+        # sparse Schur complement, assembled from the dense blocks contributed by the subdomains
+        matrix_gg = matrix_gg.tocoo()
+        rows_list = [matrix_gg.row]
+        cols_list = [matrix_gg.col]
+        data_list = [matrix_gg.data]
+        for interface_cols, contribution in zip(interface_parts, self.run(('schur',))):
+            rows_list.append(np.repeat(interface_cols, interface_cols.shape[0]))
+            cols_list.append(np.tile(interface_cols, interface_cols.shape[0]))
+            data_list.append(-contribution.ravel())
+        self.interface_size = n - m_i
+        schur = coo_matrix((np.concatenate(data_list), (np.concatenate(rows_list), np.concatenate(cols_list))),
+                           shape=(self.interface_size, self.interface_size))
+        self.schur_factor = splu(csc_matrix(schur)) if self.interface_size > 0 else None
+
+    @staticmethod
+    def partition(matrix, num_domains):
+        'split the unknowns into num_domains subdomains (arrays of unknowns) and an interface'
+
+        # reverse Cuthill-McKee keeps the neighbours of an unknown close in the ordering, so the
+        # contiguous chunks have short interfaces. An unknown coupled to a later chunk is moved to the
+        # interface, then no two subdomains are coupled. The pattern of B + B^T is used.
+        n = matrix.shape[0]
+        pattern = csr_matrix(abs(matrix) + abs(matrix).T)
+        order = reverse_cuthill_mckee(pattern, symmetric_mode=True)
+        chunk_of = np.zeros((n,), dtype=int)
+        chunk_of[order] = np.arange(0, n) * num_domains // n
+
+        coo = pattern.tocoo()
+        later = chunk_of[coo.col] > chunk_of[coo.row]
+        in_interface = np.zeros((n,), dtype=bool)
+        in_interface[coo.row[later]] = True
+
+        domains = [order[(chunk_of[order] == i) & ~in_interface[order]] for i in xrange(0, num_domains)]
+        domains = [domain for domain in domains if domain.shape[0] > 0]
+
+        return domains, order[in_interface[order]]
+
+    def run(self, command):
+        'send a command to all workers, wait for all of them, return their results'
+
+        for conn in self.conns:
+            conn.send(command)
+
+        replies = [conn.recv() for conn in self.conns]
+        for status, value in replies:
+            if status == 'error':
+                raise RuntimeError('subdomain worker failed, {}'.format(value))
+
+        return [value for _, value in replies]
+
+    def solve_block(self, rhs, with_c=False):
+        'solve matrix * x = rhs (or C * rhs) for at most max_cols columns, rhs is in the original order'
+
+        m = rhs.shape[1]
+        m_i = self.num_interior
+        if with_c:
+            self.inp[:, 0:m] = rhs[self.perm]
+            self.rhs[m_i:, 0:m] = self.matrix_cg * self.inp[:, 0:m]
+        else:
+            self.rhs[:, 0:m] = rhs[self.perm]
+        self.run(('forward', m, with_c))
+
+        if self.schur_factor is not None:
+            interface_rhs = self.rhs[m_i:, 0:m] - np.asarray(self.matrix_gi * self.res[0:m_i, 0:m])
+            self.res[m_i:, 0:m] = self.schur_factor.solve(np.ascontiguousarray(interface_rhs))
+            self.run(('backward', m))
+
+        res = np.zeros((rhs.shape[0], m), dtype=float)
+        res[self.perm] = self.res[:, 0:m]
+
+        return res
+
+    def solve(self, rhs, with_c=False):
+        'solve matrix * x = rhs, or matrix * x = C * rhs if with_c, rhs is a numpy array with one or several columns'
+
+        assert not with_c or self.matrix_cg is not None, 'the solver has no matrix_c'
+        rhs = np.asarray(rhs, dtype=float)
+        is_vector = rhs.ndim == 1
+        rhs = rhs.reshape(rhs.shape[0], -1)
+
+        res = np.zeros(rhs.shape, dtype=float)
+        for j in xrange(0, rhs.shape[1], self.max_cols):
+            res[:, j:j + self.max_cols] = self.solve_block(rhs[:, j:j + self.max_cols], with_c)
+
+        return res[:, 0] if is_vector else res
+
+    def close(self):
+        'stop the worker processes'
+
+        for conn, worker in zip(self.conns, self.workers):
+            if worker.is_alive():
+                conn.send(None)
+                worker.join()
+            conn.close()
+
+        self.conns = []
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:    # the pipes may already be gone at interpreter exit
+            pass
+
+
+class DecomposedStepOperator(Operator):
+    'step operator inv(B) * C whose products by C and solves with B run in the subdomain workers'
+
+    # solver is a DomainDecompositionSolver of B built with matrix_c = C
+
+    def __init__(self, solver):
+
+        assert solver.matrix_cg is not None, 'the solver has no matrix_c'
+        Operator.__init__(self, solver.shape)
+        self.solver = solver
+
+    def matmat(self, mat):
+        return self.solver.solve(mat, with_c=True)
@@ -7,159 +7,165 @@ Main references:
     2) The Finite Element Method: Theory, Implementation and Applications, Mats G. Larson, Fredirik Bengzon
 '''
 
-from scipy.sparse import lil_matrix, linalg
+from scipy.sparse import csc_matrix
 from engine.pde_automaton import DPdeAutomaton
-from engine.functions import Functions
+from engine.source import FunctionRegistry, ProjectionCache
+from engine.mesh import Mesh1D
+from engine.solver import Factorization, BandedCholeskySolver
+from engine.linear_operator import FactorizedOperator, SineTransformOperator, SymTridiagonalOperator
+from engine.cache import AssemblyCache
 
 
 class Fem1D(object):
     'contains functions of finite element method for 1D PDEs'
 
+    # x is a list (or array) of discretized mesh points, for example x = [0 , 0.1, 0.2, .., 0.9, 1],
+    # or an engine.mesh.Mesh1D object. A list is validated each time it is passed, a Mesh1D is
+    # validated once when it is built, so pass the same Mesh1D to avoid repeating the checks.
+    # A list gives linear elements (hat functions), use Mesh1D(x, order=2) for quadratic elements.
+    # Quadratic elements give the discrete reach sets, the interpolation sets and Verifier need linear ones.
+
     @staticmethod
     def mass_assembler(x):
         'compute mass matrix for 1D problem'
 
-        # x is list of discretized mesh points for example x = [0 , 0.1, 0.2,
-        # .., 0.9, 1]
-        assert isinstance(x, list)
-        assert len(x) > 3, 'len(x) should >= 3'
-
-        for i in xrange(0, len(x) - 2):
-            assert isinstance(
-                x[i], float), 'x[{}] should be float type'.format(i)
-            assert isinstance(
-                x[i + 1], float), 'x[{}] should be float type'.format(i + 1)
-            assert x[i +
-                     1] > x[i], 'x[i + 1] = {} should be > x[i] = {}'.format(x[i +
-                                                                               1], x[i])
-
-        n = len(x) - 2    # number of discretized variables
-        mass_matrix = lil_matrix((n, n), dtype=float)
-
-        # filling mass_matrix
-
-        for i in xrange(0, n):
-            hi = x[i + 1] - x[i]
-            hi_plus_1 = x[i + 2] - x[i + 1]
-
-            mass_matrix[i, i] = hi / 3 + hi_plus_1 / 3
-            if i + 1 <= n - 1:
-                mass_matrix[i, i + 1] = hi_plus_1 / 6
-            if i - 1 >= 0:
-                mass_matrix[i, i - 1] = hi / 6
-
-        return mass_matrix.tocsc()
+        # the returned matrix is cached on the mesh object and should not be modified
+        return Mesh1D.from_points(x).get_mass_matrix()
 
     @staticmethod
     def stiff_assembler(x):
         'compute stiff matrix for 1D problem'
 
-        # x is list of discretized mesh points for example x = [0 , 0.1, 0.2,
-        # .., 0.9, 1]
-        assert isinstance(x, list)
-        assert len(x) > 3, 'len(x) should >= 3'
-
-        for i in xrange(0, len(x) - 2):
-            assert isinstance(
-                x[i], float), 'x[{}] should be float type'.format(i)
-            assert isinstance(
-                x[i + 1], float), 'x[{}] should be float type'.format(i + 1)
-            assert x[i +
-                     1] > x[i], 'x[i + 1] = {} should be > x[i] = {}'.format(x[i +
-                                                                               1], x[i])
-
-        n = len(x) - 2    # number of discretized variables
-        stiff_matrix = lil_matrix((n, n), dtype=float)
-
-        # filling stiff_matrix
-
-        for i in xrange(0, n):
-
-            hi = x[i + 1] - x[i]
-            hi_plus_1 = x[i + 2] - x[i + 1]
-
-            stiff_matrix[i, i] = 1 / hi + 1 / hi_plus_1
-
-            if i + 1 <= n - 1:
-                stiff_matrix[i, i + 1] = -1 / hi_plus_1
-            if i - 1 >= 0:
-                stiff_matrix[i, i - 1] = -1 / hi
-
-        return stiff_matrix.tocsc()
+        # the returned matrix is cached on the mesh object and should not be modified
+        return Mesh1D.from_points(x).get_stiff_matrix()
 
     @staticmethod
     def load_assembler(x, x_dom, time_step, current_step):
         'compute load vector for 1D problem'
 
-        # x is list of discretized mesh points for example x = [0 , 0.1, 0.2, .., 0.9, 1]
-        # y is a variable that used to construct the f * phi function
-        # the input function is defined in engine.functions.Functions class
+        # the input function is defined in engine.source.FunctionRegistry
         # x_dom = [x1, x2] defines the domain where the input function effect,
         # t_dom = (0 <= t<= time_step))
         # return [b_i] = integral (f * phi_i dx dt), ((x1 <= x <= x2), (t[n-1] <=
         # t<= t[n]))
 
-        assert isinstance(x, list)
+        mesh = Mesh1D.from_points(x)
         assert isinstance(x_dom, list)
-
-        assert len(x) > 3, 'len(x) should >= 3'
         assert len(x_dom) == 2, 'len(f_domain) should be 2'
-        assert (x[0] <= x_dom[0]) and (x_dom[0] <= x_dom[1]) and (
-            x_dom[1] <= x[len(x) - 1]), 'inconsistent domain'
-
-        for i in xrange(0, len(x) - 2):
-            assert isinstance(
-                x[i], float), 'x[{}] should be float type'.format(i)
-            assert isinstance(
-                x[i + 1], float), 'x[{}] should be float type'.format(i + 1)
-            assert x[i +
-                     1] > x[i], 'x[i + 1] = {} should be > x[i] = {}'.format(x[i + 1], x[i])
-
+        assert (mesh.points[0] <= x_dom[0]) and (x_dom[0] <= x_dom[1]) and (
+            x_dom[1] <= mesh.points[-1]), 'inconsistent domain'
         assert time_step > 0, 'invalid time_step'
         assert isinstance(current_step, int)
 
-        n = len(x) - 2    # number of discretized variables
+        n = mesh.num_dofs    # number of discretized variables
 
-        b = lil_matrix((n, 1), dtype=float)
+        if current_step < 1:
+            return csc_matrix((n, 1), dtype=float)
 
-        for i in xrange(0, n):
-            seg_x = [x[i], x[i + 1], x[i + 2]]
-            if current_step >= 1:
-                b[i, 0] = Functions.integrate_input_func_mul_phi(
-                    seg_x, x_dom, [float(current_step - 1) * time_step, time_step * current_step])
+        # all elements are integrated at once by Gauss quadrature, see engine.quadrature,
+        # the result is cached by (input function, mesh, time interval)
+        t_dom = [float(current_step - 1) * time_step, time_step * current_step]
+        b = ProjectionCache.get_load_vector(mesh.points, x_dom, t_dom, mesh_hash=mesh.get_hash(), order=mesh.order)
 
-        return b.tocsc()
+        return csc_matrix(b.reshape(n, 1))
 
     @staticmethod
     def get_init_cond(x):
         'get initial condition from initial condition function'
 
-        # x is list of discreted mesh points, for example x = [0 , 0.1, 0.2,
-        # .., 0.9, 1]
-        assert isinstance(x, list)
-        assert len(x) >= 3, 'len(x) = {} should be >= 3'.format(len(x))
+        mesh = Mesh1D.from_points(x)
+        n = mesh.num_dofs
+        init_func = FunctionRegistry.get_init_func()
+        u0 = init_func(mesh.nodes[1:n + 1])
 
-        n = len(x) - 2
-        u0 = lil_matrix((n, 1), dtype=float)
-        _, init_func = Functions.init_func()
-        for i in xrange(0, n):
-            v = x[i + 1]
-            u0[i, 0] = init_func(v)
+        return csc_matrix(u0.reshape(n, 1))
 
-        return u0.tocsc()
+    @staticmethod
+    def get_step_data(x, time_step, spectral=False):
+        'arrays the Crank-Nicolson step operators of a time step are built from, see get_step_operators'
+
+        # B = M + k/2 * K is factorized once (banded Cholesky), inv(B) is never formed,
+        # A = inv(B) * (M - k/2 * K) is applied as a matrix-free stencil and a solve, see engine.solver.
+        # spectral = True (uniform mesh, linear elements): M and K are Toeplitz, A and inv(B) are diagonal
+        # in sine space and are applied by two DSTs, no factorization, see SineTransformOperator
+        mesh = Mesh1D.from_points(x)
+        if spectral:
+            assert mesh.order == 1 and mesh.is_uniform(), 'the spectral step needs a uniform mesh and linear elements'
+            mass_eig = mesh.get_mass_stencil().get_sine_eigenvalues()
+            stiff_eig = mesh.get_stiff_stencil().get_sine_eigenvalues()
+            b_eig = mass_eig + stiff_eig * (time_step / 2)
+            c_eig = mass_eig - stiff_eig * (time_step / 2)
+            return {'a_eig': c_eig / b_eig, 'inv_b_eig': 1.0 / b_eig}
+
+        if mesh.order == 1:
+            mass_op = mesh.get_mass_stencil()
+            stiff_op = mesh.get_stiff_stencil()
+            matrix_b = mass_op.plus(stiff_op, time_step / 2)
+            matrix_c = mass_op.plus(stiff_op, -time_step / 2)
+            data = {'c_off_diag': matrix_c.off_diag, 'c_diag': matrix_c.diag}
+        else:
+            mass_mat = mesh.get_mass_matrix()
+            stiff_mat = mesh.get_stiff_matrix()
+            matrix_b = mass_mat + stiff_mat.multiply(time_step / 2)
+            matrix_c = mass_mat - stiff_mat.multiply(time_step / 2)
+            data = {'matrix_c': csc_matrix(matrix_c)}
+
+        solver = Factorization.factorize(matrix_b, spd=True)
+        if isinstance(solver, BandedCholeskySolver):
+            data['b_factor'] = solver.factor
+        else:
+            data['matrix_b'] = csc_matrix(matrix_b)
+
+        return data
 
     @staticmethod
-    def get_dPde_automaton(x, x_dom, time_step):
-        'initialize discreted Pde automaton'
+    def build_step_operators(data):
+        'step operators (matrix_a, inv_b_matrix) from the arrays of get_step_data, a banded B is not factorized again'
+
+        if 'a_eig' in data:
+            return SineTransformOperator(data['a_eig']), SineTransformOperator(data['inv_b_eig'])
+
+        if 'matrix_c' in data:
+            matrix_c = data['matrix_c']
+        else:
+            matrix_c = SymTridiagonalOperator(data['c_off_diag'], data['c_diag'])
+
+        if 'b_factor' in data:
+            solver = BandedCholeskySolver.from_factor(data['b_factor'])
+        else:
+            solver = Factorization.factorize(data['matrix_b'], spd=True)
 
-        mass_mat = Fem1D.mass_assembler(x)
-        stiff_mat = Fem1D.stiff_assembler(x)
-        load_vec = Fem1D.load_assembler(x, x_dom, time_step, 0)
-        init_vector = Fem1D.get_init_cond(x)
+        return FactorizedOperator(solver, matrix_c), FactorizedOperator(solver)
+
+    @staticmethod
+    def get_step_operators(x, time_step, spectral=False, cache=None):
+        'Crank-Nicolson step operators (matrix_a, inv_b_matrix) of a time step'
+
+        # cache is an engine.cache.AssemblyCache, the arrays of get_step_data are then keyed by the
+        # content hash of (mesh, time step, spectral) and only computed on a miss of both tiers
+        mesh = Mesh1D.from_points(x)
+        if cache is None:
+            data = Fem1D.get_step_data(mesh, time_step, spectral)
+        else:
+            key = AssemblyCache.get_key('Fem1D.step', mesh.get_hash(), float(time_step), spectral)
+            data = cache.get_or_build(key, lambda: Fem1D.get_step_data(mesh, time_step, spectral))
+
+        return Fem1D.build_step_operators(data)
+
+    @staticmethod
+    def get_dPde_automaton(x, x_dom, time_step, order=None, spectral=False, cache=None):
+        'initialize discreted Pde automaton'
 
-        inv_b_matrix = linalg.inv(mass_mat + stiff_mat.multiply(time_step / 2))
+        # order = 1 (default for a list x) or 2 (quadratic elements),
+        # spectral = True uses the DST step operators of uniform meshes, see get_step_operators.
+        # cache = engine.cache.AssemblyCache memoizes the step operators and the load timeline, so
+        # repeated builds on the same mesh and time step (in this job or, with a directory, a later one)
+        # skip the assembly
+        mesh = Mesh1D.from_points(x, order)
+        load_vec = Fem1D.load_assembler(mesh, x_dom, time_step, 0)
+        init_vector = Fem1D.get_init_cond(mesh)
 
-        matrix_a = inv_b_matrix * (mass_mat - stiff_mat.multiply(time_step / 2))
+        matrix_a, inv_b_matrix = Fem1D.get_step_operators(mesh, time_step, spectral, cache)
         vector_b = inv_b_matrix * load_vec
         dPde = DPdeAutomaton()
         dPde.set_matrix_a(matrix_a)
@@ -167,7 +173,10 @@ class Fem1D(object):
         dPde.set_inv_b_matrix(inv_b_matrix)
         dPde.set_fxdom(x_dom)
         dPde.set_init_condition(init_vector)
-        dPde.set_xlist_time_step(x, time_step)
+        dPde.set_xlist_time_step(mesh, time_step)
+        dPde.set_step_builder(lambda mesh, k: Fem1D.get_step_operators(mesh, k, spectral, cache))
+        if cache is not None:
+            dPde.set_assembly_cache(cache)
 
         return dPde
 
@@ -0,0 +1,201 @@
+'''
+This module implements Finite Element Method for 2D heat equations on triangulations
+
+The P1 (linear) elements of an engine.mesh.Triangulation_2D are assembled all at once: the
+element matrices of all triangles are computed as (num_elements, 3, 3) arrays and scattered
+into one COO matrix, the load vectors of all time steps are integrated by one vectorized
+quadrature. Nodes on the boundary have zero Dirichlet condition.
+'''
+
+import numpy as np
+from scipy.sparse import csc_matrix, coo_matrix
+from engine.pde_automaton import DPdeAutomaton
+from engine.mesh import Triangulation_2D
+from engine.quadrature import GaussQuadrature
+from engine.solver import Factorization, ConjugateGradientSolver
+from engine.decomposition import DomainDecompositionSolver, DecomposedStepOperator
+from engine.linear_operator import FactorizedOperator
+
+
+class LoadTimeline2D(object):
+    'load vectors of time steps 0, 1, ..., N of a 2D heat equation, stored as columns of an n x (N + 1) array'
+
+    # column k = integral (f * phi_i dx dy dt) over [t[k-1], t[k]], zero for k = 0.
+    # With first_step > 0 only the steps first_step, ..., N are computed (a chunk of a longer timeline)
+
+    def __init__(self, mesh, time_step, num_steps, input_func, num_points=4, first_step=0):
+
+        assert isinstance(mesh, Triangulation_2D)
+        assert time_step > 0, 'invalid time_step'
+        assert isinstance(num_steps, int) and num_steps >= 0, 'invalid num_steps'
+        assert isinstance(first_step, int) and 0 <= first_step <= num_steps, 'invalid first_step'
+
+        self.kind = 'interval'
+        self.time_step = time_step
+        self.first_step = first_step
+        self.num_steps = num_steps
+        self.data = np.zeros((mesh.num_dofs, num_steps - first_step + 1), dtype=float, order='F')
+
+        if num_steps >= max(first_step, 1):
+            # space: edge midpoint rule (exact for quadratics), phi_i is 1/2 at the two midpoints of the
+            # edges of node i and 0 at the third one. time: Gauss-Legendre points of each step
+            areas, _ = mesh.get_areas_gradients()
+            p = mesh.nodes_mat[mesh.elements_mat].astype(float)    # shape (num_elements, 3, 2)
+            mid = (p + np.roll(p, -1, axis=1)) / 2    # mid[:, i] is the midpoint of edge (i, i + 1)
+            phi_mid = np.array([[0.5, 0.0, 0.5], [0.5, 0.5, 0.0], [0.0, 0.5, 0.5]])    # phi_i at mid[:, q]
+            weights = np.abs(areas) / 3
+
+            # scatter matrix from (element, local node) to interior nodes
+            local_dofs = mesh.dof_index[mesh.elements_mat].ravel()
+            inside = local_dofs >= 0
+            num_local = local_dofs.shape[0]
+            scatter = csc_matrix(coo_matrix((np.ones((np.count_nonzero(inside),)),
+                                             (local_dofs[inside], np.arange(0, num_local)[inside])),
+                                            shape=(mesh.num_dofs, num_local)))
+
+            ts, tw = GaussQuadrature.get_points_weights(num_points)
+            steps = np.arange(max(first_step, 1), num_steps + 1)
+            chunk = max(1, int(4e6 // (mesh.num_elements * 3 * num_points)))
+            for i in xrange(0, steps.shape[0], chunk):
+                cur_steps = steps[i:i + chunk]
+                tq = ((cur_steps - 1) * time_step)[:, None] + time_step * ts[None, :]
+                shape = (mesh.num_elements, 3, tq.shape[0], tq.shape[1])
+                fq = np.broadcast_to(input_func(mid[:, :, 0, None, None], mid[:, :, 1, None, None],
+                                                tq[None, None, :, :]), shape)
+                f_int_t = time_step * np.dot(fq, tw)    # shape (num_elements, 3 midpoints, steps)
+                element_ints = np.einsum('iq,eqs->eis', phi_mid, f_int_t) * weights[:, None, None]
+                self.data[:, cur_steps - first_step] = scatter * element_ints.reshape(num_local, cur_steps.shape[0])
+
+    def get_column(self, step):
+        'load vector of a step as an array of shape (n,), shared with the timeline'
+
+        assert self.first_step <= step <= self.num_steps, 'step {} is out of the timeline'.format(step)
+
+        return self.data[:, step - self.first_step]
+
+
+class Fem2D(object):
+    'contains functions of finite element method for 2D heat equations on triangulations'
+
+    # mesh is an engine.mesh.Triangulation_2D, the input function f(x, y, t) and the initial
+    # condition u0(x, y) are vectorized numpy callables
+
+    @staticmethod
+    def mass_assembler(mesh):
+        'compute mass matrix of the interior nodes'
+
+        # the returned matrix is cached on the mesh object and should not be modified
+        assert isinstance(mesh, Triangulation_2D)
+        return mesh.get_mass_matrix()
+
+    @staticmethod
+    def stiff_assembler(mesh):
+        'compute stiff matrix of the interior nodes'
+
+        # the returned matrix is cached on the mesh object and should not be modified
+        assert isinstance(mesh, Triangulation_2D)
+        return mesh.get_stiff_matrix()
+
+    @staticmethod
+    def load_assembler(mesh, time_step, current_step, input_func):
+        'compute load vector [b_i] = integral (f * phi_i dx dy dt), t[n-1] <= t <= t[n]'
+
+        assert isinstance(mesh, Triangulation_2D)
+        assert time_step > 0, 'invalid time_step'
+        assert isinstance(current_step, int)
+
+        n = mesh.num_dofs
+        if current_step < 1:
+            return csc_matrix((n, 1), dtype=float)
+
+        # only step current_step is integrated, on a time grid shifted to start at t[n-1]
+        shifted_func = lambda x, y, t: input_func(x, y, t + (current_step - 1) * time_step)
+        timeline = LoadTimeline2D(mesh, time_step, 1, shifted_func)
+
+        return csc_matrix(timeline.get_column(1).reshape(n, 1))
+
+    @staticmethod
+    def get_init_cond(mesh, init_func):
+        'get initial condition at the interior nodes'
+
+        assert isinstance(mesh, Triangulation_2D)
+        p = mesh.nodes_mat[mesh.interior_nodes].astype(float)
+        u0 = np.broadcast_to(init_func(p[:, 0], p[:, 1]), (mesh.num_dofs,))
+
+        return csc_matrix(np.array(u0, dtype=float).reshape(mesh.num_dofs, 1))
+
+    @staticmethod
+    def get_step_operators(mesh, time_step, preconditioner=None, err_tol=1e-10, num_domains=None):
+        'Crank-Nicolson step operators (matrix_a, inv_b_matrix) of a time step'
+
+        # B = M + k/2 * K is factorized once, A = inv(B) * (M - k/2 * K), see engine.solver.
+        # with a preconditioner ('jacobi', 'ilu' or 'amg') B is not factorized, each solve is done by
+        # conjugate gradient to ||x - x*||_2 <= err_tol. The eigenvalues of B are >= those of M. Since
+        # x^T M x = sum of x_e^T M_e x_e and area_e / 12 is the smallest eigenvalue of the element mass
+        # matrix M_e, they are >= the smallest sum of area_e / 12 over the triangles of an interior node.
+        # with num_domains, B is split into subdomains factorized and solved in as many worker
+        # processes, which also apply C, see engine.decomposition
+        assert preconditioner is None or num_domains is None, 'choose conjugate gradient or domain decomposition'
+        mass_mat = mesh.get_mass_matrix()
+        stiff_mat = mesh.get_stiff_matrix()
+        matrix_b = mass_mat + stiff_mat.multiply(time_step / 2)
+        matrix_c = mass_mat - stiff_mat.multiply(time_step / 2)
+        if num_domains is not None:
+            solver = DomainDecompositionSolver(matrix_b, num_domains, matrix_c=matrix_c)
+            return DecomposedStepOperator(solver), FactorizedOperator(solver)
+        elif preconditioner is None:
+            solver = Factorization.factorize(matrix_b, spd=True)
+        else:
+            areas, _ = mesh.get_areas_gradients()
+            node_eig = np.bincount(mesh.elements_mat.ravel(), weights=np.repeat(np.abs(areas) / 12, 3),
+                                   minlength=mesh.num_nodes)
+            min_eigenvalue = np.min(node_eig[mesh.interior_nodes])
+            solver = ConjugateGradientSolver(matrix_b, preconditioner, err_tol, min_eigenvalue)
+
+        return FactorizedOperator(solver, matrix_c), FactorizedOperator(solver)
+
+    @staticmethod
+    def get_dPde_automaton(mesh, time_step, input_func, init_func, preconditioner=None, err_tol=1e-10,
+                           num_domains=None):
+        'initialize discreted Pde automaton of the 2D heat equation'
+
+        # preconditioner = None: direct factorization, otherwise conjugate gradient,
+        # num_domains: domain decomposition in worker processes, see get_step_operators
+        assert isinstance(mesh, Triangulation_2D)
+        assert time_step > 0, 'invalid time_step'
+
+        matrix_a, inv_b_matrix = Fem2D.get_step_operators(mesh, time_step, preconditioner, err_tol, num_domains)
+        load_vec = Fem2D.load_assembler(mesh, time_step, 0, input_func)
+        dPde = DPdeAutomaton()
+        dPde.set_matrix_a(matrix_a)
+        dPde.set_vector_b(inv_b_matrix * load_vec)
+        dPde.set_inv_b_matrix(inv_b_matrix)
+        dPde.set_init_condition(Fem2D.get_init_cond(mesh, init_func))
+        dPde.set_mesh_time_step(mesh, time_step)
+        dPde.set_step_builder(lambda cur_mesh, k: Fem2D.get_step_operators(cur_mesh, k, preconditioner, err_tol,
+                                                                           num_domains))
+        dPde.set_load_builder(lambda num_steps, first_step=0: LoadTimeline2D(mesh, time_step, num_steps, input_func,
+                                                                             first_step=first_step))
+
+        return dPde
+
+
+if __name__ == '__main__':
+
+    import time
+    from engine.verifier import ReachSetAssembler
+
+    num_cells = 224    # 2 * 224^2 ~ 10^5 triangles
+    start = time.time()
+    mesh = Triangulation_2D.from_rectangle(1.0, 1.0, num_cells, num_cells)
+    f = lambda x, y, t: np.exp(-t) * np.sin(np.pi * x) * np.sin(np.pi * y)
+    u0 = lambda x, y: x * (1.0 - x) * y * (1.0 - y)
+    dPde = Fem2D.get_dPde_automaton(mesh, 0.01, f, u0)
+    end = time.time()
+    print "\nassembled {} triangles, {} unknowns in {} seconds".format(mesh.num_elements, mesh.num_dofs, end - start)
+
+    dPde.set_perturbation((0.9, 1.1), (0.9, 1.1))
+    start = time.time()
+    u, e, bl = ReachSetAssembler.get_dreachset(dPde, 10)
+    end = time.time()
+    print "\n10 reach set steps in {} seconds, max |u| = {}".format(end - start, np.max(np.abs(u[-1].Vn.toarray())))
@@ -8,282 +8,171 @@ Main references:
     2) The Finite Element Method: Theory, Implementation and Applications, Mats G. Larson, Fredirik Bengzon
 '''
 
-from scipy.sparse import lil_matrix, linalg
-from sympy import Function, cos, lambdify
+from scipy.sparse import csc_matrix
 from engine.pde_automaton import DPdeAutomaton
-from engine.functions import Functions
+from engine.source import FunctionRegistry, ProjectionCache
+from engine.mesh import Mesh1D
+from engine.solver import WaveSchurSolver, Factorization
+from engine.linear_operator import FactorizedOperator, to_array
 import numpy as np
-from scipy import sparse
-from sympy.abc import y
+from scipy.sparse import bmat
 
 class Fem1Dw(object):
     'contains functions of finite element method for 1D PDEs'
 
+    # x is a list (or array) of discretized mesh points, for example x = [0 , 0.1, 0.2, .., 0.9, 1],
+    # or an engine.mesh.Mesh1D object which is validated once when it is built
+
     @staticmethod
     def mass_assembler(x):
         'compute mass matrix for 1D problem'
 
-        # x is list of discretized mesh points for example x = [0 , 0.1, 0.2,
-        # .., 0.9, 1]
-        assert isinstance(x, list)
-        assert len(x) > 3, 'len(x) should >= 3'
-
-        for i in xrange(0, len(x) - 2):
-            assert isinstance(
-                x[i], float), 'x[{}] should be float type'.format(i)
-            assert isinstance(
-                x[i + 1], float), 'x[{}] should be float type'.format(i + 1)
-            assert x[i +
-                     1] > x[i], 'x[i + 1] = {} should be > x[i] = {}'.format(x[i +
-                                                                               1], x[i])
-
-        n = len(x) - 2    # number of discretized variables
-        mass_matrix = lil_matrix((n, n), dtype=float)
-
-        # filling mass_matrix
-
-        for i in xrange(0, n):
-            hi = x[i + 1] - x[i]
-            hi_plus_1 = x[i + 2] - x[i + 1]
-
-            mass_matrix[i, i] = hi / 3 + hi_plus_1 / 3
-            if i + 1 <= n - 1:
-                mass_matrix[i, i + 1] = hi_plus_1 / 6
-            if i - 1 >= 0:
-                mass_matrix[i, i - 1] = hi / 6
-
-        return mass_matrix.tocsc()
+        # the returned matrix is cached on the mesh object and should not be modified
+        return Mesh1D.from_points(x).get_mass_matrix()
 
     @staticmethod
     def stiff_assembler(x):
         'compute stiff matrix for 1D problem'
 
-        # x is list of discretized mesh points for example x = [0 , 0.1, 0.2,
-        # .., 0.9, 1]
-        assert isinstance(x, list)
-        assert len(x) > 3, 'len(x) should >= 3'
-
-        for i in xrange(0, len(x) - 2):
-            assert isinstance(
-                x[i], float), 'x[{}] should be float type'.format(i)
-            assert isinstance(
-                x[i + 1], float), 'x[{}] should be float type'.format(i + 1)
-            assert x[i +
-                     1] > x[i], 'x[i + 1] = {} should be > x[i] = {}'.format(x[i +
-                                                                               1], x[i])
-
-        n = len(x) - 2    # number of discretized variables
-        stiff_matrix = lil_matrix((n, n), dtype=float)
-
-        # filling stiff_matrix
-
-        for i in xrange(0, n):
-
-            hi = x[i + 1] - x[i]
-            hi_plus_1 = x[i + 2] - x[i + 1]
-
-            stiff_matrix[i, i] = 1 / hi + 1 / hi_plus_1
-
-            if i + 1 <= n - 1:
-                stiff_matrix[i, i + 1] = -1 / hi_plus_1
-            if i - 1 >= 0:
-                stiff_matrix[i, i - 1] = -1 / hi
-
-        return stiff_matrix.tocsc()
+        # the returned matrix is cached on the mesh object and should not be modified
+        return Mesh1D.from_points(x).get_stiff_matrix()
 
     @staticmethod
     def load_assembler(x, x_dom, time_step, current_step):
         'compute load vector for 1D problem'
 
-        # x is list of discretized mesh points for example x = [0 , 0.1, 0.2, .., 0.9, 1]
-        # y is a variable that used to construct the f * phi function
-        # the input function is defined in engine.functions.Functions class
+        # the input function is defined in engine.source.FunctionRegistry
         # x_dom = [x1, x2] defines the domain where the input function effect,
         # t_dom = (0 <= t<= time_step))
         # return [b_i] = integral (f * phi_i dx), (x1 <= x <= x2))
 
-        assert isinstance(x, list)
+        mesh = Mesh1D.from_points(x)
         assert isinstance(x_dom, list)
-
-        assert len(x) > 3, 'len(x) should >= 3'
         assert len(x_dom) == 2, 'len(f_domain) should be 2'
-        assert (x[0] <= x_dom[0]) and (x_dom[0] <= x_dom[1]) and (
-            x_dom[1] <= x[len(x) - 1]), 'inconsistent domain'
-	assert current_step >= 1, 'current_step < 1'
-
-        for i in xrange(0, len(x) - 2):
-            assert isinstance(
-                x[i], float), 'x[{}] should be float type'.format(i)
-            assert isinstance(
-                x[i + 1], float), 'x[{}] should be float type'.format(i + 1)
-            assert x[i +
-                     1] > x[i], 'x[i + 1] = {} should be > x[i] = {}'.format(x[i + 1], x[i])
-
+        assert (mesh.points[0] <= x_dom[0]) and (x_dom[0] <= x_dom[1]) and (
+            x_dom[1] <= mesh.points[-1]), 'inconsistent domain'
+        assert current_step >= 1, 'current_step < 1'
         assert time_step > 0, 'invalid time_step'
         assert isinstance(current_step, int)
 
-        n = len(x) - 2    # number of discretized variables
+        n = mesh.num_dofs    # number of discretized variables
+        mesh_hash = mesh.get_hash()
 
-        b = lil_matrix((2*n, 1), dtype=float)
-	
-        for i in xrange(0, n):	#we don't intergrate among t
-            seg_x = [x[i], x[i + 1], x[i + 2]]
-            b[n + i, 0] = Functions.integrate_input_func_mul_phi_in_space(seg_x, x_dom, time_step * current_step)
-	    b[n + i, 0] = b[n + i, 0] + Functions.integrate_input_func_mul_phi_in_space(seg_x, x_dom, time_step * (current_step - 1))
-	    b[n + i, 0] = b[n + i, 0] * time_step/2
+        b = np.zeros((2 * n, 1), dtype=float)
 
-        return b.tocsc()
+        # we don't intergrate among t, the space integrals are cached by (input function, mesh, time)
+        b_t_curr = ProjectionCache.get_load_vector(mesh.points, x_dom, time_step * current_step, mesh_hash=mesh_hash)
+        b_t_prev = ProjectionCache.get_load_vector(mesh.points, x_dom, time_step * (current_step - 1), mesh_hash=mesh_hash)
+        b[n:2 * n, 0] = (b_t_curr + b_t_prev) * time_step / 2
+
+        return csc_matrix(b)
 
     @staticmethod
-    def load_assembler_err(x, x_dom, time_step, current_step, prev_u, cur_u):
+    def load_assembler_err(x, x_dom, time_step, current_step, prev_u, cur_u, mass_solver=None, load_timeline=None):
         'compute load vector for 1D problem, we added u double dots on right hand side'
 
-        # x is list of discretized mesh points for example x = [0 , 0.1, 0.2, .., 0.9, 1]
-        # y is a variable that used to construct the f * phi function
-        # the input function is defined in engine.functions.Functions class
+        # the input function is defined in engine.source.FunctionRegistry
         # x_dom = [x1, x2] defines the domain where the input function effect,
         # t_dom = (0 <= t<= time_step))
         # return [b_i] = integral (f * phi_i dx), (x1 <= x <= x2))
+        # mass_solver is a factorization of the mass matrix (see engine.solver), it is step-invariant,
+        # so pass the one stored on the automaton (dPde.mass_solver) instead of refactorizing at every step,
+        # load_timeline is an engine.source.LoadTimeline of kind 'point' (dPde.get_load_timeline)
 
-        assert isinstance(x, list)
+        mesh = Mesh1D.from_points(x)
         assert isinstance(x_dom, list)
-
-        assert len(x) > 3, 'len(x) should >= 3'
         assert len(x_dom) == 2, 'len(f_domain) should be 2'
-        assert (x[0] <= x_dom[0]) and (x_dom[0] <= x_dom[1]) and (
-            x_dom[1] <= x[len(x) - 1]), 'inconsistent domain'
-	assert current_step >= 1, 'current_step < 1'
-
-        for i in xrange(0, len(x) - 2):
-            assert isinstance(
-                x[i], float), 'x[{}] should be float type'.format(i)
-            assert isinstance(
-                x[i + 1], float), 'x[{}] should be float type'.format(i + 1)
-            assert x[i +
-                     1] > x[i], 'x[i + 1] = {} should be > x[i] = {}'.format(x[i + 1], x[i])
-
+        assert (mesh.points[0] <= x_dom[0]) and (x_dom[0] <= x_dom[1]) and (
+            x_dom[1] <= mesh.points[-1]), 'inconsistent domain'
+        assert current_step >= 1, 'current_step < 1'
         assert time_step > 0, 'invalid time_step'
         assert isinstance(current_step, int)
 
-        n = len(x) - 2    # number of discretized variables
-        b = lil_matrix((2*n, 1), dtype=float)
-
-        b_t_curr = lil_matrix((n, 1), dtype=float)
-
-        for i in xrange(0, n):
-            seg_x = [x[i], x[i + 1], x[i + 2]]
-            b_t_curr[i, 0] = Functions.integrate_input_func_mul_phi_in_space(seg_x, x_dom, time_step * current_step)
-
-	s = Fem1Dw.stiff_assembler(x)
-
-	u_value_curr = cur_u.Vn + cur_u.ln
-	
-	u_value_curr = u_value_curr[0 : n]
-
-	M_inv = linalg.inv(Fem1Dw.mass_assembler(x))
-	
-	sec_deri_cur = M_inv * (b_t_curr - s * u_value_curr)
-
-	b_t_prev = lil_matrix((n, 1), dtype=float)
-
-        for i in xrange(0, n):
-            seg_x = [x[i], x[i + 1], x[i + 2]]
-            b_t_prev[i, 0] = Functions.integrate_input_func_mul_phi_in_space(seg_x, x_dom, time_step * (current_step - 1))
-
-	u_value_prev = prev_u.Vn + prev_u.ln
-
-	u_value_prev = u_value_prev[0 : n]
-	
-	sec_deri_prev = M_inv * (b_t_prev - s * u_value_prev)
-
-
-
-        for i in xrange(0, n):	#we don't intergrate among t
-
-            seg_x = [x[i], x[i + 1], x[i + 2]]
-
-	    b[n + i, 0] = Functions.integrate_input_func_mul_phi_in_space(seg_x, x_dom, time_step * current_step) - sec_deri_cur[i, 0] * 4/3 * time_step  
-	    b[n + i, 0] = b[n + i, 0] + Functions.integrate_input_func_mul_phi_in_space(seg_x, x_dom, time_step * (current_step - 1)) - sec_deri_prev[i, 0] * 4/3 * time_step  
-	    b[n + i, 0] = b[n + i, 0] * time_step/2	    
-
-        return b.tocsc()
-
-
+        n = mesh.num_dofs    # number of discretized variables
+        mesh_hash = mesh.get_hash()
+        b = np.zeros((2 * n, 1), dtype=float)
+
+        # space integrals of f * phi_i at t[n] and t[n-1], read from the load timeline (kind 'point') if it
+        # is given, otherwise each one is computed once and cached
+        if load_timeline is not None:
+            assert load_timeline.kind == 'point', 'wave load timeline should be of kind point'
+            b_t_curr = load_timeline.get_column(current_step).reshape(n, 1)
+            b_t_prev = load_timeline.get_column(current_step - 1).reshape(n, 1)
+        else:
+            b_t_curr = ProjectionCache.get_load_vector(
+                mesh.points, x_dom, time_step * current_step, mesh_hash=mesh_hash).reshape(n, 1)
+            b_t_prev = ProjectionCache.get_load_vector(
+                mesh.points, x_dom, time_step * (current_step - 1), mesh_hash=mesh_hash).reshape(n, 1)
+
+        stiff_op = mesh.get_stiff_stencil()
+        if mass_solver is None:
+            mass_solver = Factorization.factorize(mesh.get_mass_stencil(), spd=True)
+
+        u_value_curr = cur_u.Vn + cur_u.ln
+        u_value_curr = u_value_curr[0: n]
+        u_value_prev = prev_u.Vn + prev_u.ln
+        u_value_prev = u_value_prev[0: n]
+
+        # second derivatives inv(M) * (b - K * u) at t[n] and t[n-1], solved together
+        u_values = np.hstack((to_array(u_value_curr), to_array(u_value_prev)))
+        rhs = np.hstack((b_t_curr, b_t_prev)) - stiff_op.matmat(u_values)
+        sec_deri = mass_solver.solve(rhs)
+        sec_deri_cur = sec_deri[:, 0:1]
+        sec_deri_prev = sec_deri[:, 1:2]
+
+        b[n:2 * n] = b_t_curr - sec_deri_cur * 4 / 3 * time_step
+        b[n:2 * n] = b[n:2 * n] + b_t_prev - sec_deri_prev * 4 / 3 * time_step
+        b[n:2 * n] = b[n:2 * n] * time_step / 2
+
+        return csc_matrix(b)
 
     @staticmethod
     def get_init_cond(x):
         'get initial condition from initial condition function'
 
-        # x is list of discreted mesh points, for example x = [0 , 0.1, 0.2,
-        # .., 0.9, 1]
-        assert isinstance(x, list)
-        assert len(x) >= 3, 'len(x) = {} should be >= 3'.format(len(x))
+        mesh = Mesh1D.from_points(x)
+        n = mesh.num_dofs
+        u0 = np.zeros((2 * n, 1), dtype=float)
+        mesh_points = mesh.points[1:n + 1]
 
-        n = len(x) - 2
-        u0 = lil_matrix((2*n, 1), dtype=float)
-        _, init_func = Functions.init_func()
+        # initial displacement u0(x) and initial velocity v0(x), see engine.source.FunctionRegistry
+        u0[0:n, 0] = FunctionRegistry.get_init_func()(mesh_points)
+        u0[n:2 * n, 0] = FunctionRegistry.get_init_velocity_func()(mesh_points)
 
-	source_f = Function('func')
-	source_f = cos(y)
-	f = lambdify(y, source_f)
+        return csc_matrix(u0)
 
-        for i in xrange(0, n):
-            v = x[i + 1]
-            u0[i, 0] = init_func(v)
+    @staticmethod
+    def get_dPde_automaton(x, x_dom, time_step):
+        'initialize discreted Pde automaton'
 
+        # A1 * U[n] = A2 * U[n-1] + g[n], U = [u; v], the automaton is U[n] = inv(A1) * A2 * U[n-1] + inv(A1) * g[n]
+        mesh = Mesh1D.from_points(x)
+        mass_mat = Fem1Dw.mass_assembler(mesh)
+        stiff_mat = Fem1Dw.stiff_assembler(mesh)
+        load_vec = Fem1Dw.load_assembler(mesh, x_dom, time_step, 1)
+        init_vector = Fem1Dw.get_init_cond(mesh)
 
-	for i in xrange(0, n):
-	    v = x[i + 1]
-	    u0[i + n, 0] = f(v)
+        # matrix before Un-1, A2 = [[M, k/2 * M], [-k/2 * K, M]], assembled block-sparse
+        final_matrix_A2 = bmat([[mass_mat, mass_mat.multiply(time_step / 2)],
+                                [-stiff_mat.multiply(time_step / 2), mass_mat]], format='csc')
 
-        return u0.tocsc()
+        # matrix before Un, A1 = [[M, -k/2 * M], [k/2 * K, M]], never formed or inverted,
+        # inv(A1) is applied by a Schur complement solve, see engine.solver.WaveSchurSolver
+        solver_A1 = WaveSchurSolver(mesh.get_mass_stencil(), mesh.get_stiff_stencil(), time_step)
+        inv_A1_matrix = FactorizedOperator(solver_A1)
 
-    @staticmethod
-    def get_dPde_automaton(x, x_dom, time_step):
-        'initialize discreted Pde automaton'
-	'A1Un = A2Un-1 + b'
-        mass_mat = Fem1Dw.mass_assembler(x)
-        stiff_mat = Fem1Dw.stiff_assembler(x)
-        load_vec = Fem1Dw.load_assembler(x, x_dom, time_step, 1)
-        init_vector = Fem1Dw.get_init_cond(x)
-
-	'matrix before Un, A1'
-	temp_matrix_a1 = np.concatenate((mass_mat.transpose().todense(), -mass_mat.multiply(time_step /2).transpose().todense()), axis=0)
-	temp_matrix_a1 = temp_matrix_a1.transpose()
-
-	temp_matrix_b1 = np.concatenate((stiff_mat.multiply(time_step /2).transpose().todense(), mass_mat.transpose().todense()), axis=0)
-	temp_matrix_b1 = temp_matrix_b1.transpose()
-
-	final_matrix_A1 = np.concatenate((temp_matrix_a1, temp_matrix_b1), axis=0)
-	
-	final_matrix_A1 = sparse.csc_matrix(final_matrix_A1)
-        inv_A1_matrix = linalg.inv(final_matrix_A1)
-
-	'matrix before Un-1, A2'
-	temp_matrix_a2 = np.concatenate((mass_mat.transpose().todense(), mass_mat.multiply(time_step /2).transpose().todense()), axis=0)
-	temp_matrix_a2 = temp_matrix_a2.transpose()
-
-	temp_matrix_b2 = np.concatenate((-stiff_mat.multiply(time_step /2).transpose().todense(), mass_mat.transpose().todense()), axis=0)
-	temp_matrix_b2 = temp_matrix_b2.transpose()
-
-	final_matrix_A2 = np.concatenate((temp_matrix_a2, temp_matrix_b2), axis=0)
-	final_matrix_A2 = sparse.csc_matrix(final_matrix_A2)
-
-
-	'construct A1^{-1}A2'
-	matrix_a = inv_A1_matrix * final_matrix_A2
-	n = load_vec.shape[0]
-	
-	'construct A1^{-1}b'
-	vector_b = inv_A1_matrix * load_vec
-        
-	dPde = DPdeAutomaton()
+        # construct A1^{-1}A2 and A1^{-1}b
+        matrix_a = FactorizedOperator(solver_A1, final_matrix_A2)
+        vector_b = inv_A1_matrix * load_vec
+
+        dPde = DPdeAutomaton()
         dPde.set_matrix_a(matrix_a)
         dPde.set_vector_b(vector_b)
         dPde.set_inv_b_matrix(inv_A1_matrix)
+        dPde.set_mass_solver(solver_A1.mass_solver)
         dPde.set_fxdom(x_dom)
         dPde.set_init_condition(init_vector)
-        dPde.set_xlist_time_step_w(x, time_step)
+        dPde.set_xlist_time_step_w(mesh, time_step)
 
         return dPde
 
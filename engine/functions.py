@@ -3,14 +3,17 @@ This module implements some basic functions used for reachable set computation a
 Dung Tran: Nov/2017
 '''
 
-from sympy import Piecewise, And, Function, lambdify, integrate, exp, sin, Mul
-from sympy.abc import x, t, alpha, beta
-from scipy.optimize import minimize
+from engine.cache import LRUCache
+from engine.source import FunctionRegistry
+import numpy as np
 
 
 class Functions(object):
     'implements related functions for interplation'
 
+    # sympy is imported inside the methods that build expressions, so that importing
+    # this module (and the engine) does not pay for it, see examples/import_time.py
+
     @staticmethod
     def phi(seg_x):
         'define hat function phi_i(x) used in interpolation'
@@ -31,130 +34,137 @@ class Functions(object):
                                                        1], 'invalid segment'
 
         if seg_x[0] == seg_x[1]:
-            hj = seg_x[2] - seg_x[1]
-            func = Piecewise((0, x <= seg_x[0]), (0, x > seg_x[2]), ((
-                seg_x[2] - x) / hj, And(seg_x[1] < x, x <= seg_x[2])))
+            name = 'phi_left_boundary'
         elif seg_x[1] == seg_x[2]:
-            hj = seg_x[1] - seg_x[0]
-            func = Piecewise((0, x <= seg_x[0]), (0, x > seg_x[1]), ((
-                x - seg_x[0]) / hj, And(seg_x[0] < x, x <= seg_x[1])))
-
-        elif seg_x[0] < seg_x[1] < seg_x[2]:
-            hj = seg_x[1] - seg_x[0]
-            hj_plus_1 = seg_x[2] - seg_x[1]
-            func = Piecewise((0,
-                              x <= seg_x[0]),
-                             ((x - seg_x[0]) / hj,
-                              And(seg_x[0] < x,
-                                  x <= seg_x[1])),
-                             ((seg_x[2] - x) / hj_plus_1,
-                              And(seg_x[1] < x,
-                                  x <= seg_x[2])),
-                             (0, x > seg_x[2]))
-
-        return func, lambdify(x, func)
+            name = 'phi_right_boundary'
+        else:
+            name = 'phi'
 
-    @staticmethod
-    def input_func():
-        'define the input function f(x,t)'
+        func, _ = Functions.get_phi_expr(name, seg_x[0], seg_x[1], seg_x[2])
+        kernel = CompiledKernels.get(name)
 
-        # can be general function with x and t variables
-        func = Function('func')
-        func = exp(-x) * exp(-t)    # you can change f(x,t) function here
-        return func, lambdify((x, t), func)
+        return func, lambda xv: kernel(xv, seg_x[0], seg_x[1], seg_x[2])
 
     @staticmethod
-    def input_func_mul_phi(seg_x):
-        'define the multiplication of input function f(x,t) and hat function phi(x)'
-
-        func = Function('func')
-        f, _ = Functions.input_func()
-        phi, _ = Functions.phi(seg_x)
-        func = f * phi
-        return func, lambdify((x, t), func)
+    def get_phi_expr(name, x0, x1, x2):
+        'Piecewise expression of the hat function on the segment [x0, x1, x2]'
+
+        from sympy import Piecewise, And
+        from sympy.abc import x
+
+        # x0, x1, x2 can be numbers or sympy symbols
+        if name == 'phi_left_boundary':
+            hj = x2 - x1
+            func = Piecewise((0, x <= x0), (0, x > x2), ((x2 - x) / hj, And(x1 < x, x <= x2)))
+        elif name == 'phi_right_boundary':
+            hj = x1 - x0
+            func = Piecewise((0, x <= x0), (0, x > x1), ((x - x0) / hj, And(x0 < x, x <= x1)))
+        else:
+            hj = x1 - x0
+            hj_plus_1 = x2 - x1
+            func = Piecewise((0, x <= x0),
+                             ((x - x0) / hj, And(x0 < x, x <= x1)),
+                             ((x2 - x) / hj_plus_1, And(x1 < x, x <= x2)),
+                             (0, x > x2))
+
+        return func, hj
 
     @staticmethod
-    def integrate_input_func_mul_phi_in_space(seg_x, x_dom, ti):
-        'integration of f(x,t) * phi function along x at time = ti'
+    def input_func(source_func=None):
+        'return the input function f(x,t) as (symbolic expression, vectorized numpy function)'
 
-        # x_dom is the domain of f function
-        assert isinstance(x_dom, list)
-        assert len(x_dom) == 2, 'invalid x_range or t_range inputs'
-        assert 0 <= x_dom[0] < x_dom[1], 'invalid domains'
+        # the input function is registered in engine.source.FunctionRegistry, use
+        # FunctionRegistry.register() and FunctionRegistry.set_input_func() to change f(x,t)
+        if source_func is None:
+            source_func = FunctionRegistry.get_input_func()
 
-        func, _ = Functions.input_func_mul_phi(seg_x)
-	intg = integrate(func, (x, x_dom[0], x_dom[1]))	
-	lmbf = lambdify(t, intg)
+        return source_func.get_sym_expr(), source_func.func
 
-        return lmbf(ti)	#evaluate the function at ti
+    @staticmethod
+    def input_func_mul_phi(seg_x, source_func=None):
+        'define the multiplication of input function f(x,t) and hat function phi(x)'
+
+        f, f_eval = Functions.input_func(source_func)
+        phi, phi_eval = Functions.phi(seg_x)
+        func = f * phi
+        return func, lambda xv, tv: f_eval(xv, tv) * phi_eval(xv)
 
     @staticmethod
-    def integrate_input_func_mul_phi_in_space(seg_x, x_dom, ti):
+    def integrate_input_func_mul_phi_in_space(seg_x, x_dom, ti, source_func=None):
         'integration of f(x,t) * phi function along x at time = ti'
 
+        from sympy import integrate
+        from sympy.abc import x, t
+
         # x_dom is the domain of f function
         assert isinstance(x_dom, list)
         assert len(x_dom) == 2, 'invalid x_range or t_range inputs'
         assert 0 <= x_dom[0] < x_dom[1], 'invalid domains'
 
-        func, _ = Functions.input_func_mul_phi(seg_x)
-	intg = integrate(func, (x, x_dom[0], x_dom[1]))	
-	lmbf = lambdify(t, intg)
-
-        return lmbf(ti)	#evaluate the function at ti
+        func, _ = Functions.input_func_mul_phi(seg_x, source_func)
+        intg = integrate(func.subs(t, ti), (x, x_dom[0], x_dom[1]))
 
+        return intg    # value of the integral at ti
 
     @staticmethod
-    def integrate_input_func_mul_phi(seg_x, x_dom, t_dom):
+    def integrate_input_func_mul_phi(seg_x, x_dom, t_dom, source_func=None):
         'integration of f(x,t) * phi function along x and t'
 
+        from sympy import integrate
+        from sympy.abc import x, t
+
         # x_dom is the domain of f function, t_dom is time domain of the integration
         assert isinstance(x_dom, list)
         assert isinstance(t_dom, list)
         assert len(x_dom) == len(t_dom) == 2, 'invalid x_range or t_range inputs'
         assert 0 <= x_dom[0] < x_dom[1] and 0 <= t_dom[0] < t_dom[1], 'invalid domains'
-        func, _ = Functions.input_func_mul_phi(seg_x)
+        func, _ = Functions.input_func_mul_phi(seg_x, source_func)
         intg = integrate(func, (x, x_dom[0], x_dom[1]), (t, t_dom[0], t_dom[1]))
 
         return intg
 
-
     @staticmethod
-    def init_func():
-        'define initial condition function u0(x) = sin(x)'
+    def init_func(source_func=None):
+        'return the initial condition function u0(x) as (symbolic expression, vectorized numpy function)'
 
-        # can be general function with variable x
-        func = Function('func')
-        func = sin(x)    # you can change u0(x) function here
-        return func, lambdify(x, func)
+        # the default u0(x) = sin(x) is registered in engine.source.FunctionRegistry, use
+        # FunctionRegistry.register() and FunctionRegistry.set_init_func() to change it
+        if source_func is None:
+            source_func = FunctionRegistry.get_init_func()
+
+        return source_func.get_sym_expr(), source_func.func
 
     @staticmethod
     def Si_n_func(step, t_n_minus_1):
         'Si[n](t) function at time step t = tn,  used in interpolation in time'
 
+        from sympy.abc import t
+
         assert step > 0, 'invalid time_step'
         assert isinstance(step, float)
         assert isinstance(t_n_minus_1, float)
         assert t_n_minus_1 >= 0
 
-        func = Function('func')
         func = (t - t_n_minus_1) / step
+        kernel = CompiledKernels.get('Si_n')
 
-        return func, lambdify(t, func)
+        return func, lambda tv: kernel(tv, step, t_n_minus_1)
 
     @staticmethod
     def Si_n_minus_1_func(step, t_n):
         'Si[n - 1] (t) function at time step tn = n, used in interpolation in time'
 
+        from sympy.abc import t
+
         assert step > 0, 'invalid time_step'
         assert isinstance(step, float)
         assert isinstance(t_n, float)
         assert t_n >= 0
 
-        func = Function('func')
         func = (t_n - t) / step
+        kernel = CompiledKernels.get('Si_n_minus_1')
 
-        return func, lambdify(t, func)
+        return func, lambda tv: kernel(tv, step, t_n)
 
     @staticmethod
     def intpl_inspace_func(a, b, c, d):
@@ -166,13 +176,26 @@ class Functions(object):
         assert isinstance(b, float)
         assert isinstance(c, float)
         assert isinstance(d, float)
-        func = Function('func')
-        func = (a * alpha + b * beta) * x + c * alpha + d * beta
-        func_eval = lambdify((x, alpha, beta), func)
+        func_eval = CompiledKernels.get('intpl_inspace')
 
         def my_func(y):
             'convert to python numpy multivariable function'
-            return func_eval(*tuple(y))
+            return func_eval(y[0], y[1], y[2], a, b, c, d)
+
+        return my_func
+
+    @staticmethod
+    def intpl_inspace_func_vec(a_vec, b_vec, c_vec, d_vec):
+        'Un(x) functions of all segments, evaluated in one numpy broadcast'
+
+        # the returned function takes x, alpha, beta arrays that broadcast against the coefficients
+        assert isinstance(a_vec, np.ndarray)
+        assert a_vec.shape == b_vec.shape == c_vec.shape == d_vec.shape, 'inconsistent coefficients'
+        func_eval = CompiledKernels.get('intpl_inspace')
+
+        def my_func(x_value, alpha_value, beta_value):
+            'evaluate Un(x) of every segment'
+            return func_eval(x_value, alpha_value, beta_value, a_vec, b_vec, c_vec, d_vec)
 
         return my_func
 
@@ -197,17 +220,30 @@ class Functions(object):
         assert isinstance(delta_gamma_c, float)
         assert isinstance(delta_gamma_d, float)
 
-        func = Function('func')
-        func = (1 / step) * (delta_a * alpha + delta_b * beta) * t * x + \
-            (delta_gamma_a * alpha + delta_gamma_b * beta) * x + \
-            (1/ step) * (delta_c * alpha + delta_b * beta) * t + \
-            delta_gamma_c * alpha + delta_gamma_d * beta
-
-        func_eval = lambdify((t, x, alpha, beta), func)
+        func_eval = CompiledKernels.get('intpl_in_time_and_space')
 
         def my_func(y):
             'convert to python numpy multivariable function'
-            return func_eval(*tuple(y))
+            return func_eval(y[0], y[1], y[2], y[3], step, delta_a, delta_b, delta_gamma_a,
+                             delta_gamma_b, delta_c, delta_d, delta_gamma_c, delta_gamma_d)
+
+        return my_func
+
+    @staticmethod
+    def intpl_in_time_and_space_func_vec(
+            step, delta_a_vec, delta_b_vec, delta_gamma_a_vec, delta_gamma_b_vec,
+            delta_c_vec, delta_d_vec, delta_gamma_c_vec, delta_gamma_d_vec):
+        'U(x,t) functions of all segments, evaluated in one numpy broadcast'
+
+        assert isinstance(step, float) and step > 0, 'invalid time step'
+        assert isinstance(delta_a_vec, np.ndarray)
+        func_eval = CompiledKernels.get('intpl_in_time_and_space')
+
+        def my_func(t_value, x_value, alpha_value, beta_value):
+            'evaluate U(x,t) of every segment'
+            return func_eval(t_value, x_value, alpha_value, beta_value, step, delta_a_vec, delta_b_vec,
+                             delta_gamma_a_vec, delta_gamma_b_vec, delta_c_vec, delta_d_vec,
+                             delta_gamma_c_vec, delta_gamma_d_vec)
 
         return my_func
 
@@ -230,17 +266,12 @@ class Functions(object):
         assert isinstance(delta_gamma_c, float)
         assert isinstance(delta_gamma_d, float)
 
-        func = Function('func')
-        func = (1 / step) * (delta_a * alpha_value + delta_b * beta_value) * t * x_value + \
-            (delta_gamma_a * alpha_value + delta_gamma_b * beta_value) * x_value + \
-            (1/ step) * (delta_c * alpha_value + delta_b * beta_value) * t + \
-            delta_gamma_c * alpha_value + delta_gamma_d * beta_value
-
-        func_eval = lambdify((t), func)
+        func_eval = CompiledKernels.get('intpl_in_time_and_space')
 
         def my_func(y):
             'convert to python numpy function'
-            return func_eval(*tuple(y))
+            return func_eval(y[0], x_value, alpha_value, beta_value, step, delta_a, delta_b, delta_gamma_a,
+                             delta_gamma_b, delta_c, delta_d, delta_gamma_c, delta_gamma_d)
 
         return my_func
 
@@ -252,18 +283,78 @@ class Functions(object):
         assert isinstance(V_n_i, float)
         assert isinstance(l_n_i, float)
 
-        func = Function('func')
-        func = alpha * V_n_i + beta * l_n_i
-        func_eval = lambdify((alpha, beta), func)
+        func_eval = CompiledKernels.get('U_n_i')
 
         def my_func(y):
-            return func_eval(*tuple(y))
+            return func_eval(y[0], y[1], V_n_i, l_n_i)
 
         return my_func
 
 
+class CompiledKernels(object):
+    'expression templates of Functions, each one is lambdified once and kept in a bounded LRU cache'
+
+    # the coefficients of a template are symbols, so one compiled kernel serves every mesh
+    # segment and time step: they are passed as float or numpy array arguments at call time
+
+    _cache = LRUCache(32)
+
+    @staticmethod
+    def get_template(name):
+        'return (arguments, expression) of the template name'
+
+        from sympy import symbols
+        from sympy.abc import x, t, alpha, beta
+
+        if name == 'intpl_inspace':
+            a, b, c, d = symbols('a b c d')
+            args = (x, alpha, beta, a, b, c, d)
+            expr = (a * alpha + b * beta) * x + c * alpha + d * beta
+        elif name == 'intpl_in_time_and_space':
+            k, da, db, dga, dgb, dc, dd, dgc, dgd = symbols('k da db dga dgb dc dd dgc dgd')
+            args = (t, x, alpha, beta, k, da, db, dga, dgb, dc, dd, dgc, dgd)
+            expr = (1 / k) * (da * alpha + db * beta) * t * x + (dga * alpha + dgb * beta) * x + \
+                (1 / k) * (dc * alpha + dd * beta) * t + dgc * alpha + dgd * beta
+        elif name == 'U_n_i':
+            v, l = symbols('v l')
+            args = (alpha, beta, v, l)
+            expr = alpha * v + beta * l
+        elif name == 'Si_n':
+            k, t0 = symbols('k t0')
+            args = (t, k, t0)
+            expr = (t - t0) / k
+        elif name == 'Si_n_minus_1':
+            k, t1 = symbols('k t1')
+            args = (t, k, t1)
+            expr = (t1 - t) / k
+        elif name in ['phi', 'phi_left_boundary', 'phi_right_boundary']:
+            x0, x1, x2 = symbols('x0 x1 x2')
+            args = (x, x0, x1, x2)
+            expr, _ = Functions.get_phi_expr(name, x0, x1, x2)
+        else:
+            raise ValueError('unknown kernel template: {}'.format(name))
+
+        return args, expr
+
+    @staticmethod
+    def get(name):
+        'return the compiled kernel of the template name'
+
+        def build():
+            'lambdify the template'
+            from sympy import lambdify
+            args, expr = CompiledKernels.get_template(name)
+            return lambdify(args, expr, modules='numpy')
+
+        return CompiledKernels._cache.get_or_build(name, build)
+
+
 if __name__ == '__main__':
 
+    from scipy.optimize import minimize
+    from sympy import integrate
+    from sympy.abc import x, t
+
     ################################################################
     a1 = 0.1
     b1 = 0.2
@@ -6,12 +6,10 @@ Tianshu Bao: Jun/2018
 #add changes
 
 import numpy as np
-from engine.functions import Functions,lambdify
-from scipy.optimize import minimize
+from engine.functions import Functions
 from engine.set import RectangleSet2D, RectangleSet3D
 from engine.set import DReachSet
-from sympy import Function
-from sympy.abc import alpha, beta
+from engine.bounds import BoundKernel
 
 class InterpolSetInSpace(object):
     'represent the set after doing interpolation in space'
@@ -53,9 +51,10 @@ class InterpolSetInSpace(object):
         self.d_vec = d_current_step_vec
         self.xlist = xlist
 
-    def get_2D_boxes(self, alpha_range, beta_range):
-        'get box contain all value of U_n(x) and min-max value of U_n(x)'
+    def get_bounds(self, alpha_range, beta_range):
+        'exact min-max values of U_n(x) on each segment, return min_vec, min_points, max_vec, max_points'
 
+        # min_points[i] = [x_min, alpha_min, beta_min], see engine.bounds.BoundKernel
         assert self.a_vec is not None and self.b_vec is not None and self.c_vec is not None and self.d_vec is not None
         assert isinstance(alpha_range, tuple)
         assert isinstance(beta_range, tuple)
@@ -63,58 +62,16 @@ class InterpolSetInSpace(object):
         assert alpha_range[0] <= alpha_range[1]
         assert beta_range[0] <= beta_range[1]
 
-        n = self.a_vec.shape[0]
+        return BoundKernel.get_inspace_bounds(self.a_vec, self.b_vec, self.c_vec, self.d_vec, self.xlist,
+                                              alpha_range, beta_range)
 
-        a_vec = self.a_vec
-        b_vec = self.b_vec
-        c_vec = self.c_vec
-        d_vec = self.d_vec
+    def get_2D_boxes(self, alpha_range, beta_range):
+        'get box contain all value of U_n(x) and min-max value of U_n(x)'
 
-        # minimum value of Un(x) at each segment
-        min_vec = np.zeros((n,), dtype=float)
-        # minimum points [x_min, alpha_min, beta_min]
-        min_points = np.zeros((n, 3), dtype=float)
-        # maximum value of Un(x) at each segment
-        max_vec = np.zeros((n,), dtype=float)
-        # maximum points [x_max, alpha_max, beta_max]
-        max_points = np.zeros((n, 3), dtype=float)
+        min_vec, _, max_vec, _ = self.get_bounds(alpha_range, beta_range)
 
         boxes_2D_list = []
-
-        for i in xrange(0, n):
-            min_func = Functions.intpl_inspace_func(
-                a_vec[i], b_vec[i], c_vec[i], d_vec[i])
-            max_func = Functions.intpl_inspace_func(
-                -a_vec[i], -b_vec[i], -c_vec[i], -d_vec[i])
-            xbounds = (self.xlist[i], self.xlist[i + 1])
-            x0 = [self.xlist[i], alpha_range[0], beta_range[0]]
-            bnds = (xbounds, alpha_range, beta_range)
-
-            min_res = minimize(
-                min_func,
-                x0,
-                method='L-BFGS-B',
-                bounds=bnds,
-                tol=1e-10, options={'disp': False})
-            max_res = minimize(
-                max_func,
-                x0,
-                method='L-BFGS-B',
-                bounds=bnds,
-                tol=1e-10, options={'disp': False})
-
-            if min_res.status == 0:
-                min_vec[i] = min_res.fun
-                min_points[i, :] = min_res.x
-            else:
-                raise ValueError('min-optimization fail')
-
-            if max_res.status == 0:
-                max_vec[i] = -max_res.fun
-                max_points[i, :] = max_res.x
-            else:
-                raise ValueError('max-optimization fail')
-
+        for i in xrange(0, min_vec.shape[0]):
             box_2D = RectangleSet2D()
             box_2D.set_bounds(
                 self.xlist[i], self.xlist[i + 1], min_vec[i], max_vec[i])
@@ -195,112 +152,53 @@ class InterpolationSet(object):
 	self.d_reach_prev = d_reach_prev
 	self.d_reach_curr = d_reach_curr
 
-    def get_3D_boxes(self, alpha_range, beta_range):
-        'find minimum and maximum values of interpolation set U(x, t) and 3D boxes contain all U(x,t)'
+    def get_corner_bounds(self, alpha_range, beta_range):
+        'min-max values of the reach set at the corners of every cell [x[j], x[j + 1]] x [t[n-1], t[n]]'
+
+        # return min_corners, max_corners of shape (m, 4), the columns are the corners (x[j], t[n-1]),
+        # (x[j + 1], t[n-1]), (x[j], t[n]), (x[j + 1], t[n]). The values at the boundary nodes are zero.
+        assert self.d_reach_prev is not None and self.d_reach_curr is not None, 'empty interpolation set'
 
+        m = self.delta_a_vec.shape[0]    # number of cells
+        min_corners = np.zeros((m, 4), dtype=float)
+        max_corners = np.zeros((m, 4), dtype=float)
+
+        for k, d_reach in enumerate([self.d_reach_prev, self.d_reach_curr]):
+            node_min, _, node_max, _ = BoundKernel.get_affine_bounds(
+                d_reach.Vn[0:m - 1].toarray(), d_reach.ln[0:m - 1].toarray(), alpha_range, beta_range)
+            min_nodes = np.concatenate(([0.0], node_min, [0.0]))
+            max_nodes = np.concatenate(([0.0], node_max, [0.0]))
+            min_corners[:, 2 * k] = min_nodes[0:-1]
+            min_corners[:, 2 * k + 1] = min_nodes[1:]
+            max_corners[:, 2 * k] = max_nodes[0:-1]
+            max_corners[:, 2 * k + 1] = max_nodes[1:]
+
+        return min_corners, max_corners
+
+    def get_bounds(self, alpha_range, beta_range):
+        'exact minimum and maximum values of U(x, t) on every cell, as two arrays'
+
+        # U(x, t) is multilinear in (t, x, alpha, beta), its extreme values on a cell are reached at
+        # the corners of the cell and of the perturbation box
         assert self.delta_a_vec is not None, 'empty interpolation set'
         assert isinstance(alpha_range, tuple) and len(
             alpha_range) == 2 and alpha_range[0] <= alpha_range[1], 'invalid alpha_range'
         assert isinstance(beta_range, tuple) and len(
             beta_range) == 2 and beta_range[0] <= beta_range[1], 'invalid beta_range'
 
-        m = self.delta_a_vec.shape[0]		#number of mesh points
+        min_corners, max_corners = self.get_corner_bounds(alpha_range, beta_range)
 
-        min_vec = np.zeros((m,), dtype=float)
-        max_vec = np.zeros((m,), dtype=float)
-        min_points = []
-        max_points = []
-        boxes_3D_list = []
+        return np.min(min_corners, axis=1), np.max(max_corners, axis=1)
 
-        for j in xrange(0, m):
-            min_func = Functions.intpl_in_time_and_space_func(
-                self.step,
-                self.delta_a_vec[j],
-                self.delta_b_vec[j],
-                self.delta_gamma_a_vec[j],
-                self.delta_gamma_b_vec[j],
-                self.delta_c_vec[j],
-                self.delta_d_vec[j], 
-                self.delta_gamma_c_vec[j],
-                self.delta_gamma_d_vec[j])
-            max_func = Functions.intpl_in_time_and_space_func(self.step, -
-                                                              self.delta_a_vec[j], -
-                                                              self.delta_b_vec[j], -
-                                                              self.delta_gamma_a_vec[j], -
-                                                              self.delta_gamma_b_vec[j], -
-                                                              self.delta_c_vec[j], -
-                                                              self.delta_d_vec[j], -
-                                                              self.delta_gamma_c_vec[j], -
-                                                              self.delta_gamma_d_vec[j])
-
-            x0 = [
-                (self.cur_time_step - 1) * self.step,
-                self.xlist[j],
-                alpha_range[0],
-                beta_range[0]]
-            t_bnd = (
-                (self.cur_time_step - 1) * self.step,
-                self.cur_time_step * self.step)
-            x_bnd = (self.xlist[j], self.xlist[j + 1])
-            bnds = (t_bnd, x_bnd, alpha_range, beta_range)
-            min_res = minimize(
-                min_func,
-                x0,
-                method='L-BFGS-B',
-                bounds=bnds,
-                tol=1e-10, options={'disp': False})    # add options={'disp': True} to display optimization result
-            max_res = minimize(
-                max_func,
-                x0,
-                method='L-BFGS-B',
-                bounds=bnds,
-                tol=1e-10, options={'disp': False})    # add  options={'disp': True} to display optimization result
-
-            if min_res.status == 0:
-                min_vec[j] = min_res.fun
-                min_points.append(min_res.x)
-            else:
-                print "\nmin_res.status = {}".format(min_res.status)
-                print "\nminimization message: {}".format(min_res.message)
-                raise ValueError(
-                    'minimization for interpolation function fail!')
-
-            if max_res.status == 0:
-                max_vec[j] = -max_res.fun
-                max_points.append(max_res.x)
-            else:
-                print "\nmax_res.status = {}".format(max_res.status)
-                print "\nmaximization message: {}".format(max_res.message)
-                raise ValueError(
-                    'maximization for interpolation function fail!')
-
-            ymin = (self.cur_time_step - 1) * self.step
-            ymax = (self.cur_time_step) * self.step
-
-	    if j == 0:	
-		temp1, temp2 = 0, 0
-		temp3, temp4 = self.get_min_max(alpha_range, beta_range, self.d_reach_prev.Vn[j].todense(), self.d_reach_prev.ln[j].todense())
-		temp5, temp6 = 0, 0
-		temp7, temp8 = self.get_min_max(alpha_range, beta_range, self.d_reach_curr.Vn[j].todense(), self.d_reach_curr.ln[j].todense())
-	    elif 0 < j < m - 1:
-		temp1, temp2 = self.get_min_max(alpha_range, beta_range, self.d_reach_prev.Vn[j - 1].todense(), self.d_reach_prev.ln[j - 1].todense())
-		temp3, temp4 = self.get_min_max(alpha_range, beta_range, self.d_reach_prev.Vn[j].todense(), self.d_reach_prev.ln[j].todense())
-		temp5, temp6 = self.get_min_max(alpha_range, beta_range, self.d_reach_curr.Vn[j - 1].todense(), self.d_reach_curr.ln[j - 1].todense())
-		temp7, temp8 = self.get_min_max(alpha_range, beta_range, self.d_reach_curr.Vn[j].todense(), self.d_reach_curr.ln[j].todense())
-	    elif j == m - 1:
-		temp1, temp2 = self.get_min_max(alpha_range, beta_range, self.d_reach_prev.Vn[j - 1].todense(), self.d_reach_prev.ln[j - 1].todense())
-		temp3, temp4 = 0, 0
-		temp5, temp6 = self.get_min_max(alpha_range, beta_range, self.d_reach_curr.Vn[j - 1].todense(), self.d_reach_curr.ln[j - 1].todense())
-		temp7, temp8 = 0, 0
-
-
-	    temp = [temp1, temp2, temp3, temp4, temp5, temp6, temp7, temp8]
-	    temp.sort()
-	    min_vec[j] = temp[0]
-	    print "\n min is {}".format(min_vec[j])
-	    max_vec[j] = temp[7]
-	    print "\n max is {}".format(max_vec[j])
+    def get_3D_boxes(self, alpha_range, beta_range):
+        'find minimum and maximum values of interpolation set U(x, t) and 3D boxes contain all U(x,t)'
+
+        min_vec, max_vec = self.get_bounds(alpha_range, beta_range)
+        ymin = (self.cur_time_step - 1) * self.step
+        ymax = self.cur_time_step * self.step
 
+        boxes_3D_list = []
+        for j in xrange(0, min_vec.shape[0]):
             box_3D = RectangleSet3D()
             box_3D.set_bounds(self.xlist[j],
                               self.xlist[j + 1],
@@ -313,58 +211,11 @@ class InterpolationSet(object):
         return boxes_3D_list
 
     def get_min_max(self, alpha_range, beta_range, v, l):
+        'minimum and maximum values of alpha * v + beta * l over the perturbation ranges'
 
-	    x0 = [
-                alpha_range[0],
-                beta_range[0]]
-            bnds = (alpha_range, beta_range)
-	    fun_min = Function('fun_min')
-            fun_min = alpha * v + beta * l
-            fun_min_eval = lambdify((alpha, beta), fun_min)
-	    fun_max = Function('fun_max')
-            fun_max = - alpha * v - beta * l
-            func_max_eval = lambdify((alpha, beta), fun_max)
-
-            def my_func_1(y):
-        	'convert to python numpy multivariable function'
-        	return fun_min_eval(*tuple(y))
-            def my_func_2(y):
-        	'convert to python numpy multivariable function'
-        	return func_max_eval(*tuple(y))
-	    
-            min_res = minimize(
-                my_func_1,
-                x0,
-                method='L-BFGS-B',
-                bounds=bnds,
-                tol=1e-10, options={'disp': False})    # add options={'disp': True} to display optimization result	
-
-            max_res = minimize(
-                my_func_2,
-                x0,
-                method='L-BFGS-B',
-                bounds=bnds,
-                tol=1e-10, options={'disp': False})    # add  options={'disp': True} to display optimization result
-
-            if min_res.status == 0:
-                min_value = min_res.fun
-            else:
-                print "\nmin_res.status = {}".format(min_res.status)
-                print "\nminimization message: {}".format(min_res.message)
-                raise ValueError(
-                    'minimization for interpolation function fail!')
-
-            if max_res.status == 0:
-                max_value = -max_res.fun
-            else:
-                print "\nmax_res.status = {}".format(max_res.status)
-                print "\nmaximization message: {}".format(max_res.message)
-                raise ValueError(
-                    'maximization for interpolation function fail!')
-
-	    return min_value, max_value
-
+        min_vec, _, max_vec, _ = BoundKernel.get_affine_bounds(float(v), float(l), alpha_range, beta_range)
 
+        return min_vec[0], max_vec[0]
 
     def get_trace_func(self, alpha_value, beta_value, x_value):
         'return a trace function for specific values of alpha and beta'
@@ -375,16 +226,17 @@ class InterpolationSet(object):
         assert isinstance(
             x_value, float) and self.xlist[0] <= x_value <= self.xlist[m - 1]
 
+        # segment j is [xlist[j], xlist[j + 1]]
         for i in xrange(1, m):
-            if self.xlist[i - 1] < x_value <= self.xlist[i]:
-                delta_a = self.delta_a_vec[i]
-                delta_b = self.delta_b_vec[i]
-                delta_c = self.delta_c_vec[i]
-                delta_d = self.delta_d_vec[i]
-                delta_gamma_a = self.delta_gamma_a_vec[i]
-                delta_gamma_b = self.delta_gamma_b_vec[i]
-                delta_gamma_c = self.delta_gamma_c_vec[i]
-                delta_gamma_d = self.delta_gamma_d_vec[i]
+            if self.xlist[i - 1] <= x_value <= self.xlist[i]:
+                delta_a = self.delta_a_vec[i - 1]
+                delta_b = self.delta_b_vec[i - 1]
+                delta_c = self.delta_c_vec[i - 1]
+                delta_d = self.delta_d_vec[i - 1]
+                delta_gamma_a = self.delta_gamma_a_vec[i - 1]
+                delta_gamma_b = self.delta_gamma_b_vec[i - 1]
+                delta_gamma_c = self.delta_gamma_c_vec[i - 1]
+                delta_gamma_d = self.delta_gamma_d_vec[i - 1]
 
                 break
 
@@ -437,8 +289,8 @@ class Interpolation(object):
             if i == 0:
                 a_n_vector[i] = Vn[i, 0] / hi
                 b_n_vector[i] = ln[i, 0] / hi
-                c_n_vector[i] = 0.0
-                d_n_vector[i] = 0.0
+                c_n_vector[i] = - Vn[i, 0] * xlist[i] / hi    # U = 0 at xlist[0]
+                d_n_vector[i] = - ln[i, 0] * xlist[i] / hi
             elif 0 < i < n - 1:
                 a_n_vector[i] = (Vn[i, 0] - Vn[i - 1, 0]) / hi
                 b_n_vector[i] = (ln[i, 0] - ln[i - 1, 0]) / hi
@@ -450,8 +302,8 @@ class Interpolation(object):
             elif i == n - 1:
                 a_n_vector[i] = - Vn[i - 1, 0] / hi
                 b_n_vector[i] = - ln[i - 1, 0] / hi
-                c_n_vector[i] = (i + 1) * Vn[i - 1, 0]
-                d_n_vector[i] = (i + 1) * ln[i - 1, 0]
+                c_n_vector[i] = Vn[i - 1, 0] * xlist[i + 1] / hi    # U = 0 at xlist[n]
+                d_n_vector[i] = ln[i - 1, 0] * xlist[i + 1] / hi
 
         interpol_inspace_set = InterpolSetInSpace()
         interpol_inspace_set.set_values(
@@ -478,21 +330,22 @@ class Interpolation(object):
             cur_time_step, int) and cur_time_step >= 1, 'invalid current_time_step'
         assert isinstance(step, float) and step > 0, 'invalid time step'
         xlist = cur_intpl_inspace_set.xlist
-        delta_a_vec = prev_intpl_inspace_set.a_vec - cur_intpl_inspace_set.a_vec
-        delta_b_vec = prev_intpl_inspace_set.b_vec - cur_intpl_inspace_set.b_vec
-        delta_gamma_a_vec = np.multiply(cur_intpl_inspace_set.a_vec, cur_time_step) - np.multiply(
-            prev_intpl_inspace_set.a_vec, cur_time_step - 1)
+        # U(t) = delta * t / k + gamma is the previous set at t[n-1] and the current one at t[n]
+        delta_a_vec = cur_intpl_inspace_set.a_vec - prev_intpl_inspace_set.a_vec
+        delta_b_vec = cur_intpl_inspace_set.b_vec - prev_intpl_inspace_set.b_vec
+        delta_gamma_a_vec = np.multiply(prev_intpl_inspace_set.a_vec, cur_time_step) - np.multiply(
+            cur_intpl_inspace_set.a_vec, cur_time_step - 1)
         delta_gamma_b_vec = np.multiply(
-            cur_intpl_inspace_set.b_vec, cur_time_step) - np.multiply(
-            prev_intpl_inspace_set.b_vec, cur_time_step - 1)
-        delta_c_vec = prev_intpl_inspace_set.c_vec - cur_intpl_inspace_set.c_vec
-        delta_d_vec = prev_intpl_inspace_set.d_vec - cur_intpl_inspace_set.d_vec
+            prev_intpl_inspace_set.b_vec, cur_time_step) - np.multiply(
+            cur_intpl_inspace_set.b_vec, cur_time_step - 1)
+        delta_c_vec = cur_intpl_inspace_set.c_vec - prev_intpl_inspace_set.c_vec
+        delta_d_vec = cur_intpl_inspace_set.d_vec - prev_intpl_inspace_set.d_vec
         delta_gamma_c_vec = np.multiply(
-            cur_intpl_inspace_set.c_vec, cur_time_step) - np.multiply(
-            prev_intpl_inspace_set.c_vec, cur_time_step - 1)
+            prev_intpl_inspace_set.c_vec, cur_time_step) - np.multiply(
+            cur_intpl_inspace_set.c_vec, cur_time_step - 1)
         delta_gamma_d_vec = np.multiply(
-            cur_intpl_inspace_set.d_vec, cur_time_step) - np.multiply(
-            prev_intpl_inspace_set.d_vec, cur_time_step - 1)
+            prev_intpl_inspace_set.d_vec, cur_time_step) - np.multiply(
+            cur_intpl_inspace_set.d_vec, cur_time_step - 1)
 
         intpl_set = InterpolationSet()
         intpl_set.set_values(
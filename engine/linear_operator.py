@@ -0,0 +1,229 @@
+'''
+This module implements the linear operators used by DPdeAutomaton and ReachSetAssembler
+
+An operator is anything that can be applied to a vector or to a block of vectors: an explicit
+sparse matrix, a factorized solve inv(B) * C (see engine.solver) or a matrix-free stencil.
+Every operator exposes shape, matvec and matmat, and "operator * vector" returns a csc_matrix
+so it can be used where the automaton used to store an explicit csc_matrix.
+'''
+
+import numpy as np
+from scipy.sparse import csc_matrix, issparse
+
+try:
+    from scipy.fft import dst
+except ImportError:    # scipy < 1.4
+    from scipy.fftpack import dst
+
+
+def to_array(vec):
+    'return a sparse or dense vector/matrix as a 2D numpy array'
+
+    if issparse(vec):
+        return vec.toarray()
+
+    vec = np.asarray(vec, dtype=float)
+    if vec.ndim == 1:
+        vec = vec.reshape(vec.shape[0], 1)
+
+    return vec
+
+
+class Operator(object):
+    'linear operator of shape (n, m) given by a function matvec_func, subclasses implement matmat instead'
+
+    def __init__(self, shape, matvec_func=None):
+
+        # matvec_func(x) returns operator * x for an array x of shape (m,)
+        assert len(shape) == 2, 'invalid shape'
+        assert matvec_func is None or callable(matvec_func), 'invalid matvec_func'
+        self.shape = shape
+        self.matvec_func = matvec_func
+
+    def matmat(self, mat):
+        'operator * mat, mat is a (m, k) numpy array, return a (n, k) numpy array'
+
+        # column by column with matvec_func, the subclasses apply the operator to all columns at once
+        assert self.matvec_func is not None, 'the operator has no matvec_func'
+        mat = np.asarray(mat, dtype=float)
+        res = np.zeros((self.shape[0], mat.shape[1]), dtype=float)
+        for j in xrange(0, mat.shape[1]):
+            res[:, j] = np.asarray(self.matvec_func(mat[:, j]), dtype=float).reshape(self.shape[0])
+
+        return res
+
+    def matvec(self, vec):
+        'operator * vec, vec is a (m,) or (m, 1) numpy array'
+
+        vec = np.asarray(vec, dtype=float)
+        res = self.matmat(vec.reshape(self.shape[1], 1))
+
+        return res.reshape(self.shape[0]) if vec.ndim == 1 else res
+
+    def __mul__(self, vec):
+        'operator * vec, vec is sparse or dense, return a csc_matrix'
+
+        return csc_matrix(self.matmat(to_array(vec)))
+
+    def todense(self):
+        'explicit matrix of the operator, only for small problems'
+
+        return np.asmatrix(self.matmat(np.eye(self.shape[1])))
+
+    def aslinearoperator(self):
+        'scipy.sparse.linalg.LinearOperator of the operator, e.g., for iterative solvers'
+
+        from scipy.sparse.linalg import LinearOperator
+        return LinearOperator(self.shape, matvec=self.matvec, matmat=self.matmat, dtype=float)
+
+    @staticmethod
+    def from_matrix(matrix):
+        'return matrix if it is an Operator, otherwise wrap the sparse or dense matrix in an ExplicitOperator'
+
+        if isinstance(matrix, Operator):
+            return matrix
+
+        return ExplicitOperator(matrix)
+
+
+class ExplicitOperator(Operator):
+    'operator given by an explicit sparse matrix'
+
+    def __init__(self, matrix):
+
+        if not issparse(matrix):
+            matrix = np.asarray(matrix, dtype=float)
+        Operator.__init__(self, matrix.shape)
+        self.matrix = csc_matrix(matrix)
+
+    def matmat(self, mat):
+        return np.asarray(self.matrix * mat)
+
+    def __mul__(self, vec):
+        return csc_matrix(self.matrix * vec)
+
+
+class FactorizedOperator(Operator):
+    'operator inv(B) * C applied as a multiplication by C and a solve with the factorization of B'
+
+    # solver is a factorization of B from engine.solver, matrix_c is an operator or a sparse
+    # matrix, if matrix_c is None the operator is inv(B). B is never inverted explicitly.
+
+    def __init__(self, solver, matrix_c=None):
+
+        if matrix_c is not None:
+            matrix_c = Operator.from_matrix(matrix_c)
+            assert matrix_c.shape[0] == solver.shape[1], 'inconsistent shapes of B and C'
+            Operator.__init__(self, (solver.shape[0], matrix_c.shape[1]))
+        else:
+            Operator.__init__(self, solver.shape)
+
+        self.solver = solver
+        self.matrix_c = matrix_c
+
+    def matmat(self, mat):
+        if self.matrix_c is not None:
+            mat = self.matrix_c.matmat(mat)
+
+        return self.solver.solve(mat)
+
+
+class SymTridiagonalOperator(Operator):
+    'matrix-free symmetric tridiagonal (three-point stencil) operator'
+
+    # y[i] = off_diag[i - 1] * x[i - 1] + diag[i] * x[i] + off_diag[i] * x[i + 1],
+    # the 1D mass and stiff matrices of Mesh1D and their linear combinations have this form
+
+    def __init__(self, off_diag, diag):
+
+        diag = np.asarray(diag, dtype=float)
+        off_diag = np.asarray(off_diag, dtype=float)
+        assert diag.ndim == 1 and off_diag.shape == (diag.shape[0] - 1,), 'inconsistent diagonals'
+        Operator.__init__(self, (diag.shape[0], diag.shape[0]))
+
+        self.diag = diag
+        self.off_diag = off_diag
+
+    def matmat(self, mat):
+        res = self.diag[:, None] * mat
+        res[0:-1] += self.off_diag[:, None] * mat[1:]
+        res[1:] += self.off_diag[:, None] * mat[0:-1]
+
+        return res
+
+    def plus(self, other, scale=1.0):
+        'return the operator self + scale * other'
+
+        assert isinstance(other, SymTridiagonalOperator) and other.shape == self.shape, 'inconsistent operators'
+
+        return SymTridiagonalOperator(self.off_diag + scale * other.off_diag, self.diag + scale * other.diag)
+
+    def get_upper_bands(self):
+        'upper band form ab[1 + i - j, j] = A[i, j], i <= j, used by scipy.linalg.cholesky_banded'
+
+        ab = np.zeros((2, self.shape[0]), dtype=float)
+        ab[0, 1:] = self.off_diag
+        ab[1, :] = self.diag
+
+        return ab
+
+    def tocsc(self):
+        'explicit sparse matrix of the operator'
+
+        from scipy.sparse import diags
+        return diags([self.off_diag, self.diag, self.off_diag], [-1, 0, 1], format='csc')
+
+    def get_sine_eigenvalues(self, rel_tol=1e-9):
+        'eigenvalues diag + 2 * off_diag * cos(k * pi / (n + 1)), k = 1, ..., n, of a Toeplitz operator'
+
+        # a symmetric tridiagonal Toeplitz matrix is diagonalized by the discrete sine transform,
+        # the diagonals are averaged to remove the rounding of the mesh points
+        n = self.shape[0]
+        diag = np.mean(self.diag)
+        off = np.mean(self.off_diag) if n > 1 else 0.0
+        scale = abs(diag) + abs(off)
+        assert np.max(np.abs(self.diag - diag)) <= rel_tol * scale and \
+          (n == 1 or np.max(np.abs(self.off_diag - off)) <= rel_tol * scale), 'the operator is not Toeplitz'
+
+        theta = np.arange(1, n + 1, dtype=float) * np.pi / (n + 1)
+
+        return diag + 2 * off * np.cos(theta)
+
+
+class SineTransformOperator(Operator):
+    'operator S * diag(eigenvalues) * inv(S), S is the discrete sine transform (DST-I)'
+
+    # the columns of S are the sine vectors sin(j * k * pi / (n + 1)), the eigenvectors of every
+    # symmetric tridiagonal Toeplitz matrix, so functions of the uniform 1D mass and stiff matrices
+    # (inv(B), inv(B) * C, ...) are diagonal in sine space. A product costs two DSTs, O(n log n),
+    # and no factorization is needed. The DST-I of length n is an FFT of length 2 * (n + 1), choose
+    # meshes where n + 1 has small prime factors (e.g. 2^p mesh elements).
+
+    def __init__(self, eigenvalues):
+
+        eigenvalues = np.asarray(eigenvalues, dtype=float)
+        assert eigenvalues.ndim == 1, 'invalid eigenvalues'
+        Operator.__init__(self, (eigenvalues.shape[0], eigenvalues.shape[0]))
+
+        self.eigenvalues = eigenvalues
+
+    @staticmethod
+    def transform(mat):
+        'sine coefficients of the columns of mat'
+
+        return dst(np.asarray(mat, dtype=float), type=1, axis=0)
+
+    @staticmethod
+    def inverse_transform(mat):
+        'columns with the sine coefficients mat, DST-I is its own inverse up to 2 * (n + 1)'
+
+        return dst(np.asarray(mat, dtype=float), type=1, axis=0) / (2.0 * (mat.shape[0] + 1))
+
+    def matmat(self, mat):
+        return SineTransformOperator.inverse_transform(
+            self.eigenvalues[:, None] * SineTransformOperator.transform(mat))
+
+    def power(self, num_steps):
+        'the operator to the power num_steps, e.g. num_steps time steps of A at once'
+
+        return SineTransformOperator(np.power(self.eigenvalues, num_steps))
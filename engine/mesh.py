@@ -6,8 +6,165 @@ Main references:
     1) iFEM: AN INNOVATIVE FINITE ELEMENT METHOD PACKAGE IN MATLAB, LONG CHEN, 2009
 '''
 
+import hashlib
 import numpy as np
-from scipy.sparse import csc_matrix, find
+from scipy.sparse import csc_matrix, coo_matrix, find
+from engine.linear_operator import SymTridiagonalOperator, ExplicitOperator
+
+
+class Mesh1D(object):
+    'one dimensional mesh, validated once when it is built'
+
+    # mesh points x[0] < x[1] < ... < x[m - 1] are the vertices of the m - 1 elements. With linear elements
+    # (order = 1) the nodes are the vertices, with quadratic elements (order = 2) the midpoint of each
+    # element is a node too. The interior nodes are the unknowns of the FEM.
+    # The element lengths, the hash of the points and the assembled matrices are cached on the object.
+
+    def __init__(self, points, order=1):
+
+        points = np.array(points, dtype=float)
+        assert points.ndim == 1, 'error: mesh points should be a one dimensional array'
+        assert points.shape[0] > 3, 'error: len(x) should > 3'
+        assert order in [1, 2], 'error: only linear (order = 1) and quadratic (order = 2) elements are supported'
+
+        h = np.diff(points)
+        if not np.all(h > 0):
+            i = int(np.argmax(h <= 0))
+            raise ValueError('x[{}] = {} should be > x[{}] = {}'.format(i + 1, points[i + 1], i, points[i]))
+
+        self.points = points    # mesh points
+        self.points.flags.writeable = False
+        self.h = h    # element lengths, h[i] = x[i + 1] - x[i]
+        self.order = order
+        self.num_points = points.shape[0]
+        self.num_dofs = order * (points.shape[0] - 1) - 1    # number of interior nodes
+
+        if order == 1:
+            self.nodes = points
+        else:
+            self.nodes = np.zeros((2 * points.shape[0] - 1,), dtype=float)
+            self.nodes[0::2] = points
+            self.nodes[1::2] = (points[0:-1] + points[1:]) / 2
+            self.nodes.flags.writeable = False
+
+        self._xlist = None
+        self._hash = None
+        self._mass_matrix = None
+        self._stiff_matrix = None
+        self._mass_stencil = None
+        self._stiff_stencil = None
+
+    @staticmethod
+    def from_points(x, order=None):
+        'return x if it is a Mesh1D, otherwise build a Mesh1D from the list or array x'
+
+        if isinstance(x, Mesh1D):
+            assert order is None or order == x.order, 'inconsistent element order'
+            return x
+
+        return Mesh1D(x, 1 if order is None else order)
+
+    def tolist(self):
+        'nodes (mesh points, and the midpoints for quadratic elements) as a list of floats'
+
+        if self._xlist is None:
+            self._xlist = self.nodes.tolist()
+
+        return self._xlist
+
+    def get_hash(self):
+        'content hash of the mesh points and the element order'
+
+        if self._hash is None:
+            if self.order == 1:
+                self._hash = hashlib.sha1(self.points.tostring()).hexdigest()
+            else:
+                self._hash = hashlib.sha1(self.points.tostring() + 'P{}'.format(self.order)).hexdigest()
+
+        return self._hash
+
+    def is_uniform(self, rel_tol=1e-9):
+        'True if all elements have the same length, up to the rounding of np.linspace'
+
+        return bool(np.max(np.abs(self.h - self.h[0])) <= rel_tol * self.h[0])
+
+    def get_mass_stencil(self):
+        'matrix-free tridiagonal mass operator of the hat functions of the interior points'
+
+        # M[i, i] = (h[i] + h[i + 1]) / 3, M[i, i + 1] = M[i + 1, i] = h[i + 1] / 6
+        assert self.order == 1, 'stencils are only available for linear elements'
+        if self._mass_stencil is None:
+            h = self.h
+            self._mass_stencil = SymTridiagonalOperator(h[1:-1] / 6, (h[0:-1] + h[1:]) / 3)
+
+        return self._mass_stencil
+
+    def get_stiff_stencil(self):
+        'matrix-free tridiagonal stiff operator of the hat functions of the interior points'
+
+        # K[i, i] = 1 / h[i] + 1 / h[i + 1], K[i, i + 1] = K[i + 1, i] = -1 / h[i + 1]
+        assert self.order == 1, 'stencils are only available for linear elements'
+        if self._stiff_stencil is None:
+            inv_h = 1.0 / self.h
+            self._stiff_stencil = SymTridiagonalOperator(-inv_h[1:-1], inv_h[0:-1] + inv_h[1:])
+
+        return self._stiff_stencil
+
+    def assemble_quadratic(self, element_matrix, scale):
+        'assemble the matrix of quadratic elements, element e has the matrix scale[e] * element_matrix'
+
+        # the local nodes (left, mid, right) of element e are the interior nodes 2e - 1, 2e, 2e + 1,
+        # entries of the two boundary nodes (-1 and 2 * (m - 1) - 1) are dropped
+        num_elements = self.h.shape[0]
+        local_nodes = 2 * np.arange(0, num_elements)[:, None] + np.arange(-1, 2)[None, :]
+        rows = np.repeat(local_nodes, 3, axis=1).ravel()
+        cols = np.tile(local_nodes, (1, 3)).ravel()
+        data = (scale[:, None] * element_matrix.ravel()[None, :]).ravel()
+
+        n = self.num_dofs
+        inside = (rows >= 0) & (rows < n) & (cols >= 0) & (cols < n)
+
+        return csc_matrix(coo_matrix((data[inside], (rows[inside], cols[inside])), shape=(n, n)))
+
+    def get_mass_matrix(self):
+        'mass matrix of the interior nodes, tridiagonal for linear and pentadiagonal for quadratic elements'
+
+        if self._mass_matrix is None:
+            if self.order == 1:
+                self._mass_matrix = self.get_mass_stencil().tocsc()
+            else:
+                element_mass = np.array([[4.0, 2.0, -1.0], [2.0, 16.0, 2.0], [-1.0, 2.0, 4.0]]) / 30
+                self._mass_matrix = self.assemble_quadratic(element_mass, self.h)
+
+        return self._mass_matrix
+
+    def get_stiff_matrix(self):
+        'stiff matrix of the interior nodes, tridiagonal for linear and pentadiagonal for quadratic elements'
+
+        if self._stiff_matrix is None:
+            if self.order == 1:
+                self._stiff_matrix = self.get_stiff_stencil().tocsc()
+            else:
+                element_stiff = np.array([[7.0, -8.0, 1.0], [-8.0, 16.0, -8.0], [1.0, -8.0, 7.0]]) / 3
+                self._stiff_matrix = self.assemble_quadratic(element_stiff, 1.0 / self.h)
+
+        return self._stiff_matrix
+
+    def get_mass_operator(self):
+        'mass operator, a matrix-free stencil for linear elements'
+
+        if self.order == 1:
+            return self.get_mass_stencil()
+
+        return ExplicitOperator(self.get_mass_matrix())
+
+    def get_stiff_operator(self):
+        'stiff operator, a matrix-free stencil for linear elements'
+
+        if self.order == 1:
+            return self.get_stiff_stencil()
+
+        return ExplicitOperator(self.get_stiff_matrix())
 
 
 class Triangulation_2D(object):
@@ -38,6 +195,117 @@ class Triangulation_2D(object):
 
         self.shape_func_mat_list = []    # contain list of shape function matrices
 
+        # the nodes on boundary edges (edges of only one triangle) have zero Dirichlet condition,
+        # the other nodes are the unknowns of the FEM, dof_index[node] = -1 for boundary nodes
+        edges = np.sort(np.vstack([elements_mat[:, [1, 2]], elements_mat[:, [2, 0]], elements_mat[:, [0, 1]]]), axis=1)
+        edge_keys = edges[:, 0].astype(np.int64) * self.num_nodes + edges[:, 1]
+        keys, counts = np.unique(edge_keys, return_counts=True)
+        bd_keys = keys[counts == 1]
+        is_boundary = np.zeros((self.num_nodes,), dtype=bool)
+        is_boundary[bd_keys // self.num_nodes] = True
+        is_boundary[bd_keys % self.num_nodes] = True
+
+        self.interior_nodes = np.nonzero(~is_boundary)[0]    # node indexes of the unknowns
+        self.num_dofs = self.interior_nodes.shape[0]
+        self.dof_index = -np.ones((self.num_nodes,), dtype=int)
+        self.dof_index[self.interior_nodes] = np.arange(0, self.num_dofs)
+        self.order = 1
+
+        self._areas = None
+        self._gradients = None
+        self._hash = None
+        self._mass_matrix = None
+        self._stiff_matrix = None
+
+    @staticmethod
+    def from_rectangle(len_x, len_y, num_x, num_y):
+        'uniform triangulation of [0, len_x] x [0, len_y], every one of the num_x * num_y cells is split in two triangles'
+
+        assert len_x > 0 and len_y > 0, 'invalid rectangle'
+        assert isinstance(num_x, int) and isinstance(num_y, int) and num_x >= 2 and num_y >= 2, 'invalid number of cells'
+
+        xs, ys = np.meshgrid(np.linspace(0.0, len_x, num_x + 1), np.linspace(0.0, len_y, num_y + 1))
+        nodes_mat = np.vstack((xs.ravel(), ys.ravel())).T
+
+        # node (i, j) is j * (num_x + 1) + i, cell (i, j) has the corners n0, n1 (right), n2 (up), n3 (up right)
+        i, j = np.meshgrid(np.arange(0, num_x), np.arange(0, num_y))
+        n0 = (j * (num_x + 1) + i).ravel()
+        n1 = n0 + 1
+        n2 = n0 + num_x + 1
+        n3 = n2 + 1
+        elements_mat = np.vstack((np.vstack((n0, n1, n3)).T, np.vstack((n0, n3, n2)).T))
+
+        return Triangulation_2D(nodes_mat, elements_mat)
+
+    def get_hash(self):
+        'content hash of the nodes and elements'
+
+        if self._hash is None:
+            sha = hashlib.sha1(np.ascontiguousarray(self.nodes_mat, dtype=float).tostring())
+            sha.update(np.ascontiguousarray(self.elements_mat, dtype=np.int64).tostring())
+            self._hash = sha.hexdigest()
+
+        return self._hash
+
+    def get_areas_gradients(self):
+        'areas of all triangles and the coefficients b, c of the shape functions, computed at once'
+
+        # phi_i(x, y) = (a_i + b_i * x + c_i * y) / (2 * area), see get_shape_functions_mat,
+        # b and c have shape (num_elements, 3), the area is signed (> 0 for counterclockwise triangles)
+        if self._areas is None:
+            p = self.nodes_mat[self.elements_mat].astype(float)    # shape (num_elements, 3, 2)
+            x = p[:, :, 0]
+            y = p[:, :, 1]
+            b = np.roll(y, -1, axis=1) - np.roll(y, -2, axis=1)    # b1 = y2 - y3, b2 = y3 - y1, b3 = y1 - y2
+            c = np.roll(x, -2, axis=1) - np.roll(x, -1, axis=1)    # c1 = x3 - x2, c2 = x1 - x3, c3 = x2 - x1
+            self._areas = 0.5 * np.sum(x * b, axis=1)
+            self._gradients = (b, c)
+
+        return self._areas, self._gradients
+
+    def assemble(self, element_mats):
+        'scatter the element matrices, shape (num_elements, 3, 3), into the matrix of the interior nodes'
+
+        # all entries are put in one COO matrix, duplicates are summed when it is converted
+        local_dofs = self.dof_index[self.elements_mat]
+        rows = np.repeat(local_dofs, 3, axis=1).ravel()
+        cols = np.tile(local_dofs, (1, 3)).ravel()
+        data = element_mats.ravel()
+        inside = (rows >= 0) & (cols >= 0)
+        n = self.num_dofs
+
+        return csc_matrix(coo_matrix((data[inside], (rows[inside], cols[inside])), shape=(n, n)))
+
+    def get_mass_matrix(self):
+        'mass matrix of the interior nodes, element matrix area / 12 * [[2, 1, 1], [1, 2, 1], [1, 1, 2]]'
+
+        if self._mass_matrix is None:
+            areas, _ = self.get_areas_gradients()
+            element_mass = (np.ones((3, 3)) + np.eye(3)) / 12
+            self._mass_matrix = self.assemble(np.abs(areas)[:, None, None] * element_mass[None, :, :])
+
+        return self._mass_matrix
+
+    def get_stiff_matrix(self):
+        'stiff matrix of the interior nodes, element matrix (b_i * b_j + c_i * c_j) / (4 * area)'
+
+        if self._stiff_matrix is None:
+            areas, (b, c) = self.get_areas_gradients()
+            element_stiff = (b[:, :, None] * b[:, None, :] + c[:, :, None] * c[:, None, :]) / (4 * np.abs(areas))[:, None, None]
+            self._stiff_matrix = self.assemble(element_stiff)
+
+        return self._stiff_matrix
+
+    def get_mass_operator(self):
+        'mass operator of the interior nodes'
+
+        return ExplicitOperator(self.get_mass_matrix())
+
+    def get_stiff_operator(self):
+        'stiff operator of the interior nodes'
+
+        return ExplicitOperator(self.get_stiff_matrix())
+
     def get_edges_mat(self):
         'compute edges and boundary edges matrix'
 
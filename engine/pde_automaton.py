@@ -4,6 +4,10 @@ Dung Tran: Nov/2017
 '''
 
 from scipy.sparse import csc_matrix
+from engine.mesh import Mesh1D
+from engine.linear_operator import Operator
+from engine.source import FunctionRegistry, LoadTimeline, ProjectionCache
+from engine.cache import LRUCache, AssemblyCache
 import numpy as np
 
 
@@ -12,13 +16,21 @@ class DPdeAutomaton(object):
 
     def __init__(self):
 
-        self.matrix_a = None
+        self.matrix_a = None    # csc_matrix or engine.linear_operator.Operator
         self.vector_b = []    # a list of vector bn corresponding to different time steps
-        self.inv_b_matrix = None    # use to compute vector b at each time step
+        self.inv_b_matrix = None    # use to compute vector b at each time step, csc_matrix or Operator
+        self.mass_solver = None    # factorization of the mass matrix, used by the wave error load vector
+        self.load_timeline = None    # engine.source.LoadTimeline, load vectors of all time steps
+        self.load_kind = 'interval'    # 'interval' for heat, 'point' for wave load timelines
         self.f_xdom = None    # range of space that input function is affected.
+        self.step_builder = None    # step_builder(mesh, time_step) returns (matrix_a, inv_b_matrix) of a time step
+        self.step_operators = LRUCache(4)    # factorized step operators of other time steps, keyed by step size
+        self.load_builder = None    # load_builder(num_steps, first_step=0) returns the load timeline of a mesh without x_dom (2D)
+        self.assembly_cache = None    # engine.cache.AssemblyCache of the load timelines, None = not cached
 
         self.time_step = None
         self.xlist = None
+        self.mesh = None    # engine.mesh.Mesh1D object of xlist
         self.init_vector = None
         self.alpha_range = None
         self.beta_range = None
@@ -26,7 +38,7 @@ class DPdeAutomaton(object):
 
     def set_matrix_a(self, matrix_a):
         'set matrix _a for DPde automaton'
-        assert isinstance(matrix_a, csc_matrix)
+        assert isinstance(matrix_a, (csc_matrix, Operator))
         assert len(matrix_a.shape) == 2
         self.matrix_a = matrix_a
 
@@ -41,12 +53,38 @@ class DPdeAutomaton(object):
     def set_inv_b_matrix(self, inv_b_matrix):
         'store inv_b_matrix to compute vector b iteratively'
 
-        assert isinstance(inv_b_matrix, csc_matrix)
+        assert isinstance(inv_b_matrix, (csc_matrix, Operator))
         if self.matrix_a is not None:
             assert inv_b_matrix.shape == self.matrix_a.shape, 'inconsistent inv_b_matrix'
 
         self.inv_b_matrix = inv_b_matrix
 
+    def set_mass_solver(self, mass_solver):
+        'store the factorization of the mass matrix, it is reused at every time step'
+
+        assert hasattr(mass_solver, 'solve'), 'invalid mass_solver'
+        self.mass_solver = mass_solver
+
+    def set_step_builder(self, step_builder):
+        'store the function building the step operators (matrix_a, inv_b_matrix) of a time step'
+
+        assert callable(step_builder), 'invalid step_builder'
+        self.step_builder = step_builder
+        self.step_operators.clear()
+
+    def set_load_builder(self, load_builder):
+        'store the function building the load timeline, used instead of the 1D LoadTimeline'
+
+        assert callable(load_builder), 'invalid load_builder'
+        self.load_builder = load_builder
+        self.load_timeline = None
+
+    def set_assembly_cache(self, cache):
+        'store the load timelines in an engine.cache.AssemblyCache, keyed by mesh, time step, x_dom and input function'
+
+        assert hasattr(cache, 'get_or_build'), 'invalid assembly cache'
+        self.assembly_cache = cache
+
     def set_init_condition(self, init_vector):
         'set initial condition'
 
@@ -57,34 +95,52 @@ class DPdeAutomaton(object):
 
     def set_xlist_time_step(self, xlist, time_step):
         'set list of meshpoints and time step'
-        assert isinstance(xlist, list)
-        assert len(xlist) >= 3, 'xlist should have at least three poibnts'
-        for i in xrange(0, len(xlist) - 1):
-            assert 0 <= xlist[i] < xlist[i + 1], 'invalid xlist'
+
+        # xlist is a list of mesh points or an engine.mesh.Mesh1D object (validated when it is built)
+        mesh = Mesh1D.from_points(xlist)
+        assert mesh.points[0] >= 0, 'invalid xlist'
 
         if self.matrix_a is not None:
-            assert len(xlist) - 2 == self.matrix_a.shape[0], 'inconsistent xlist'
+            assert mesh.num_dofs == self.matrix_a.shape[0], 'inconsistent xlist'
 
         assert (time_step > 0), 'time step k = {} should be >= 0'.format(time_step)
-        self.xlist = xlist
+        self.mesh = mesh
+        self.xlist = mesh.tolist()
         self.time_step = time_step
+        self.load_kind = 'interval'
+        self.step_operators.clear()
 
 
     def set_xlist_time_step_w(self, xlist, time_step):
         'set list of meshpoints and time step'
-        assert isinstance(xlist, list)
-        assert len(xlist) >= 3, 'xlist should have at least three poibnts'
-        for i in xrange(0, len(xlist) - 1):
-            assert 0 <= xlist[i] < xlist[i + 1], 'invalid xlist'
+
+        mesh = Mesh1D.from_points(xlist)
+        assert mesh.points[0] >= 0, 'invalid xlist'
 
         if self.matrix_a is not None:
-            assert 2*(len(xlist) - 2) == self.matrix_a.shape[0], 'inconsistent xlist'
+            assert 2 * mesh.num_dofs == self.matrix_a.shape[0], 'inconsistent xlist'
 
         assert (time_step > 0), 'time step k = {} should be >= 0'.format(time_step)
-        self.xlist = xlist
+        self.mesh = mesh
+        self.xlist = mesh.tolist()
         self.time_step = time_step
+        self.load_kind = 'point'
+        self.step_operators.clear()
 
 
+    def set_mesh_time_step(self, mesh, time_step):
+        'set a 2D mesh (engine.mesh.Triangulation_2D) and time step, the automaton has no xlist'
+
+        if self.matrix_a is not None:
+            assert mesh.num_dofs == self.matrix_a.shape[0], 'inconsistent mesh'
+
+        assert (time_step > 0), 'time step k = {} should be >= 0'.format(time_step)
+        self.mesh = mesh
+        self.xlist = None
+        self.time_step = time_step
+        self.load_kind = 'interval'
+        self.step_operators.clear()
+
     def set_fxdom(self, xdom):
         'set range of space that input function f(x,t) is affected'
 
@@ -110,6 +166,166 @@ class DPdeAutomaton(object):
         self.alpha_range = alpha_range
         self.beta_range = beta_range
 
+    def get_load_timeline(self, num_steps, filename=None):
+        'return the load vectors of steps 0, 1, ..., num_steps, they are computed once and reused'
+
+        # a timeline asked to grow (step by step in the verifiers) is rebuilt with at least twice its steps,
+        # so reaching step N costs O(N) computed load vectors instead of O(N^2)
+        timeline = self.load_timeline
+        if self.load_builder is not None:
+            if timeline is None or timeline.num_steps < num_steps:
+                if timeline is not None:
+                    num_steps = max(num_steps, 2 * timeline.num_steps)
+                timeline = self.load_builder(num_steps)
+                self.load_timeline = timeline
+            return timeline
+
+        assert self.mesh is not None and self.f_xdom is not None, 'empty dPde'
+
+        if not self.is_load_timeline_valid(timeline):
+            timeline = None
+        if timeline is None or timeline.num_steps < num_steps:
+            if timeline is not None:
+                num_steps = max(num_steps, 2 * timeline.num_steps)
+            if self.assembly_cache is not None and filename is None:
+                timeline = self.get_cached_load_timeline(num_steps)
+            else:
+                timeline = LoadTimeline(self.mesh.points, self.f_xdom, self.time_step, num_steps, self.load_kind,
+                                        filename=filename, order=self.mesh.order)
+            self.load_timeline = timeline
+
+        return timeline
+
+    def is_load_timeline_valid(self, timeline):
+        'check that a 1D load timeline was computed with the current x_dom, element order and input function'
+
+        return timeline is not None and timeline.x_dom == self.f_xdom and timeline.order == self.mesh.order \
+          and timeline.func_id == FunctionRegistry.get_input_func().func_id
+
+    def iter_load_timelines(self, first_step, last_step, overlap=0, max_bytes=32 * 2 ** 20):
+        'generator of load timelines holding the steps first_step, ..., last_step in order'
+
+        # a stored load timeline holding the steps is returned, otherwise the steps are computed in chunks of
+        # at most max_bytes that are not kept: streaming N steps needs O(n) memory instead of O(n * N).
+        # Each chunk also holds the overlap steps before its first step (the wave load of a step needs
+        # the previous one)
+        assert isinstance(first_step, int) and isinstance(last_step, int) and 0 <= first_step, 'invalid steps'
+        assert isinstance(overlap, int) and overlap >= 0, 'invalid overlap'
+
+        timeline = self.load_timeline
+        if timeline is not None and timeline.num_steps >= last_step \
+          and (self.load_builder is not None or self.is_load_timeline_valid(timeline)):
+            yield timeline    # the stored timeline starts at step 0
+            return
+
+        if self.load_builder is None:
+            assert self.mesh is not None and self.f_xdom is not None, 'empty dPde'
+
+        chunk = max(1, int(max_bytes // (8 * self.mesh.num_dofs)) - overlap)
+        for start in xrange(first_step, last_step + 1, chunk):
+            stop = min(start + chunk - 1, last_step)
+            start = max(start - overlap, 0)
+            if self.load_builder is not None:
+                yield self.load_builder(stop, first_step=start)
+            else:
+                yield LoadTimeline(self.mesh.points, self.f_xdom, self.time_step, stop, self.load_kind,
+                                   order=self.mesh.order, first_step=start)
+
+    def iter_load_chunks(self, first_step, last_step, max_bytes=32 * 2 ** 20):
+        'generator of the load vectors of steps first_step, ..., last_step, as arrays of consecutive columns'
+
+        for timeline in self.iter_load_timelines(first_step, last_step, max_bytes=max_bytes):
+            start = max(first_step, timeline.first_step) - timeline.first_step
+            stop = min(last_step, timeline.num_steps) - timeline.first_step
+            yield timeline.data[:, start:stop + 1]    # a view of the timeline
+
+    def get_cached_load_timeline(self, num_steps):
+        'load timeline read from (or computed and stored in) the assembly cache'
+
+        # the input function is keyed by its fingerprint on the mesh and the time range of the timeline
+        source_func = FunctionRegistry.get_input_func()
+        t_range = [0.0, self.time_step * num_steps]
+        key = AssemblyCache.get_key('LoadTimeline', self.mesh.get_hash(), float(self.time_step), num_steps,
+                                    self.load_kind, list(self.f_xdom),
+                                    source_func.get_fingerprint(self.mesh.points[[0, -1]], t_range))
+
+        def build():
+            'compute the load vectors of all steps'
+            return {'data': LoadTimeline(self.mesh.points, self.f_xdom, self.time_step, num_steps, self.load_kind,
+                                         source_func=source_func, order=self.mesh.order).data}
+
+        data = self.assembly_cache.get_or_build(key, build)['data']
+
+        return LoadTimeline.from_data(data, self.f_xdom, self.time_step, self.load_kind, source_func, self.mesh.order)
+
+    def get_load_vector(self, step, load_timeline=None):
+        'load vector of the automaton at a step, read from the load timeline'
+
+        # load_timeline = None: the stored timeline of the automaton, otherwise a timeline holding the
+        # step (and the step before for the wave equation), e.g. a chunk of iter_load_timelines
+        timeline = load_timeline if load_timeline is not None else self.get_load_timeline(step)
+
+        if self.load_kind == 'interval':
+            return csc_matrix(timeline.get_column(step).reshape(self.mesh.num_dofs, 1))
+
+        # wave: g[n] = [0; (b(t[n]) + b(t[n-1])) * k / 2]
+        n = self.mesh.num_dofs
+        g = np.zeros((2 * n, 1), dtype=float)
+        if step >= 1:
+            g[n:2 * n, 0] = (timeline.get_column(step) + timeline.get_column(step - 1)) * self.time_step / 2
+
+        return csc_matrix(g)
+
+    def get_vector_b(self, step):
+        'vector b[n] = inv(B) * load vector of step n'
+
+        return self.inv_b_matrix * self.get_load_vector(step)
+
+    def get_step_operators(self, time_step):
+        'step operators (matrix_a, inv_b_matrix) of a time step, they are factorized once per step size'
+
+        if time_step == self.time_step:
+            return self.matrix_a, self.inv_b_matrix
+
+        assert self.step_builder is not None, 'dPde has no step builder, only time_step = {} is available'.format(self.time_step)
+
+        return self.step_operators.get_or_build(float(time_step), lambda: self.step_builder(self.mesh, time_step))
+
+    def close(self):
+        'stop the worker processes of the step operators (domain decomposition), if any'
+
+        operators = [self.matrix_a, self.inv_b_matrix]
+        for matrix_a, inv_b_matrix in self.step_operators.items.values():
+            operators.extend([matrix_a, inv_b_matrix])
+        self.step_operators.clear()
+
+        for operator in operators:
+            close = getattr(getattr(operator, 'solver', None), 'close', None)
+            if close is not None:
+                close()
+
+    def has_exact_solver(self):
+        'False if the step operators solve B iteratively, the reach sets then carry the error of the solves'
+
+        # an iterative solver has an err_bound, see engine.solver.ConjugateGradientSolver
+        for operator in [self.matrix_a, self.inv_b_matrix]:
+            if hasattr(getattr(operator, 'solver', None), 'err_bound'):
+                return False
+
+        return True
+
+    def get_interval_load_vector(self, t_dom):
+        'load vector integral (f * phi_i dx dt) over t_dom = [t1, t2], used by steps off the uniform grid'
+
+        assert self.load_kind == 'interval', 'interval load vectors are only defined for the heat equation'
+        assert isinstance(self.mesh, Mesh1D), 'interval load vectors are only defined for 1D meshes'
+        assert self.mesh is not None and self.f_xdom is not None, 'empty dPde'
+
+        b = ProjectionCache.get_load_vector(self.mesh.points, self.f_xdom, [float(t_dom[0]), float(t_dom[1])],
+                                            mesh_hash=self.mesh.get_hash(), order=self.mesh.order)
+
+        return csc_matrix(b.reshape(self.mesh.num_dofs, 1))
+
     def get_trace(self, alpha_value, beta_value, num_steps):
         'produce a trace of the discreted ODE model corresponding to specific values of alpha and beta'
 
@@ -119,6 +335,7 @@ class DPdeAutomaton(object):
 
         u_list = []
         times = np.linspace(0, self.time_step * num_steps, num_steps + 1)
+        self.get_load_timeline(num_steps)    # all load vectors are computed at once
 
         n = len(times)
 
@@ -126,20 +343,12 @@ class DPdeAutomaton(object):
 
             if i == 0:# no computing at this stage
                 current_V = self.init_vector
-		#print "\n V shape:\n{}".format(current_V.shape[0])
                 current_l = csc_matrix((self.init_vector.shape[0], 1), dtype=float)#l is empty initially
-		print "\n current_l:\n{}".format(current_l.shape[0])
             else:
                 current_V = self.matrix_a * current_V
-		#print "\n matrix_a shape:\n{}".format(self.matrix_a.shape[0])
-		print "\n vecb:\n{}".format(self.vector_b)
-		print "\n i:\n{}".format(i)
-
-
-                current_l = (self.vector_b[i] + self.vector_b[i-1]) / 2+ self.matrix_a * current_l
+                current_l = (self.get_vector_b(i) + self.get_vector_b(i - 1)) / 2 + self.matrix_a * current_l
 
             u_list.append(current_V.multiply(alpha_value) + current_l.multiply(beta_value))
 
-            print "\n t = {} -> \n U =: \n{}".format(i * self.time_step, u_list[i].todense())
 
         return u_list
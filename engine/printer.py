@@ -3,7 +3,6 @@ This module implements printers to print discrete-space models (ODE) of PDE benc
 Dung Tran: 4/26/2018
 '''
 import numpy as np
-from scipy.optimize import linprog
 
 
 def get_dynamics(C, symbol):
@@ -392,6 +391,8 @@ def print_spaceex_cfg_file_non_autonomous_ode(
 def get_ymin_ymax(C, xmin_vec, xmax_vec):
     'get ymin-max from the relation y = Cx'
 
+    from scipy.optimize import linprog
+
     assert isinstance(C, np.ndarray), 'error: matrix C should be a numpy array'
     assert isinstance(xmin_vec, list), 'error: xmin_vec should be a list'
     assert isinstance(xmax_vec, list), 'error: xmax_vec should be a list'
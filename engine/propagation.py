@@ -0,0 +1,140 @@
+'''
+This module implements the propagation of the discrete reachable sets of the heat automaton in one dense block
+
+The reach sets u[n] = alpha * Vn + beta * ln and e[n] (see engine.verifier.ReachSetAssembler) have
+four generator columns. Propagating them as separate n x 1 csc matrices allocates new sparse matrices
+for every product and every sum of a step. Here the columns [u.Vn, u.ln, e.Vn, e.ln] are kept in a
+dense n x 4 block and a step is
+
+    [u, e][n] = A * [u, e][n-1]                                    (one product with the 4 columns)
+    u.ln[n] += b[n]
+    [e.Vn, e.ln][n] += inv(B) * (M * ([u.Vn, u.ln][n-1] - [u.Vn, u.ln][n]) + [0, b[n]])
+
+the last line is be[n] of ReachSetAssembler.get_cur_be. The blocks of steps n - 1 and n are two
+preallocated buffers used in turn, so a rejected step (adaptive time stepping) is undone by swapping
+them back. The reach sets of a step are LazyDReachSet objects holding a dense copy of their two
+columns, the csc matrices Vn and ln are only built when they are read.
+'''
+
+import numpy as np
+from scipy.sparse import csc_matrix
+from engine.linear_operator import Operator, to_array
+from engine.set import DReachSet
+
+
+class LazyDReachSet(DReachSet):
+    'DReachSet whose Vn and ln are kept as the two columns of a dense array until they are read'
+
+    def __init__(self, alpha_range, beta_range, columns):
+
+        DReachSet.__init__(self)
+        assert columns.ndim == 2 and columns.shape[1] == 2, 'invalid columns'
+        self.alpha_range = alpha_range
+        self.beta_range = beta_range
+        self.columns = columns    # [Vn, ln], owned by the set
+
+    @property
+    def Vn(self):
+        if self._Vn is None:
+            self._Vn = csc_matrix(self.columns[:, 0:1])
+        return self._Vn
+
+    @Vn.setter
+    def Vn(self, value):
+        self._Vn = value
+
+    @property
+    def ln(self):
+        if self._ln is None:
+            self._ln = csc_matrix(self.columns[:, 1:2])
+        return self._ln
+
+    @ln.setter
+    def ln(self, value):
+        self._ln = value
+
+
+class BlockPropagator(object):
+    'propagate the generators u.Vn, u.ln, e.Vn, e.ln of the heat automaton together in a dense n x 4 block'
+
+    def __init__(self, dPde):
+
+        assert dPde.init_vector is not None and dPde.matrix_a is not None, 'empty dPde'
+
+        n = dPde.init_vector.shape[0]
+        self.dPde = dPde
+        self.matrix_a = Operator.from_matrix(dPde.matrix_a)
+        self.inv_b_matrix = Operator.from_matrix(dPde.inv_b_matrix)
+        self.mass_mat = dPde.mesh.get_mass_operator()
+        self.buffers = [np.zeros((n, 4), dtype=float), np.zeros((n, 4), dtype=float)]
+        self.index = 0    # buffer of the current block
+        self.block = self.buffers[0]
+        self.block[:, 0] = to_array(dPde.init_vector)[:, 0]
+        self.diff = np.zeros((n, 2), dtype=float)    # [u.Vn, u.ln][n-1] - [u.Vn, u.ln][n]
+        # [be.Vn, be.ln] of the step that gave each buffer, be_buffers[1 - index] is be of the step before
+        self.be_buffers = [np.zeros((n, 2), dtype=float), np.zeros((n, 2), dtype=float)]
+        self.be = self.be_buffers[0]    # be of the last step
+
+    def set_block(self, u_dreachset, err_dreachset):
+        'start from the reachable sets u and e of a step instead of the initial condition'
+
+        self.block[:, 0] = to_array(u_dreachset.Vn)[:, 0]
+        self.block[:, 1] = to_array(u_dreachset.ln)[:, 0]
+        self.block[:, 2] = to_array(err_dreachset.Vn)[:, 0]
+        self.block[:, 3] = to_array(err_dreachset.ln)[:, 0]
+
+    def step(self, cur_b_vec, matrix_a=None, inv_b_matrix=None):
+        'compute the block of the next step, cur_b_vec is the load vector of the step'
+
+        # matrix_a, inv_b_matrix = None: the step operators of the automaton
+        if matrix_a is None:
+            matrix_a = self.matrix_a
+            inv_b_matrix = self.inv_b_matrix
+        assert inv_b_matrix is not None, 'give inv_b_matrix with matrix_a'
+
+        cur_b_vec = to_array(cur_b_vec)[:, 0]
+        prev = self.block
+        cur = self.buffers[1 - self.index]
+
+        cur[:] = Operator.from_matrix(matrix_a).matmat(prev)
+        cur[:, 1] += cur_b_vec
+        np.subtract(prev[:, 0:2], cur[:, 0:2], out=self.diff)
+        rhs = self.mass_mat.matmat(self.diff)
+        rhs[:, 1] += cur_b_vec
+        be = self.be_buffers[1 - self.index]
+        be[:] = Operator.from_matrix(inv_b_matrix).matmat(rhs)
+        cur[:, 2:4] += be
+
+        self.index = 1 - self.index
+        self.block = cur
+        self.be = be
+
+    def undo(self):
+        'go back to the block of the previous step, only the last step can be undone'
+
+        self.index = 1 - self.index
+        self.block = self.buffers[self.index]
+        self.be = self.be_buffers[self.index]
+
+    def get_step_err(self, alpha_range, beta_range, ratio=None):
+        'largest |alpha * d.Vn + beta * d.ln| over the corners of the perturbation box, d = be of the last step'
+
+        # with ratio = k[n] / k[n-1], d = be[n] - ratio * be[n-1]: be[n] is about k[n] * du/dt, so d is
+        # about k[n]^2 * d2u/dt2, the deviation of u from a straight line over the step
+        d = self.be
+        if ratio is not None:
+            d = self.be - ratio * self.be_buffers[1 - self.index]
+
+        return max([np.max(np.abs(alpha * d[:, 0] + beta * d[:, 1])) for alpha in alpha_range
+                    for beta in beta_range])
+
+    def get_dreachsets(self):
+        'reachable sets of u, e and the bloated u + e of the current block, as LazyDReachSet objects'
+
+        alpha_range = self.dPde.alpha_range
+        beta_range = self.dPde.beta_range
+        block = self.block
+
+        return (LazyDReachSet(alpha_range, beta_range, block[:, 0:2].copy()),
+                LazyDReachSet(alpha_range, beta_range, block[:, 2:4].copy()),
+                LazyDReachSet(alpha_range, beta_range, block[:, 0:2] + block[:, 2:4]))
@@ -4,8 +4,7 @@ Dung Tran: Nov/2017
 '''
 
 from scipy.sparse import csc_matrix, vstack
-from scipy.optimize import linprog, minimize
-from engine.functions import Functions
+from engine.bounds import BoundKernel
 import numpy as np
 
 
@@ -37,6 +36,8 @@ class GeneralSet(object):
     def check_feasible(self, alpha_range, beta_range):
         'check feasible of the set'
 
+        from scipy.optimize import linprog
+
         # todo: implements check feasible using glpk package for large sparse constraints
         # another option can be using commercial Gurobi solver
 
@@ -163,58 +164,24 @@ class DReachSet(object):
         self.Vn = vector_Vn
         self.ln = vector_ln
 
-    def get_lines_set(self):
-        'compute range of discrete reach set, i.e.,  x_min[i] <= x[i] <= x_max[i]'
+    def get_bounds(self):
+        'exact range of the discrete reach set, return min_vec, min_points, max_vec, max_points as arrays'
 
+        # min_points[i] = [alpha, beta] where x[i] is minimal, see engine.bounds.BoundKernel
         assert self.alpha_range is not None and self.beta_range is not None, 'set perturbation parameters'
         assert self.Vn is not None and self.ln is not None, 'empty set to get min max'
 
-        n = self.Vn.shape[0]
-        min_vec = np.zeros((n,), dtype=float)
-        max_vec = np.zeros((n,), dtype=float)
-        min_points = []
-        max_points = []
-        line_set_list = []
+        return BoundKernel.get_affine_bounds(self.Vn.toarray(), self.ln.toarray(), self.alpha_range, self.beta_range)
 
-        for i in xrange(0, n):
-            min_func = Functions.U_n_i_func(self.Vn[i, 0], self.ln[i, 0])
-            max_func = Functions.U_n_i_func(-self.Vn[i, 0], -self.ln[i, 0])
-
-            x0 = [self.alpha_range[0], self.beta_range[0]]
-            bnds = (self.alpha_range, self.beta_range)
-            min_res = minimize(
-                min_func,
-                x0,
-                method='L-BFGS-B',
-                bounds=bnds,
-                tol=1e-10, options={'disp': False})    # add options={'disp': True} to display optimization result
-            max_res = minimize(
-                max_func,
-                x0,
-                method='L-BFGS-B',
-                bounds=bnds,
-                tol=1e-10, options={'disp': False})    # add  options={'disp': True} to display optimization result
-
-            if min_res.status == 0:
-                min_vec[i] = min_res.fun
-                min_points.append(min_res.x)
-            else:
-                print "\nmin_res.status = {}".format(min_res.status)
-                print "\nminimization message: {}".format(min_res.message)
-                raise ValueError(
-                    'minimization fail!')
-
-            if max_res.status == 0:
-                max_vec[i] = -max_res.fun
-                max_points.append(max_res.x)
-            else:
-                print "\nmax_res.status = {}".format(max_res.status)
-                print "\nmaximization message: {}".format(max_res.message)
-                raise ValueError(
-                    'maximization fail!')
+    def get_lines_set(self):
+        'compute range of discrete reach set, i.e.,  x_min[i] <= x[i] <= x_max[i]'
 
+        min_vec, min_points, max_vec, max_points = self.get_bounds()
+
+        line_set_list = []
+        for i in xrange(0, min_vec.shape[0]):
             line = LineSet()
             line.set_bounds(min_vec[i], max_vec[i])
             line_set_list.append(line)
 
-        return line_set_list, min_vec, min_points, max_vec, max_points
+        return line_set_list, min_vec, list(min_points), max_vec, list(max_points)
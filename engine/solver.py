@@ -0,0 +1,263 @@
+'''
+This module implements factorized linear solvers used for implicit time stepping
+
+The Crank-Nicolson step of the FEM automaton is U[n] = inv(B) * C * U[n-1] + inv(B) * b[n] with
+B = M + k/2 * K and C = M - k/2 * K. Computing inv(B) explicitly gives an essentially dense
+matrix, so matrix_a = inv(B) * C costs O(n^2) memory and O(n^2) work per step. Here B is
+factorized once and each step is a multiplication by C followed by a solve with the factors,
+see engine.linear_operator.FactorizedOperator.
+
+For the 1D heat equation B is symmetric positive definite and tridiagonal, its banded Cholesky
+factorization is stored in a (2, n) array and a solve is O(n). General matrices use a sparse LU
+factorization (splu). For large 2D and 3D discretizations, where a factorization does not fit in
+memory, ConjugateGradientSolver solves the step with preconditioned conjugate gradient instead.
+'''
+
+import numpy as np
+from scipy.sparse import csc_matrix, csr_matrix, find, issparse
+from scipy.sparse.linalg import splu, spilu, cg, LinearOperator
+from scipy.linalg import cholesky_banded, cho_solve_banded
+from engine.linear_operator import SymTridiagonalOperator
+
+
+class BandedCholeskySolver(object):
+    'Cholesky factorization of a symmetric positive definite banded matrix'
+
+    def __init__(self, matrix):
+
+        # matrix is a sparse matrix or a SymTridiagonalOperator, whose bands are used directly
+        if isinstance(matrix, SymTridiagonalOperator):
+            ab = matrix.get_upper_bands()
+            bandwidth = 1
+        else:
+            assert issparse(matrix) and matrix.shape[0] == matrix.shape[1], 'invalid matrix'
+            n = matrix.shape[0]
+            rows, cols, _ = find(matrix)
+            bandwidth = int(np.max(np.abs(rows - cols))) if rows.shape[0] > 0 else 0
+
+            # upper form of the band: ab[bandwidth + i - j, j] = matrix[i, j], i <= j
+            ab = np.zeros((bandwidth + 1, n), dtype=float)
+            for d in xrange(0, bandwidth + 1):
+                ab[bandwidth - d, d:] = matrix.diagonal(d)
+
+        self.shape = matrix.shape
+        self.bandwidth = bandwidth
+        self.factor = cholesky_banded(ab, lower=False)    # raises LinAlgError if matrix is not positive definite
+
+    @staticmethod
+    def from_factor(factor):
+        'solver of an already computed upper banded Cholesky factor, e.g., read from engine.cache.AssemblyCache'
+
+        factor = np.asarray(factor, dtype=float)
+        assert factor.ndim == 2, 'invalid banded factor'
+
+        solver = BandedCholeskySolver.__new__(BandedCholeskySolver)
+        solver.shape = (factor.shape[1], factor.shape[1])
+        solver.bandwidth = factor.shape[0] - 1
+        solver.factor = factor
+
+        return solver
+
+    def solve(self, rhs):
+        'solve matrix * x = rhs, rhs is a numpy array with one or several columns'
+
+        return cho_solve_banded((self.factor, False), rhs)
+
+
+class SparseLUSolver(object):
+    'sparse LU factorization of a general square matrix'
+
+    def __init__(self, matrix):
+
+        assert issparse(matrix) and matrix.shape[0] == matrix.shape[1], 'invalid matrix'
+
+        self.shape = matrix.shape
+        self.factor = splu(csc_matrix(matrix))
+
+    def solve(self, rhs):
+        'solve matrix * x = rhs, rhs is a numpy array with one or several columns'
+
+        return self.factor.solve(rhs)
+
+
+class ConjugateGradientSolver(object):
+    'preconditioned conjugate gradient for large symmetric positive definite matrices, warm-started'
+
+    # used when a direct factorization does not fit in memory (2D and 3D discretizations). Each
+    # column is solved until ||x - x*||_2 <= err_tol: with a lower bound min_eigenvalue of the
+    # eigenvalues of the matrix, ||x - x*||_2 <= ||r||_2 / min_eigenvalue, so the residual tolerance
+    # is err_tol * min_eigenvalue (but not below the rounding of the right hand side). err_bound is
+    # the largest bound of all solves, computed from the true residuals. It is not part of the error
+    # set, so engine.verifier.Verifier refuses automata solved with it (DPdeAutomaton.has_exact_solver).
+    # preconditioner is 'jacobi', 'ilu' (incomplete factorization) or 'amg' (algebraic multigrid,
+    # needs the optional pyamg package).
+
+    PRECONDITIONERS = ['jacobi', 'ilu', 'amg']
+
+    def __init__(self, matrix, preconditioner='jacobi', err_tol=1e-10, min_eigenvalue=None, maxiter=None):
+
+        assert issparse(matrix) and matrix.shape[0] == matrix.shape[1], 'invalid matrix'
+        assert preconditioner in ConjugateGradientSolver.PRECONDITIONERS, 'unknown preconditioner {}'.format(preconditioner)
+        assert err_tol > 0, 'invalid err_tol'
+
+        matrix = csr_matrix(matrix)
+        if min_eigenvalue is None:
+            # Gershgorin lower bound, it should be > 0 for the solve error to be bounded
+            diag = matrix.diagonal()
+            off_sum = np.asarray(abs(matrix).sum(axis=1)).reshape(diag.shape[0]) - np.abs(diag)
+            min_eigenvalue = np.min(diag - off_sum)
+        assert min_eigenvalue > 0, 'a positive lower bound of the eigenvalues is needed, give min_eigenvalue'
+
+        self.shape = matrix.shape
+        self.matrix = matrix
+        self.preconditioner = preconditioner
+        self.err_tol = err_tol
+        self.min_eigenvalue = min_eigenvalue
+        self.maxiter = maxiter
+        self.precond = ConjugateGradientSolver.get_preconditioner(matrix, preconditioner)
+        self.warm_starts = {}    # number of columns -> solution of the previous solve
+        self.err_bound = 0.0    # largest bound of ||x - x*||_2 of all solves
+        self.num_iterations = 0    # total number of CG iterations
+
+    @staticmethod
+    def get_preconditioner(matrix, preconditioner):
+        'return the preconditioner as a scipy LinearOperator'
+
+        n = matrix.shape[0]
+        if preconditioner == 'jacobi':
+            inv_diag = 1.0 / matrix.diagonal()
+            return LinearOperator((n, n), matvec=lambda x: inv_diag * x.reshape(n))
+
+        if preconditioner == 'ilu':
+            # no pivoting and natural ordering: the incomplete LU factors of a symmetric positive definite
+            # matrix are then L and D * L^T (incomplete Cholesky), a symmetric preconditioner as CG needs
+            ilu = spilu(csc_matrix(matrix), drop_tol=1e-4, fill_factor=20, permc_spec='NATURAL',
+                        diag_pivot_thresh=0.0, options={'SymmetricMode': True})
+            return LinearOperator((n, n), matvec=ilu.solve)
+
+        try:
+            import pyamg
+        except ImportError:
+            raise ImportError('the amg preconditioner needs the pyamg package')
+
+        return pyamg.smoothed_aggregation_solver(csr_matrix(matrix)).aspreconditioner()
+
+    def solve(self, rhs):
+        'solve matrix * x = rhs, rhs is a numpy array with one or several columns'
+
+        rhs = np.asarray(rhs, dtype=float)
+        is_vector = rhs.ndim == 1
+        rhs = rhs.reshape(rhs.shape[0], -1)
+        num_cols = rhs.shape[1]
+        x0 = self.warm_starts.get(num_cols)
+
+        res = np.zeros(rhs.shape, dtype=float)
+        for j in xrange(0, num_cols):
+            iterations = [0]
+
+            def count(_):
+                'count the CG iterations'
+                iterations[0] += 1
+
+            guess = None if x0 is None else x0[:, j]
+            # the residual cannot go much below the rounding of rhs
+            atol = max(self.err_tol * self.min_eigenvalue, 1e-12 * np.linalg.norm(rhs[:, j]))
+            try:
+                x, info = cg(self.matrix, rhs[:, j], x0=guess, rtol=0.0, atol=atol, maxiter=self.maxiter,
+                             M=self.precond, callback=count)
+            except TypeError:    # scipy < 1.12
+                x, info = cg(self.matrix, rhs[:, j], x0=guess, tol=0.0, atol=atol, maxiter=self.maxiter,
+                             M=self.precond, callback=count)
+
+            residual = np.linalg.norm(rhs[:, j] - self.matrix.dot(x))
+            if info != 0:
+                raise ValueError('conjugate gradient did not converge, residual = {}'.format(residual))
+
+            res[:, j] = x
+            self.num_iterations += iterations[0]
+            self.err_bound = max(self.err_bound, residual / self.min_eigenvalue)
+
+        self.warm_starts[num_cols] = res
+
+        return res[:, 0] if is_vector else res
+
+
+class WaveSchurSolver(object):
+    'solve A1 * [u; v] = [r1; r2], A1 = [[M, -k/2 * M], [k/2 * K, M]] of the wave automaton, by a Schur complement'
+
+    # from the second block row v = inv(M) * (r2 - k/2 * K * u), substituting it in the first one
+    # gives the Schur complement system (M + k^2/4 * K) * u = r1 + k/2 * r2. Both M and
+    # S = M + k^2/4 * K are symmetric positive definite, they are factorized once.
+
+    def __init__(self, mass_matrix, stiff_matrix, time_step):
+
+        assert time_step > 0, 'invalid time_step'
+        assert mass_matrix.shape == stiff_matrix.shape, 'inconsistent mass and stiff matrices'
+
+        c = time_step / 2.0
+        if isinstance(mass_matrix, SymTridiagonalOperator):
+            schur_matrix = mass_matrix.plus(stiff_matrix, c * c)
+        else:
+            schur_matrix = mass_matrix + stiff_matrix.multiply(c * c)
+
+        n = mass_matrix.shape[0]
+        self.shape = (2 * n, 2 * n)
+        self.half_time_step = c
+        self.stiff_matrix = stiff_matrix
+        self.mass_solver = Factorization.factorize(mass_matrix, spd=True)
+        self.schur_solver = Factorization.factorize(schur_matrix, spd=True)
+
+    def solve(self, rhs):
+        'solve A1 * x = rhs, rhs is a numpy array with one or several columns'
+
+        n = self.shape[0] / 2
+        r1 = rhs[0:n]
+        r2 = rhs[n:2 * n]
+        c = self.half_time_step
+
+        u = self.schur_solver.solve(r1 + c * r2)
+        v = self.mass_solver.solve(r2 - c * np.asarray(self.stiff_matrix * u))
+
+        return np.concatenate((u, v), axis=0)
+
+
+class Factorization(object):
+    'factorize the matrix B of an implicit time step once'
+
+    MAX_BANDWIDTH = 8    # banded Cholesky is used for symmetric positive definite matrices up to this bandwidth
+
+    @staticmethod
+    def factorize(matrix, spd=False):
+        'return a BandedCholeskySolver if matrix is a symmetric positive definite band matrix, otherwise a SparseLUSolver'
+
+        if spd and isinstance(matrix, SymTridiagonalOperator):
+            return BandedCholeskySolver(matrix)
+
+        if spd:
+            rows, cols, _ = find(matrix)
+            if rows.shape[0] > 0 and np.max(np.abs(rows - cols)) <= Factorization.MAX_BANDWIDTH:
+                return BandedCholeskySolver(matrix)
+
+        return SparseLUSolver(matrix)
+
+
+if __name__ == '__main__':
+
+    import time
+    from engine.mesh import Mesh1D
+    from engine.linear_operator import FactorizedOperator
+
+    num_points = 100000
+    k = 0.01
+    mesh = Mesh1D(np.linspace(0.0, 1.0, num_points + 2))
+    M = mesh.get_mass_matrix()
+    K = mesh.get_stiff_matrix()
+
+    start = time.time()
+    step = FactorizedOperator(Factorization.factorize(M + K.multiply(k / 2), spd=True), M - K.multiply(k / 2))
+    u = csc_matrix(np.sin(mesh.points[1:-1]).reshape(num_points, 1))
+    for i in xrange(0, 100):
+        u = step * u
+    end = time.time()
+
+    print "\n100 Crank-Nicolson steps on {} points: {} seconds".format(num_points, end - start)
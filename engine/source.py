@@ -0,0 +1,431 @@
+'''
+This module implements the registry of input (source) and initial condition functions
+and the cache of their projections onto the hat basis
+
+Users register f(x,t), u0(x) and (for the wave equation) the initial velocity v0(x) as
+vectorized numpy callables, optionally together with a symbolic form used for exact
+integration. The FEM assemblers read the active functions from FunctionRegistry, and the
+load vectors are cached in ProjectionCache, keyed by (function id, mesh hash, time interval).
+For separable input functions f(x,t) = g(x) * h(t) only the spatial projection of g is
+integrated and cached, the load vector of each step is that vector times a scalar.
+'''
+
+import hashlib
+import types
+import numpy as np
+from engine.cache import LRUCache
+from engine.quadrature import GaussQuadrature
+
+
+class SourceFunction(object):
+    'a vectorized numpy function with an optional symbolic form'
+
+    # an input function can be declared separable, f(x,t) = g(x) * h(t), by giving space_func g
+    # and time_func h. The load vector at step n is then a fixed spatial vector times a scalar
+    # time integral. If h(t) = exp(-decay_rate * t), the time integrals follow a geometric
+    # recurrence and time_func can be omitted.
+
+    def __init__(self, name, func, sym_expr=None, space_func=None, time_func=None, decay_rate=None):
+
+        assert isinstance(name, basestring), 'invalid function name'
+        assert callable(func), 'func should be a vectorized numpy callable'
+        assert space_func is None or callable(space_func), 'space_func should be a vectorized numpy callable'
+        assert time_func is None or callable(time_func), 'time_func should be a vectorized numpy callable'
+
+        self.name = name
+        self.func = func    # numpy callable, f(x, t) for input functions, u0(x) for initial functions
+        self.sym_expr = sym_expr    # sympy expression or string in x (and t), None if not available
+        self.func_id = None    # unique id set by the registry, used as cache key
+
+        if decay_rate is not None and time_func is None:
+            time_func = lambda t: np.exp(-decay_rate * np.asarray(t, dtype=float))
+
+        self.space_func = space_func    # g(x) of a separable input function
+        self.time_func = time_func    # h(t) of a separable input function
+        self.decay_rate = decay_rate    # h(t) = exp(-decay_rate * t)
+
+    def __call__(self, *args):
+        return self.func(*args)
+
+    def get_sym_expr(self):
+        'return the symbolic form of the function'
+
+        if self.sym_expr is None:
+            raise ValueError('function {} has no symbolic form'.format(self.name))
+
+        if isinstance(self.sym_expr, basestring):
+            from sympy import sympify
+            self.sym_expr = sympify(self.sym_expr)
+
+        return self.sym_expr
+
+    def is_separable(self):
+        'True if f(x,t) = g(x) * h(t) is declared or detected'
+
+        return self.space_func is not None and self.time_func is not None
+
+    def detect_separable(self, x_range, t_range, num_samples=9, tol=1e-12):
+        'check on a sample grid if f(x,t) = g(x) * h(t), if so use g and h for the load vectors'
+
+        # f is separable iff the matrix F[i, j] = f(x_i, t_j) has rank one, i.e.,
+        # F[i, j] * F[p, q] = F[i, q] * F[p, j] where (p, q) is the largest entry.
+        # This is only checked on the samples, declare space_func/time_func if it is known.
+
+        xs = np.linspace(x_range[0], x_range[1], num_samples)
+        ts = np.linspace(t_range[0], t_range[1], num_samples)
+        F = np.broadcast_to(self.func(xs[:, None], ts[None, :]), (num_samples, num_samples))
+        p, q = np.unravel_index(np.argmax(np.abs(F)), F.shape)
+        f_pq = F[p, q]
+        if f_pq == 0.0:
+            return False
+
+        residual = np.max(np.abs(F * f_pq - np.outer(F[:, q], F[p, :])))
+        if residual > tol * f_pq * f_pq:
+            return False
+
+        x_p = xs[p]
+        t_q = ts[q]
+        func = self.func
+        self.space_func = lambda x: func(x, t_q)
+        self.time_func = lambda t: func(x_p, t) / f_pq
+
+        return True
+
+    def get_fingerprint(self, x_range, t_range=None, num_samples=17):
+        'content hash of the function: its name, its code, its symbolic form and its values on a sample grid'
+
+        # t_range = None for functions of x only (initial conditions). Used as a key of the persistent
+        # engine.cache.AssemblyCache, where func_id (unique only within a process) cannot be used.
+        # The samples are offset by a golden ratio fraction of a cell so that they do not fall on the
+        # zeros of a function periodic on the grid; the code hash tells apart functions equal there.
+        offset = (np.sqrt(5.0) - 1) / 2
+        xs = x_range[0] + (x_range[1] - x_range[0]) * (np.arange(0, num_samples) + offset) / num_samples
+        if t_range is None:
+            values = np.broadcast_to(self.func(xs), xs.shape)
+        else:
+            ts = t_range[0] + (t_range[1] - t_range[0]) * (np.arange(0, num_samples) + offset) / num_samples
+            values = np.broadcast_to(self.func(xs[:, None], ts[None, :]), (num_samples, num_samples))
+
+        sha = hashlib.sha1('{}|{}|{}|'.format(self.name, self.sym_expr, self.decay_rate))
+        for func in [self.func, self.space_func, self.time_func]:
+            SourceFunction.update_code_hash(sha, func, set())
+        sha.update(np.ascontiguousarray(values, dtype=float).tostring())
+
+        return sha.hexdigest()
+
+    @staticmethod
+    def update_code_hash(sha, obj, seen):
+        'feed the byte code of a python function, its constants, closures and called functions into sha'
+
+        # numpy ufuncs and other callables without python code are hashed by their name. seen holds the
+        # ids of the visited functions, so that recursive functions end
+        if id(obj) in seen:
+            return
+        seen.add(id(obj))
+
+        if isinstance(obj, np.ndarray):
+            sha.update(np.ascontiguousarray(obj).tostring())
+            return
+        if isinstance(obj, (bool, int, long, float, complex, basestring)) or obj is None:
+            sha.update(repr(obj))
+            return
+
+        code = getattr(obj, '__code__', obj if isinstance(obj, types.CodeType) else None)
+        if code is None:
+            sha.update(getattr(obj, '__name__', type(obj).__name__))
+            return
+
+        sha.update(code.co_code)
+        sha.update(repr(code.co_names))
+        for const in code.co_consts:
+            SourceFunction.update_code_hash(sha, const, seen)
+        for cell in getattr(obj, '__closure__', None) or ():
+            SourceFunction.update_code_hash(sha, cell.cell_contents, seen)
+        func_globals = getattr(obj, '__globals__', {})
+        for name in code.co_names:
+            value = func_globals.get(name)
+            if isinstance(value, (types.FunctionType, bool, int, long, float, np.ndarray)):
+                SourceFunction.update_code_hash(sha, value, seen)
+
+    def get_time_integral(self, t_dom, num_points=4):
+        'integral of h(t) over t_dom = [t1, t2]'
+
+        assert self.is_separable(), 'function {} is not separable'.format(self.name)
+
+        if self.decay_rate is not None:
+            if self.decay_rate == 0.0:
+                return t_dom[1] - t_dom[0]
+            return (np.exp(-self.decay_rate * t_dom[0]) - np.exp(-self.decay_rate * t_dom[1])) / self.decay_rate
+
+        ts, tw = GaussQuadrature.get_points_weights(num_points)
+        h = np.broadcast_to(self.time_func(t_dom[0] + (t_dom[1] - t_dom[0]) * ts), ts.shape)
+
+        return (t_dom[1] - t_dom[0]) * np.dot(h, tw)
+
+    def get_time_integrals(self, time_step, num_steps, first_step=0):
+        'integrals of h(t) over [t[n-1], t[n]] for n = first_step, ..., num_steps (zero for n = 0)'
+
+        H = np.zeros((num_steps - first_step + 1,), dtype=float)
+        start = max(first_step, 1) - first_step    # index of the first step n >= 1
+        if num_steps == 0 or start >= H.shape[0]:
+            return H
+
+        steps = np.arange(max(first_step, 1), num_steps + 1, dtype=float)
+        if self.decay_rate is not None:
+            # geometric recurrence: H[n] = H[1] * exp(-decay_rate * time_step) ** (n - 1)
+            ratio = np.exp(-self.decay_rate * time_step)
+            H[start:] = self.get_time_integral([0.0, time_step]) * np.power(ratio, steps - 1)
+        else:
+            ts, tw = GaussQuadrature.get_points_weights(4)
+            t_start = (steps - 1) * time_step
+            tq = t_start[:, None] + time_step * ts[None, :]
+            h = np.broadcast_to(self.time_func(tq), tq.shape)
+            H[start:] = time_step * np.dot(h, tw)
+
+        return H
+
+
+class FunctionRegistry(object):
+    'registry of the input function f(x,t) and the initial functions u0(x), v0(x)'
+
+    _functions = {}    # name -> SourceFunction
+    _active = {}    # role ('input', 'init', 'init_velocity') -> name
+    _counter = [0]    # number of registered functions, used to build unique function ids
+
+    @staticmethod
+    def register(name, func, sym_expr=None, space_func=None, time_func=None, decay_rate=None):
+        'register a function, an existing function with the same name is replaced'
+
+        source_func = SourceFunction(name, func, sym_expr, space_func, time_func, decay_rate)
+        FunctionRegistry._counter[0] += 1
+        source_func.func_id = '{}#{}'.format(name, FunctionRegistry._counter[0])
+        FunctionRegistry._functions[name] = source_func
+
+        return source_func
+
+    @staticmethod
+    def get(name):
+        'return a registered function'
+
+        if name not in FunctionRegistry._functions:
+            raise ValueError('function {} is not registered'.format(name))
+
+        return FunctionRegistry._functions[name]
+
+    @staticmethod
+    def set_active(role, name):
+        'use the registered function name as input, init or init_velocity function'
+
+        assert role in ['input', 'init', 'init_velocity'], 'invalid role'
+        FunctionRegistry.get(name)
+        FunctionRegistry._active[role] = name
+
+    @staticmethod
+    def get_active(role):
+        'return the function used as input, init or init_velocity function'
+
+        assert role in ['input', 'init', 'init_velocity'], 'invalid role'
+
+        return FunctionRegistry.get(FunctionRegistry._active[role])
+
+    @staticmethod
+    def set_input_func(name):
+        'use the registered function name as input function f(x,t)'
+        FunctionRegistry.set_active('input', name)
+
+    @staticmethod
+    def set_init_func(name):
+        'use the registered function name as initial condition u0(x)'
+        FunctionRegistry.set_active('init', name)
+
+    @staticmethod
+    def set_init_velocity_func(name):
+        'use the registered function name as initial velocity v0(x) of the wave equation'
+        FunctionRegistry.set_active('init_velocity', name)
+
+    @staticmethod
+    def get_input_func():
+        'return the input function f(x,t)'
+        return FunctionRegistry.get_active('input')
+
+    @staticmethod
+    def get_init_func():
+        'return the initial condition function u0(x)'
+        return FunctionRegistry.get_active('init')
+
+    @staticmethod
+    def get_init_velocity_func():
+        'return the initial velocity function v0(x) of the wave equation'
+        return FunctionRegistry.get_active('init_velocity')
+
+
+class ProjectionCache(object):
+    'cache of load vectors [b_i] = integral (f * phi_i), keyed by (function id, mesh hash, time interval)'
+
+    _cache = LRUCache(1024, max_bytes=64 * 2 ** 20)    # at most 64 MB of load vectors
+
+    @staticmethod
+    def get_mesh_hash(x):
+        'content hash of a list or array of mesh points'
+
+        return hashlib.sha1(np.ascontiguousarray(x, dtype=float).tostring()).hexdigest()
+
+    @staticmethod
+    def integrate_exact(source_func, x, x_dom, t_dom):
+        'symbolic integration of f * phi_i for every interior mesh point'
+
+        from engine.functions import Functions
+
+        n = len(x) - 2
+        b = np.zeros((n,), dtype=float)
+        for i in xrange(0, n):
+            seg_x = [x[i], x[i + 1], x[i + 2]]
+            if isinstance(t_dom, list):
+                b[i] = float(Functions.integrate_input_func_mul_phi(seg_x, x_dom, t_dom, source_func))
+            else:
+                b[i] = float(Functions.integrate_input_func_mul_phi_in_space(seg_x, x_dom, t_dom, source_func))
+
+        return b
+
+    @staticmethod
+    def get_space_projection(source_func, x, x_dom, mesh_hash=None, order=1):
+        'return [G_i] = integral (g * phi_i dx) over x_dom for a separable input f(x,t) = g(x) * h(t)'
+
+        if mesh_hash is None:
+            mesh_hash = ProjectionCache.get_mesh_hash(x)
+
+        key = (source_func.func_id, mesh_hash, tuple(x_dom), 'space', order)
+        space_func = source_func.space_func
+
+        def build():
+            'integrate g * phi_i'
+            return GaussQuadrature.integrate_input_func_mul_phi_in_space(
+                x, x_dom, 0.0, lambda xq, tq: space_func(xq), order=order)
+
+        return ProjectionCache._cache.get_or_build(key, build)
+
+    @staticmethod
+    def get_load_vector(x, x_dom, t_dom, source_func=None, exact=False, mesh_hash=None, order=1):
+        'return [b_i] = integral (f * phi_i) over x_dom and t_dom (list) or at time t_dom (float)'
+
+        # the returned array is shared with the cache and should not be modified,
+        # order = 1 (hat functions) or 2 (quadratic elements, exact integration is not available)
+        if source_func is None:
+            source_func = FunctionRegistry.get_input_func()
+        if mesh_hash is None:
+            mesh_hash = ProjectionCache.get_mesh_hash(x)
+
+        if source_func.is_separable() and not exact:
+            # one cached spatial projection times a scalar, nothing is integrated per step
+            space_vector = ProjectionCache.get_space_projection(source_func, x, x_dom, mesh_hash, order)
+            if isinstance(t_dom, list):
+                return space_vector * source_func.get_time_integral(t_dom)
+            return space_vector * float(source_func.time_func(float(t_dom)))
+
+        t_key = tuple(t_dom) if isinstance(t_dom, list) else float(t_dom)
+        key = (source_func.func_id, mesh_hash, tuple(x_dom), t_key, exact, order)
+
+        def build():
+            'integrate the load vector'
+            if exact:
+                assert order == 1, 'exact integration is only available for hat functions'
+                return ProjectionCache.integrate_exact(source_func, x, x_dom, t_dom)
+            elif isinstance(t_dom, list):
+                return GaussQuadrature.integrate_input_func_mul_phi(x, x_dom, t_dom, source_func.func, order=order)
+            else:
+                return GaussQuadrature.integrate_input_func_mul_phi_in_space(x, x_dom, t_dom, source_func.func,
+                                                                             order=order)
+
+        return ProjectionCache._cache.get_or_build(key, build)
+
+    @staticmethod
+    def clear():
+        'remove all cached projections'
+        ProjectionCache._cache.clear()
+
+
+class LoadTimeline(object):
+    'load vectors of time steps 0, 1, ..., N computed in one batched call, stored as columns of an n x (N + 1) array'
+
+    # kind = 'interval': column k = integral (f * phi_i dx dt) over [t[k-1], t[k]], zero for k = 0 (heat equation)
+    # kind = 'point': column k = integral (f(x, t[k]) * phi_i dx) (wave equation)
+    # if filename is given the array is a numpy memmap stored in that file, order is the element order.
+    # With first_step > 0 only the steps first_step, ..., N are computed (a chunk of a longer timeline)
+
+    def __init__(self, x, x_dom, time_step, num_steps, kind='interval', source_func=None, filename=None, order=1,
+                 first_step=0):
+
+        assert kind in ['interval', 'point'], 'invalid kind of load timeline'
+        assert time_step > 0, 'invalid time_step'
+        assert isinstance(num_steps, int) and num_steps >= 0, 'invalid num_steps'
+        assert isinstance(first_step, int) and 0 <= first_step <= num_steps, 'invalid first_step'
+
+        if source_func is None:
+            source_func = FunctionRegistry.get_input_func()
+
+        x = np.asarray(x, dtype=float)
+        n = order * (x.shape[0] - 1) - 1    # number of interior nodes
+        shape = (n, num_steps - first_step + 1)
+        if filename is not None:
+            data = np.memmap(filename, dtype=float, mode='w+', shape=shape, order='F')
+        else:
+            data = np.zeros(shape, dtype=float, order='F')
+
+        if source_func.is_separable():
+            # one spatial projection times the time integrals (or values) of all steps
+            space_vector = ProjectionCache.get_space_projection(source_func, x, x_dom, order=order)
+            if kind == 'interval':
+                H = source_func.get_time_integrals(time_step, num_steps, first_step)
+            else:
+                t = np.arange(first_step, num_steps + 1, dtype=float) * time_step
+                H = np.broadcast_to(source_func.time_func(t), t.shape)
+            data[:, :] = space_vector[:, None] * H[None, :]
+        else:
+            data[:, :] = GaussQuadrature.integrate_input_func_mul_phi_steps(
+                x, x_dom, time_step, num_steps, source_func.func, in_space=(kind == 'point'), order=order,
+                first_step=first_step)
+
+        self.kind = kind
+        self.x_dom = x_dom
+        self.time_step = time_step
+        self.first_step = first_step
+        self.num_steps = num_steps
+        self.order = order
+        self.func_id = source_func.func_id
+        self.data = data
+
+    def get_column(self, step):
+        'load vector of a step as an array of shape (n,), shared with the timeline'
+
+        assert self.first_step <= step <= self.num_steps, 'step {} is out of the timeline'.format(step)
+
+        return self.data[:, step - self.first_step]
+
+    @staticmethod
+    def from_data(data, x_dom, time_step, kind='interval', source_func=None, order=1):
+        'timeline of already computed load vectors, data is the (n, N + 1) array of a LoadTimeline'
+
+        if source_func is None:
+            source_func = FunctionRegistry.get_input_func()
+
+        timeline = LoadTimeline.__new__(LoadTimeline)
+        timeline.kind = kind
+        timeline.x_dom = x_dom
+        timeline.time_step = time_step
+        timeline.first_step = 0
+        timeline.num_steps = data.shape[1] - 1
+        timeline.order = order
+        timeline.func_id = source_func.func_id
+        timeline.data = data
+
+        return timeline
+
+
+# default functions of the toolbox
+FunctionRegistry.register('exp_decay', lambda x, t: np.exp(-x) * np.exp(-t), 'exp(-x)*exp(-t)',
+                          space_func=lambda x: np.exp(-x), decay_rate=1.0)
+FunctionRegistry.register('sin', np.sin, 'sin(x)')
+FunctionRegistry.register('cos', np.cos, 'cos(x)')
+FunctionRegistry.set_input_func('exp_decay')
+FunctionRegistry.set_init_func('sin')
+FunctionRegistry.set_init_velocity_func('cos')
@@ -3,14 +3,16 @@ This module implements continuous/discreted verifier for PDE automaton
 Dung Tran: Nov/2017
 '''
 
-from scipy.sparse import csc_matrix, lil_matrix
-from scipy.optimize import minimize
+from scipy.sparse import csc_matrix
 from engine.pde_automaton import DPdeAutomaton
+from engine.linear_operator import Operator, SineTransformOperator, to_array
 from engine.set import DReachSet
 from engine.interpolation import Interpolation
-from engine.fem import Fem1D
 from engine.functions import Functions
+from engine.bounds import BoundKernel
+from engine.propagation import BlockPropagator
 from engine.specification import SafetySpecification
+import itertools
 import math
 import numpy as np
 
@@ -28,14 +30,17 @@ class ReachSetAssembler(object):
         'compute the current approximate discrete reachable set of u'
 
         # has the form of u[n] = Au[n-1] + b[n] = alpha * Vn + beta * ln
-        assert isinstance(matrix_a, csc_matrix)
+        assert isinstance(matrix_a, (csc_matrix, Operator))
         assert isinstance(prev_u, DReachSet)
         assert isinstance(cur_b_vec, csc_matrix) and cur_b_vec.shape[1] == 1, 'invalid current vector b'
         assert matrix_a.shape[0] == cur_b_vec.shape[0] == prev_u.Vn.shape[0] == prev_u.ln.shape[0]
 
+        # Vn and ln are propagated together with one matmat of the operator
+        Vl = Operator.from_matrix(matrix_a).matmat(np.hstack((to_array(prev_u.Vn), to_array(prev_u.ln))))
+
         cur_u_dreachset = DReachSet()
-        cur_u_dreachset.Vn = matrix_a * prev_u.Vn
-        cur_u_dreachset.ln = matrix_a * prev_u.ln + cur_b_vec
+        cur_u_dreachset.Vn = csc_matrix(Vl[:, 0:1])
+        cur_u_dreachset.ln = csc_matrix(Vl[:, 1:2]) + cur_b_vec
         cur_u_dreachset.alpha_range = prev_u.alpha_range
         cur_u_dreachset.beta_range = prev_u.beta_range
 
@@ -49,15 +54,17 @@ class ReachSetAssembler(object):
         # prev_e = alpha * Vn + beta * ln
         # e[n] = A * e[n-1] + b[n]
 
-        assert isinstance(matrix_a, csc_matrix)
+        assert isinstance(matrix_a, (csc_matrix, Operator))
         assert isinstance(prev_e, DReachSet)
         assert isinstance(cur_b_set, DReachSet)
         assert matrix_a.shape[0] == cur_b_set.Vn.shape[0] == prev_e.Vn.shape[0] \
           == cur_b_set.ln.shape[0] == prev_e.ln.shape[0], 'inconsistent'
 
+        Vl = Operator.from_matrix(matrix_a).matmat(np.hstack((to_array(prev_e.Vn), to_array(prev_e.ln))))
+
         cur_err_dreachset = DReachSet()
-        cur_err_dreachset.Vn = matrix_a * prev_e.Vn + cur_b_set.Vn
-        cur_err_dreachset.ln = matrix_a * prev_e.ln + cur_b_set.ln
+        cur_err_dreachset.Vn = csc_matrix(Vl[:, 0:1]) + cur_b_set.Vn
+        cur_err_dreachset.ln = csc_matrix(Vl[:, 1:2]) + cur_b_set.ln
         cur_err_dreachset.alpha_range = prev_e.alpha_range
         cur_err_dreachset.beta_range = prev_e.beta_range
 
@@ -69,82 +76,229 @@ class ReachSetAssembler(object):
 
         assert isinstance(dPde, DPdeAutomaton)
 
-        def get_V1_l1(V, l, xlist):
-            '\int (u_n(x) p_i(x))dx = alpha * V1 + beta * l1'
-
-            assert isinstance(V, csc_matrix)
-            assert isinstance(l, csc_matrix)
-            assert V.shape == l.shape
-            n = V.shape[0]
-            assert n == len(xlist) - 2
-
-            V1 = lil_matrix((n, 1), dtype=float)
-            l1 = lil_matrix((n, 1), dtype=float)
-            for i in xrange(0, n):
-                hi = xlist[i + 1] - xlist[i]
-                hi_plus_1 = xlist[i + 2] - xlist[i + 1]
-                if i == 0:
-                    V1[i, 0] = V[i, 0] * (hi / 3 + hi_plus_1 / 3) + V[i + 1, 0] * hi_plus_1 / 6
-                    l1[i, 0] = l[i, 0] * (hi / 3 + hi_plus_1 / 3) + l[i + 1, 0] * hi_plus_1 / 6
-                elif i == n - 1:
-                    V1[i, 0] = V[i, 0] * (hi / 3 + hi_plus_1 / 3) + V[i - 1, 0] * hi / 6
-                    l1[i, 0] = l[i, 0] * (hi / 3 + hi_plus_1 / 3) + l[i - 1, 0] * hi / 6
-                elif 0 < i < n - 1:
-                    V1[i, 0] = V[i, 0] * (hi / 3 + hi_plus_1 / 3) + V[i - 1, 0] * hi / 6 + V[i + 1, 0] * hi_plus_1 / 6
-                    l1[i, 0] = l[i, 0] * (hi / 3 + hi_plus_1 / 3) + l[i - 1, 0] * hi / 6 + l[i + 1, 0] * hi_plus_1 / 6
-
-            return V1, l1
+        cur_b_vec = dPde.get_load_vector(cur_time)    # read from the load timeline, not re-integrated
+
+        return ReachSetAssembler.get_be(pre_u, cur_u, dPde, dPde.inv_b_matrix, cur_b_vec)
+
+    @staticmethod
+    def get_be(pre_u, cur_u, dPde, inv_b_matrix, cur_b_vec):
+        'compute be[n] of a step with the operator inv(B) and the load vector of that step'
+
+        # \int (u_n(x) p_i(x))dx = alpha * V1 + beta * l1 with V1 = M * Vn, l1 = M * ln, M is the mass matrix
+        mass_mat = dPde.mesh.get_mass_operator()
+        assert pre_u.Vn.shape == pre_u.ln.shape == cur_u.Vn.shape == (mass_mat.shape[0], 1)
 
         cur_be = DReachSet()
-        pre_V1, pre_l1 = get_V1_l1(pre_u.Vn, pre_u.ln, dPde.xlist)
-        cur_V1, cur_l1 = get_V1_l1(cur_u.Vn, cur_u.ln, dPde.xlist)
+        pre_V1 = mass_mat * pre_u.Vn
+        pre_l1 = mass_mat * pre_u.ln
+        cur_V1 = mass_mat * cur_u.Vn
+        cur_l1 = mass_mat * cur_u.ln
 
-        cur_b_vec = Fem1D.load_assembler(dPde.xlist, dPde.f_xdom, dPde.time_step, cur_time)
-        cur_be.Vn = dPde.inv_b_matrix * (pre_V1 - cur_V1)
-        cur_be.ln = dPde.inv_b_matrix * (cur_b_vec + pre_l1 - cur_l1)
+        cur_be.Vn = inv_b_matrix * (pre_V1 - cur_V1)
+        cur_be.ln = inv_b_matrix * (cur_b_vec + pre_l1 - cur_l1)
         cur_be.alpha_range = dPde.alpha_range
         cur_be.beta_range = dPde.beta_range
 
         return cur_be
 
     @staticmethod
-    def get_dreachset(dPde, toTimeStep):
-        'compute approximate discrete reachable set of u and e and the bloated u + e'
+    def get_step_err(cur_be):
+        'largest |alpha * Vn + beta * ln| of be[n] over the corners of the perturbation box'
+
+        Vn = to_array(cur_be.Vn)
+        ln = to_array(cur_be.ln)
+
+        return max([np.max(np.abs(alpha * Vn + beta * ln)) for alpha in cur_be.alpha_range for beta in cur_be.beta_range])
+
+    @staticmethod
+    def get_bloated_dreachset(dPde, u_dreachset, err_dreachset):
+        'bloated set u + e of a step'
+
+        bloated_dreachset = DReachSet()
+        bloated_dreachset.set_reach_set(dPde.alpha_range, dPde.beta_range, u_dreachset.Vn + err_dreachset.Vn,
+                                        u_dreachset.ln + err_dreachset.ln)
+
+        return bloated_dreachset
+
+    @staticmethod
+    def get_init_dreachset(dPde):
+        'reachable sets of u, e and the bloated u + e at step 0'
+
+        assert isinstance(dPde, DPdeAutomaton)
+
+        return BlockPropagator(dPde).get_dreachsets()
+
+    @staticmethod
+    def get_next_dreachset(dPde, cur_time, prev_u, prev_e):
+        'reachable sets of u, e and the bloated u + e at step cur_time from those of step cur_time - 1'
 
+        assert isinstance(dPde, DPdeAutomaton)
+
+        propagator = BlockPropagator(dPde)
+        propagator.set_block(prev_u, prev_e)
+        propagator.step(dPde.get_load_vector(cur_time))    # read from the load timeline, not re-integrated
+
+        return propagator.get_dreachsets()
+
+    @staticmethod
+    def iter_dreachset(dPde, toTimeStep):
+        'generator of (u, e, bloated u + e) of the steps 0, 1, ..., toTimeStep'
+
+        # the generators of u and e are propagated in one dense block, see engine.propagation. Only
+        # the current step and one chunk of load vectors are kept, a step is computed when the consumer
+        # asks for it
         assert isinstance(dPde, DPdeAutomaton)
         assert isinstance(toTimeStep, int) and toTimeStep >= 0
 
+        propagator = BlockPropagator(dPde)
+        yield propagator.get_dreachsets()
+
+        for loads in dPde.iter_load_chunks(1, toTimeStep):
+            for j in xrange(0, loads.shape[1]):
+                propagator.step(loads[:, j])
+                yield propagator.get_dreachsets()
+
+    @staticmethod
+    def get_dreachset(dPde, toTimeStep):
+        'compute approximate discrete reachable set of u and e and the bloated u + e'
+
         u_dreachset_list = []
         err_dreachset_list = []
         bloated_dreachset_list = []
+        for u_dreachset, err_dreachset, bloated_dreachset in ReachSetAssembler.iter_dreachset(dPde, toTimeStep):
+            u_dreachset_list.append(u_dreachset)
+            err_dreachset_list.append(err_dreachset)
+            bloated_dreachset_list.append(bloated_dreachset)
+
+        return u_dreachset_list, err_dreachset_list, bloated_dreachset_list
+
+    @staticmethod
+    def iter_dreachset_adaptive(dPde, final_time, err_tol, max_step=None, min_step=None):
+        'generator of (u, e, bloated u + e, t[n]) on an adaptive time grid t[0] = 0 < t[1] < ... < t[N] = final_time'
+
+        # be[n] is the error made by step n (see get_cur_be), its size is about k * |du/dt|, so its sum over
+        # the steps does not depend on k. The steps are controlled by the change of be instead:
+        # |be[n] - k[n] / k[n-1] * be[n-1]| is about k^2 * |d2u/dt2|. A step is rejected and retried with
+        # k / 2 if it is > err_tol, the next step is 2 * k if it is < err_tol / 4. The first step is
+        # dPde.time_step. The steps are dPde.time_step * 2^j, so the cache of factorized step operators of
+        # dPde is reused (only the last step, cut at final_time, can have another size).
+
+        assert isinstance(dPde, DPdeAutomaton)
+        assert dPde.load_kind == 'interval', 'adaptive time stepping is only available for the heat equation'
+        assert final_time > 0, 'invalid final_time'
+        assert err_tol > 0, 'invalid err_tol'
+
+        if max_step is None:
+            max_step = 64 * dPde.time_step
+        if min_step is None:
+            min_step = dPde.time_step / 64
+
+        propagator = BlockPropagator(dPde)
+        yield propagator.get_dreachsets() + (0.0,)
+
+        k = dPde.time_step
+        t = 0.0
+        prev_step = None
+        while t < final_time * (1.0 - 1e-12):
+            cur_step = min(k, final_time - t)
+            matrix_a, inv_b_matrix = dPde.get_step_operators(cur_step)
+            propagator.step(dPde.get_interval_load_vector([t, t + cur_step]), matrix_a, inv_b_matrix)
+            if prev_step is None:
+                step_err = 0.0
+            else:
+                step_err = propagator.get_step_err(dPde.alpha_range, dPde.beta_range, cur_step / prev_step)
+
+            if step_err > err_tol and cur_step / 2 >= min_step:
+                propagator.undo()    # reject the step
+                k = k / 2
+                continue
 
-        for cur_time in xrange(0, toTimeStep + 1):
-            err_dreachset = DReachSet()
-            u_dreachset = DReachSet()
-            if cur_time == 0:
-                u_Vn = dPde.init_vector
-                u_ln = csc_matrix((dPde.init_vector.shape[0], 1), dtype=float)
-                err_Vn = csc_matrix((dPde.init_vector.shape[0], 1), dtype=float)
-                err_ln = csc_matrix((dPde.init_vector.shape[0], 1), dtype=float)
-                u_dreachset.set_reach_set(dPde.alpha_range, dPde.beta_range, u_Vn, u_ln)
-                err_dreachset.set_reach_set(dPde.alpha_range, dPde.beta_range, err_Vn, err_ln)
+            t = t + cur_step
+            prev_step = cur_step
+            if step_err < err_tol / 4 and 2 * k <= max_step:
+                k = 2 * k
 
+            if t < final_time * (1.0 - 1e-12):
+                yield propagator.get_dreachsets() + (t,)
             else:
-                cur_b_vec = Fem1D.load_assembler(dPde.xlist, dPde.f_xdom, dPde.time_step, cur_time)
-                u_dreachset = ReachSetAssembler.get_cur_u_dreachset(dPde.matrix_a, \
-                                                                        u_dreachset_list[cur_time - 1], cur_b_vec)
+                yield propagator.get_dreachsets() + (float(final_time),)
 
-                cur_be = ReachSetAssembler.get_cur_be(u_dreachset_list[cur_time - 1], u_dreachset, dPde, cur_time)
-                err_dreachset = ReachSetAssembler.get_cur_err_dreachset(dPde.matrix_a, err_dreachset_list[cur_time - 1], cur_be)
+    @staticmethod
+    def get_dreachset_adaptive(dPde, final_time, err_tol, max_step=None, min_step=None):
+        'compute u, e and the bloated u + e on an adaptive time grid, return the lists and the time grid'
 
+        u_dreachset_list = []
+        err_dreachset_list = []
+        bloated_dreachset_list = []
+        time_list = []
+        for u_dreachset, err_dreachset, bloated_dreachset, t in \
+          ReachSetAssembler.iter_dreachset_adaptive(dPde, final_time, err_tol, max_step, min_step):
             u_dreachset_list.append(u_dreachset)
             err_dreachset_list.append(err_dreachset)
-
-            bloated_dreachset = DReachSet()
-            bloated_dreachset.set_reach_set(dPde.alpha_range, dPde.beta_range, u_dreachset.Vn + err_dreachset.Vn, u_dreachset.ln + err_dreachset.ln)
             bloated_dreachset_list.append(bloated_dreachset)
+            time_list.append(t)
 
-        return u_dreachset_list, err_dreachset_list, bloated_dreachset_list
+        return u_dreachset_list, err_dreachset_list, bloated_dreachset_list, time_list
+
+    @staticmethod
+    def jump_dreachset(dPde, toTimeStep):
+        'reachable sets of u, e and the bloated u + e at step toTimeStep only, computed in sine space'
+
+        # on a uniform mesh with linear elements M, K, A and inv(B) are diagonal in sine space with the
+        # eigenvalues mu, kappa, a = (mu - k/2 * kappa) / (mu + k/2 * kappa) and g = 1 / (mu + k/2 * kappa).
+        # Every mode is independent: Vn = a^N * V0, e.Vn = N * a^(N-1) * g * mu * (1 - a) * V0, and the
+        # ln columns of u and e follow a scalar recurrence per mode driven by the transformed loads.
+        # The same values as get_dreachset(dPde, toTimeStep)[i][-1] are obtained with three DSTs.
+
+        assert isinstance(dPde, DPdeAutomaton)
+        assert isinstance(toTimeStep, int) and toTimeStep >= 0
+        assert dPde.load_kind == 'interval', 'jump_dreachset is only available for the heat equation'
+        assert dPde.mesh.order == 1 and dPde.mesh.is_uniform(), 'jump_dreachset needs a uniform mesh and linear elements'
+
+        k = dPde.time_step
+        mu = dPde.mesh.get_mass_stencil().get_sine_eigenvalues()
+        kappa = dPde.mesh.get_stiff_stencil().get_sine_eigenvalues()
+        g = 1.0 / (mu + kappa * (k / 2))
+        a = (mu - kappa * (k / 2)) * g
+
+        N = toTimeStep
+        V0 = SineTransformOperator.transform(to_array(dPde.init_vector))[:, 0]
+
+        u_V = np.power(a, N) * V0
+        e_V = N * np.power(a, N - 1) * g * mu * (1 - a) * V0 if N >= 1 else np.zeros(V0.shape)
+        u_l = np.zeros(V0.shape)
+        e_l = np.zeros(V0.shape)
+        for chunk in dPde.iter_load_chunks(1, N):
+            loads = SineTransformOperator.transform(chunk)
+            for j in xrange(0, loads.shape[1]):
+                prev_u_l = u_l
+                u_l = a * u_l + loads[:, j]
+                e_l = a * e_l + g * (loads[:, j] + mu * (prev_u_l - u_l))
+
+        Vl = SineTransformOperator.inverse_transform(np.vstack((u_V, u_l, e_V, e_l)).T)
+
+        u_dreachset = DReachSet()
+        err_dreachset = DReachSet()
+        bloated_dreachset = DReachSet()
+        u_dreachset.set_reach_set(dPde.alpha_range, dPde.beta_range, csc_matrix(Vl[:, 0:1]), csc_matrix(Vl[:, 1:2]))
+        err_dreachset.set_reach_set(dPde.alpha_range, dPde.beta_range, csc_matrix(Vl[:, 2:3]), csc_matrix(Vl[:, 3:4]))
+        bloated_dreachset.set_reach_set(dPde.alpha_range, dPde.beta_range, csc_matrix(Vl[:, 0:1] + Vl[:, 2:3]),
+                                        csc_matrix(Vl[:, 1:2] + Vl[:, 3:4]))
+
+        return u_dreachset, err_dreachset, bloated_dreachset
+
+    @staticmethod
+    def iter_interpolationset(dPde, toTimeStep):
+        'generator of the interpolation sets of the steps 0, 1, ..., toTimeStep, see iter_interpolate_dreachset'
+
+        return ReachSetAssembler.iter_interpolate_dreachset(dPde, ReachSetAssembler.iter_dreachset(dPde, toTimeStep))
+
+    @staticmethod
+    def iter_interpolationset_adaptive(dPde, final_time, err_tol, max_step=None, min_step=None):
+        'generator of the interpolation sets of the steps of an adaptive time grid, see iter_interpolate_dreachset'
+
+        return ReachSetAssembler.iter_interpolate_dreachset(
+            dPde, ReachSetAssembler.iter_dreachset_adaptive(dPde, final_time, err_tol, max_step, min_step))
 
     @staticmethod
     def get_interpolationset(dPde, toTimeStep):
@@ -153,28 +307,108 @@ class ReachSetAssembler(object):
         assert isinstance(dPde, DPdeAutomaton)
         assert isinstance(toTimeStep, int) and toTimeStep >= 0
 
-        u_dset, e_dset, bl_dset = ReachSetAssembler.get_dreachset(dPde, toTimeStep)
-        n = len(u_dset)
-        u_setinspace_list = []    # interpolation set of u set in space
-        e_setinspace_list = []    # interpolation set of error set in space
-        bl_setinspace_list = []    # interpolation set of bloated set in space
-        u_set_list = []    # interpolation set of u in both time and space
-        e_set_list = []    # interpolation set of error set in both time and space
-        bl_set_list = []    # interpolation set of bloated set in both time and space
+        return ReachSetAssembler.collect_interpolationset(ReachSetAssembler.iter_interpolationset(dPde, toTimeStep))
+
+    @staticmethod
+    def get_interpolationset_adaptive(dPde, final_time, err_tol, max_step=None, min_step=None):
+        'compute the interpolation set in both space and time on an adaptive time grid, also return the time grid'
+
+        u_dset, e_dset, bl_dset, time_list = ReachSetAssembler.get_dreachset_adaptive(dPde, final_time, err_tol,
+                                                                                        max_step, min_step)
+        intpl_sets = ReachSetAssembler.interpolate_dreachset(dPde, u_dset, e_dset, bl_dset, time_list)
+
+        return intpl_sets + (time_list,)
+
+    @staticmethod
+    def iter_interpolate_dreachset(dPde, dreachsets):
+        'generator of the interpolation sets in space and in both space and time of discrete reachable sets'
+
+        # dreachsets is an iterable of (u, e, bloated) on the uniform time grid t[n] = n * dPde.time_step
+        # or of (u, e, bloated, t[n]) (see iter_dreachset and iter_dreachset_adaptive). Step n gives
+        # (u, e, bloated) interpolated in space followed by (u, e, bloated) interpolated on the slab
+        # [t[n-1], t[n]], the last three are None for n = 0. Only the previous step is kept.
+        # The interpolation sets are piecewise linear in space, so quadratic elements are refused: their
+        # solution between the nodes is not bounded by the nodal values
+        assert dPde.mesh.order == 1, 'interpolation sets need linear elements, the mesh has order {}'.format(dPde.mesh.order)
+        prev = None
+        for i, sets in enumerate(dreachsets):
+            dsets = sets[0:3]
+            inspace_sets = tuple([Interpolation.interpolate_in_space(dPde.xlist, dset.Vn.todense(), dset.ln.todense())
+                                  for dset in dsets])
+            cur_time = sets[3] if len(sets) == 4 else None
+
+            if prev is None:
+                yield inspace_sets + (None, None, None)
+            else:
+                prev_dsets, prev_inspace_sets, prev_time = prev
+                if cur_time is None:
+                    step = dPde.time_step
+                    start_time = None
+                else:
+                    step = float(cur_time - prev_time)
+                    start_time = float(prev_time)
+                yield inspace_sets + tuple([Interpolation.increm_interpolation(step, i, prev_inspace_sets[k],
+                                                                              inspace_sets[k], prev_dsets[k],
+                                                                              dsets[k], start_time)
+                                            for k in xrange(0, 3)])
+
+            prev = (dsets, inspace_sets, cur_time)
 
-        # interpolation set in space
-        for i in xrange(0, n):
-            u_setinspace_list.append(Interpolation.interpolate_in_space(dPde.xlist, u_dset[i].Vn.todense(), u_dset[i].ln.todense()))
-            e_setinspace_list.append(Interpolation.interpolate_in_space(dPde.xlist, e_dset[i].Vn.todense(), e_dset[i].ln.todense()))
-            bl_setinspace_list.append(Interpolation.interpolate_in_space(dPde.xlist, bl_dset[i].Vn.todense(), bl_dset[i].ln.todense()))
+    @staticmethod
+    def iter_bloated_interpolationset(dPde, dreachsets):
+        'generator of the interpolation sets of the bloated set on the slabs [t[n-1], t[n]], n = 1, 2, ...'
+
+        # dreachsets as in iter_interpolate_dreachset, only the bloated set is interpolated. A consumer
+        # that stops early (see Verifier.check_safety) does not pay for the remaining steps
+        assert dPde.mesh.order == 1, 'interpolation sets need linear elements, the mesh has order {}'.format(dPde.mesh.order)
+        prev = None
+        for i, sets in enumerate(dreachsets):
+            cur_bl = sets[2]
+            cur_bl_inspace = Interpolation.interpolate_in_space(dPde.xlist, cur_bl.Vn.todense(), cur_bl.ln.todense())
+            cur_time = sets[3] if len(sets) == 4 else None
+
+            if prev is not None:
+                prev_bl, prev_bl_inspace, prev_time = prev
+                if cur_time is None:
+                    yield Interpolation.increm_interpolation(dPde.time_step, i, prev_bl_inspace, cur_bl_inspace,
+                                                             prev_bl, cur_bl)
+                else:
+                    yield Interpolation.increm_interpolation(float(cur_time - prev_time), i, prev_bl_inspace,
+                                                             cur_bl_inspace, prev_bl, cur_bl, float(prev_time))
+
+            prev = (cur_bl, cur_bl_inspace, cur_time)
+
+    @staticmethod
+    def get_bloated_intpl_sets(dPde, toTimeStep):
+        'generator of the interpolation sets of the bloated set on the slabs [t[n-1], t[n]], n = 1, ..., toTimeStep'
+
+        return ReachSetAssembler.iter_bloated_interpolationset(dPde, ReachSetAssembler.iter_dreachset(dPde, toTimeStep))
+
+    @staticmethod
+    def collect_interpolationset(intpl_sets):
+        'lists (u, e, bloated in space, u, e, bloated in space and time) of the items of iter_interpolate_dreachset'
+
+        lists = ([], [], [], [], [], [])
+        for sets in intpl_sets:
+            for k in xrange(0, 6):
+                if sets[k] is not None:
+                    lists[k].append(sets[k])
+
+        return lists
+
+    @staticmethod
+    def interpolate_dreachset(dPde, u_dset, e_dset, bl_dset, time_list=None):
+        'interpolation sets in space and in both space and time of discrete reachable sets'
 
-        # interpolation set in both space and time
-        for i in xrange(1, n):
-            u_set_list.append(Interpolation.increm_interpolation(dPde.time_step, i, u_setinspace_list[i - 1], u_setinspace_list[i]))
-            e_set_list.append(Interpolation.increm_interpolation(dPde.time_step, i, e_setinspace_list[i - 1], e_setinspace_list[i]))
-            bl_set_list.append(Interpolation.increm_interpolation(dPde.time_step, i, bl_setinspace_list[i - 1], bl_setinspace_list[i]))
+        # time_list = None means the uniform time grid t[n] = n * dPde.time_step
+        assert time_list is None or len(time_list) == len(u_dset), 'inconsistent time_list'
 
-        return u_setinspace_list, e_setinspace_list, bl_setinspace_list, u_set_list, e_set_list, bl_set_list
+        if time_list is None:
+            dreachsets = zip(u_dset, e_dset, bl_dset)
+        else:
+            dreachsets = zip(u_dset, e_dset, bl_dset, time_list)
+
+        return ReachSetAssembler.collect_interpolationset(ReachSetAssembler.iter_interpolate_dreachset(dPde, dreachsets))
 
 
 class VerificationResult(object):
@@ -188,6 +422,7 @@ class VerificationResult(object):
         self.unsafe_trace_funcs = []    # u(x,t) at unsafe_x_point is a list of functions of t
 
         self.step = None    # time step
+        self.time_list = None    # time grid t[0], t[1], ..., it is not uniform with adaptive time stepping
         self.safety_specification = None    # used for plotting the result
 
     def generate_numerical_trace(self):
@@ -197,16 +432,20 @@ class VerificationResult(object):
         assert isinstance(self.unsafe_trace_funcs, list) and self.unsafe_trace_funcs != []
 
         n = len(self.unsafe_trace_funcs)
+        if self.time_list is not None:
+            grid = self.time_list
+        else:
+            grid = [j * self.step for j in xrange(0, n + 1)]
         time_list = []
         u_list = []
         for j in xrange(0, n):
             func = self.unsafe_trace_funcs[j]
-            time_list.append(j * self.step)
+            time_list.append(grid[j])
             u_list.append(func([time_list[j]]))
 
-        time_list.append(n * self.step)
+        time_list.append(grid[n])
         func = self.unsafe_trace_funcs[n - 1]
-        u_list.append(func([n * self.step]))
+        u_list.append(func([grid[n]]))
 
         return (time_list, u_list)
 
@@ -228,9 +467,30 @@ class Verifier(object):
 
         self.result = VerificationResult()
 
-    def check_safety(self, dPde, safety_specification):
+    @staticmethod
+    def find_violation(bounds, u1, u2):
+        'first cell whose bounds violate u1 <= u <= u2, return (u, [t, x, alpha, beta]) where it is reached or None'
+
+        # bounds = (min_vec, min_points, max_vec, max_points) of the cells, u1 or u2 can be None
+        min_vec, min_points, max_vec, max_points = bounds
+        below = min_vec < u1 if u1 is not None else np.zeros(min_vec.shape, dtype=bool)
+        above = max_vec > u2 if u2 is not None else np.zeros(max_vec.shape, dtype=bool)
+        unsafe_cells = np.flatnonzero(below | above)
+        if unsafe_cells.shape[0] == 0:
+            return None
+
+        i = unsafe_cells[0]
+        if below[i]:
+            return float(min_vec[i]), [float(v) for v in min_points[i]]
+
+        return float(max_vec[i]), [float(v) for v in max_points[i]]
+
+    def check_safety(self, dPde, safety_specification, err_tol=None):
         'verify safety of Pde automaton'
 
+        # with err_tol, the reachable set is computed with adaptive time stepping up to t_range[1],
+        # see ReachSetAssembler.get_dreachset_adaptive, otherwise with the uniform step dPde.time_step
+
         assert isinstance(dPde, DPdeAutomaton)
         assert isinstance(safety_specification, SafetySpecification)
 
@@ -240,6 +500,8 @@ class Verifier(object):
         self.result.step = step
         self.result.safety_specification = safety_specification
         assert xlist is not None, 'empty dPde'
+        assert dPde.mesh.order == 1, 'check_safety needs linear elements, the bounds of quadratic ones are not sound'
+        assert dPde.has_exact_solver(), 'check_safety needs exact solves, the error of an iterative solver is not in e'
         x_range = safety_specification.x_range
 
         if x_range[0] < xlist[0] or x_range[1] > xlist[len(xlist) - 1]:
@@ -253,9 +515,6 @@ class Verifier(object):
         T1 = safety_specification.t_range[0]
         T2 = safety_specification.t_range[1]
 
-        end_time_step = int(math.ceil(T2 / step))
-        start_time_step = int(math.floor(T1 / step))
-
         m = len(xlist)
         for i in xrange(1, m):
             if xlist[i - 1] <= x1 < xlist[i]:
@@ -273,138 +532,59 @@ class Verifier(object):
                 end_point = m - 2 - i
                 break
 
-        # compute continuous reachable set
-        _, _, _, _, _, bloated_set = ReachSetAssembler.get_interpolationset(dPde, end_time_step)
-
-        # decompose x1 x2 into list of x_range
-        x_range_list = []
-
-        for i in xrange(start_point, end_point):
-            if i == start_point:
-                x_range_list.append((x1, xlist[start_point + 1]))
-            elif i == end_point - 1:
-                x_range_list.append((xlist[end_point - 1], x2))
-            elif start_point < i < end_point - 1:
-                x_range_list.append((xlist[i], xlist[i + 1]))
-
-        # decompose T1, T2 into list of t_range
-        t_range_list = []
-        for j in xrange(start_time_step, end_time_step + 1):
-            if j == start_time_step:
-                t_range_list.append((T1, (start_time_step + 1) * step))
-            elif j == end_time_step:
-                t_range_list.append(((end_time_step - 1) * step, T2))
-            elif start_time_step < j < end_time_step:
-                t_range_list.append((j * step, (j + 1) * step))
-
-        # check safety
-        print "\nstart_time_step = {}".format(start_time_step)
-        print "\nend_time_step = {}".format(end_time_step)
-        for j in xrange(start_time_step, end_time_step):
-            print "\n j = {}".format(j)
-            bl_set = bloated_set[j]
-            time_range = t_range_list[j - start_time_step]
-            print "\ntime_range = {}".format(time_range)
-
-            for i in xrange(start_point, end_point):
-                print "\ni = {}".format(i)
-                x_range = x_range_list[i - start_point]
-                print "\nx_range = {}".format(x_range)
-
-                min_func = Functions.intpl_in_time_and_space_func(step, bl_set.delta_a_vec[i],
-                                                                  bl_set.delta_b_vec[i],
-                                                                  bl_set.delta_gamma_a_vec[i],
-                                                                  bl_set.delta_gamma_b_vec[i],
-                                                                  bl_set.delta_c_vec[i],
-                                                                  bl_set.delta_d_vec[i],
-                                                                  bl_set.delta_gamma_c_vec[i],
-                                                                  bl_set.delta_gamma_d_vec[i])
-
-                max_func = Functions.intpl_in_time_and_space_func(step, - bl_set.delta_a_vec[i],
-                                                                  - bl_set.delta_b_vec[i],
-                                                                  - bl_set.delta_gamma_a_vec[i],
-                                                                  - bl_set.delta_gamma_b_vec[i],
-                                                                  - bl_set.delta_c_vec[i],
-                                                                  - bl_set.delta_d_vec[i],
-                                                                  - bl_set.delta_gamma_c_vec[i],
-                                                                  - bl_set.delta_gamma_d_vec[i])
-
-                x0 = [time_range[0], x_range[0], dPde.alpha_range[0], dPde.beta_range[0]]
-
-                bnds = (time_range, x_range, dPde.alpha_range, dPde.beta_range)
-
-                min_res = minimize(
-                    min_func,
-                    x0,
-                    method='L-BFGS-B',
-                    bounds=bnds,
-                    tol=1e-10, options={'disp': False})    # add options={'disp': True} to display optimization result
-                max_res = minimize(
-                    max_func,
-                    x0,
-                    method='L-BFGS-B',
-                    bounds=bnds,
-                    tol=1e-10, options={'disp': False})    # add  options={'disp': True} to display optimization result
-
-                min_points = []
-                max_points = []
-                if min_res.status == 0:
-                    min_value = min_res.fun
-                    min_points.append(min_res.x)
-                else:
-                    print "\nmin_res.status = {}".format(min_res.status)
-                    print "\nminimization message: {}".format(min_res.message)
-                    raise ValueError(
-                        'minimization for interpolation function fail!')
-
-                if max_res.status == 0:
-                    max_value = -max_res.fun
-                    max_points.append(max_res.x)
-                else:
-                    print "\nmax_res.status = {}".format(max_res.status)
-                    print "\nmaximization message: {}".format(max_res.message)
-                    raise ValueError(
-                        'maximization for interpolation function fail!')
-
-                if u1 is not None and u2 is not None:
-                    if min_value < u1:
-                        self.result.status = 'Unsafe'
-                        self.result.unsafe_u_point = min_value
-                        feas_sol = min_points
-                        break
-                    elif max_value > u2:
-                        self.result.status = 'Unsafe'
-                        self.result.unsafe_u_point = max_value
-                        feas_sol = max_points
-                        break
-                elif u1 is None and u2 is not None:
-                    if max_value > u2:
-                        self.result.status = 'Unsafe'
-                        self.result.unsafe_u_point = max_value
-                        feas_sol = max_points
-                        break
-                elif u1 is not None and u2 is None:
-                    if min_value < u1:
-                        self.result.status = 'Unsafe'
-                        self.result.unsafe_u_point = min_value
-                        feas_sol = min_points
-                        break
-
-            if self.result.status == 'Unsafe':
-                fs = feas_sol[0]
-                self.result.unsafe_time_point = fs[0]
-                self.result.unsafe_x_point = fs[1]
-                alpha_value = fs[2]
-                beta_value = fs[3]
-                print "\nfeas_solution = {}".format(feas_sol)
+        # compute the interpolation sets of the bloated set slab by slab, the propagation stops at the
+        # first unsafe slab. The slabs are not kept, they are computed again for the unsafe trace
+        def iter_bloated_sets():
+            'interpolation sets of the bloated set on the slabs'
+            if err_tol is None:
+                return ReachSetAssembler.get_bloated_intpl_sets(dPde, int(math.ceil(T2 / step)))
+            dreachsets = ReachSetAssembler.iter_dreachset_adaptive(dPde, T2, err_tol)
+            return ReachSetAssembler.iter_bloated_interpolationset(dPde, dreachsets)
+
+        time_list = [0.0]    # time grid of the computed slabs
+        self.result.time_list = time_list
+
+        # boxes [t, x, alpha, beta] of the cells [x[i], x[i + 1]], i = start_point, ..., end_point - 1, cut at x1, x2
+        cells = np.arange(start_point, end_point)
+        lower = np.zeros((cells.shape[0], 4), dtype=float)
+        upper = np.zeros((cells.shape[0], 4), dtype=float)
+        lower[:, 1] = np.maximum(np.asarray(xlist, dtype=float)[cells], x1)
+        upper[:, 1] = np.minimum(np.asarray(xlist, dtype=float)[cells + 1], x2)
+        lower[:, 2], upper[:, 2] = dPde.alpha_range
+        lower[:, 3], upper[:, 3] = dPde.beta_range
+
+        # check safety, U(x, t) is multilinear in (t, x, alpha, beta): its bounds on a box are reached
+        # at the vertices of the box, so all cells of a slab are checked by one vectorized evaluation
+        witness = None
+        for bl_set in iter_bloated_sets():
+            time_list.append(bl_set.end_time)
+            if bl_set.end_time <= T1:
+                continue
+
+            lower[:, 0] = max(bl_set.start_time, T1)
+            upper[:, 0] = min(bl_set.end_time, T2)
+            func = Functions.intpl_in_time_and_space_func_vec(bl_set.step, bl_set.delta_a_vec[cells, None],
+                                                              bl_set.delta_b_vec[cells, None],
+                                                              bl_set.delta_gamma_a_vec[cells, None],
+                                                              bl_set.delta_gamma_b_vec[cells, None],
+                                                              bl_set.delta_c_vec[cells, None],
+                                                              bl_set.delta_d_vec[cells, None],
+                                                              bl_set.delta_gamma_c_vec[cells, None],
+                                                              bl_set.delta_gamma_d_vec[cells, None])
+            witness = Verifier.find_violation(BoundKernel.get_box_bounds(func, lower, upper), u1, u2)
+            if witness is not None:
                 break
 
         # return safe or unsafe and unsafe trace which is a list of function of t
         self.result.unsafe_trace_funcs = []
-        if self.result.status == 'Unsafe':
-            for j in xrange(0, end_time_step):
-                bl_set = bloated_set[j]
-                self.result.unsafe_trace_funcs.append(bl_set.get_trace_func(alpha_value, beta_value, self.result.unsafe_x_point))
+        if witness is not None:
+            u_value, point = witness
+            self.result.status = 'Unsafe'
+            self.result.unsafe_u_point = u_value
+            self.result.unsafe_time_point = point[0]
+            self.result.unsafe_x_point = point[1]
+            for bl_set in itertools.islice(iter_bloated_sets(), len(time_list) - 1):
+                self.result.unsafe_trace_funcs.append(bl_set.get_trace_func(point[2], point[3], point[1]))
         else:
             self.result.status = 'Safe'
 
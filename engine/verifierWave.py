@@ -5,18 +5,17 @@ Tianshu Bao: Jun/2018
 '''
 
 from scipy.sparse import csc_matrix, lil_matrix
-from scipy.optimize import minimize
 from engine.pde_automaton import DPdeAutomaton
+from engine.linear_operator import Operator, to_array
 from engine.set import DReachSet
 from engine.interpolation_wave import Interpolation
 from engine.femwave import Fem1Dw
 from engine.functions import Functions
+from engine.bounds import BoundKernel
 from engine.specification import SafetySpecification
-from engine.plot import Plot
+import itertools
 import math
 import numpy as np
-import matplotlib.pyplot as plt
-from sympy import Function
 
 class ReachSetAssembler(object):
     'compute all necessary reachable sets'
@@ -30,14 +29,17 @@ class ReachSetAssembler(object):
     def get_cur_u_dreachset(matrix_a, prev_u, cur_b_vec):
         'compute the current approximate discrete reachable set of u, cur_b_vec = g_n = [0,0,0...0, (b_n + b_(n-1))k/2]^T'
 
-        assert isinstance(matrix_a, csc_matrix)
+        assert isinstance(matrix_a, (csc_matrix, Operator))
         assert isinstance(prev_u, DReachSet)
         assert isinstance(cur_b_vec, csc_matrix) and cur_b_vec.shape[1] == 1, 'invalid current vector b'
         assert matrix_a.shape[0] == cur_b_vec.shape[0] == prev_u.Vn.shape[0] == prev_u.ln.shape[0]
 
+        # Vn and ln are propagated together with one matmat of the operator
+        Vl = Operator.from_matrix(matrix_a).matmat(np.hstack((to_array(prev_u.Vn), to_array(prev_u.ln))))
+
         cur_u_dreachset = DReachSet()
-        cur_u_dreachset.Vn = matrix_a * prev_u.Vn
-        cur_u_dreachset.ln = matrix_a * prev_u.ln + cur_b_vec
+        cur_u_dreachset.Vn = csc_matrix(Vl[:, 0:1])
+        cur_u_dreachset.ln = csc_matrix(Vl[:, 1:2]) + cur_b_vec
         cur_u_dreachset.alpha_range = prev_u.alpha_range
         cur_u_dreachset.beta_range = prev_u.beta_range
 
@@ -47,103 +49,158 @@ class ReachSetAssembler(object):
     def get_cur_err_dreachset(matrix_a, prev_e, cur_b_vec):
         'compute the current approximate discreate reachable set of error e'
 
-        assert isinstance(matrix_a, csc_matrix)
+        assert isinstance(matrix_a, (csc_matrix, Operator))
         assert isinstance(prev_e, DReachSet)
         assert isinstance(cur_b_vec, csc_matrix)
         assert matrix_a.shape[0] == cur_b_vec.shape[0] == prev_e.Vn.shape[0] == prev_e.ln.shape[0], 'inconsistent'
 
+        Vl = Operator.from_matrix(matrix_a).matmat(np.hstack((to_array(prev_e.Vn), to_array(prev_e.ln))))
+
         cur_err_dreachset = DReachSet()
-        cur_err_dreachset.Vn = matrix_a * prev_e.Vn
-        cur_err_dreachset.ln = matrix_a * prev_e.ln + cur_b_vec
+        cur_err_dreachset.Vn = csc_matrix(Vl[:, 0:1])
+        cur_err_dreachset.ln = csc_matrix(Vl[:, 1:2]) + cur_b_vec
         cur_err_dreachset.alpha_range = prev_e.alpha_range
         cur_err_dreachset.beta_range = prev_e.beta_range
 
         return cur_err_dreachset
 
     @staticmethod
-    def get_cur_be(prev_u, curr_u, dPde, cur_time):
+    def get_cur_be(prev_u, curr_u, dPde, cur_time, load_timeline=None):
         'compute b[n], e[n] = A * e[n-1] + be[n]'
 
+        # load_timeline holds the steps cur_time - 1 and cur_time, None = the stored timeline of dPde
         assert isinstance(dPde, DPdeAutomaton)
 
-        cur_b_vec = Fem1Dw.load_assembler_err(dPde.xlist, dPde.f_xdom, dPde.time_step, cur_time, prev_u, curr_u)
+        if load_timeline is None:
+            load_timeline = dPde.get_load_timeline(cur_time)
+        cur_b_vec = Fem1Dw.load_assembler_err(dPde.mesh, dPde.f_xdom, dPde.time_step, cur_time, prev_u, curr_u,
+                                              dPde.mass_solver, load_timeline)
 	
         return cur_b_vec
 
     @staticmethod
-    def get_dreachset(dPde, toTimeStep):
-        'compute approximate discrete reachable set of u and e and the bloated u + e'
+    def get_bloated_dreachset(dPde, u_dreachset, err_dreachset):
+        'bloated set u + e of a step'
+
+        bloated_dreachset = DReachSet()
+        bloated_dreachset.set_reach_set(dPde.alpha_range, dPde.beta_range, u_dreachset.Vn + err_dreachset.Vn,
+                                        u_dreachset.ln + err_dreachset.ln)
+
+        return bloated_dreachset
+
+    @staticmethod
+    def get_init_dreachset(dPde):
+        'reachable sets of u, e and the bloated u + e at step 0'
 
+        assert isinstance(dPde, DPdeAutomaton)
+
+        n = dPde.init_vector.shape[0]
+        u_dreachset = DReachSet()
+        err_dreachset = DReachSet()
+        u_dreachset.set_reach_set(dPde.alpha_range, dPde.beta_range, dPde.init_vector, csc_matrix((n, 1), dtype=float))
+        err_dreachset.set_reach_set(dPde.alpha_range, dPde.beta_range, csc_matrix((n, 1), dtype=float),
+                                    csc_matrix((n, 1), dtype=float))
+
+        return u_dreachset, err_dreachset, ReachSetAssembler.get_bloated_dreachset(dPde, u_dreachset, err_dreachset)
+
+    @staticmethod
+    def get_next_dreachset(dPde, cur_time, prev_u, prev_e, load_timeline=None):
+        'reachable sets of u, e and the bloated u + e at step cur_time from those of step cur_time - 1'
+
+        # load_timeline holds the steps cur_time - 1 and cur_time, None = the stored timeline of dPde
+        cur_g_vec = dPde.get_load_vector(cur_time, load_timeline)    # read from the load timeline
+        u_dreachset = ReachSetAssembler.get_cur_u_dreachset(dPde.matrix_a, prev_u, cur_g_vec)
+        cur_be = ReachSetAssembler.get_cur_be(prev_u, u_dreachset, dPde, cur_time, load_timeline)
+        err_dreachset = ReachSetAssembler.get_cur_err_dreachset(dPde.matrix_a, prev_e, cur_be)
+
+        return u_dreachset, err_dreachset, ReachSetAssembler.get_bloated_dreachset(dPde, u_dreachset, err_dreachset)
+
+    @staticmethod
+    def iter_dreachset(dPde, toTimeStep):
+        'generator of (u, e, bloated u + e) of the steps 0, 1, ..., toTimeStep'
+
+        # only the current step and one chunk of load vectors are kept, a step is computed when the
+        # consumer asks for it. The chunks overlap by one step, g[n] and be[n] need b(t[n-1]) and b(t[n])
         assert isinstance(dPde, DPdeAutomaton)
         assert isinstance(toTimeStep, int) and toTimeStep >= 0
 
+        u_dreachset, err_dreachset, bloated_dreachset = ReachSetAssembler.get_init_dreachset(dPde)
+        yield u_dreachset, err_dreachset, bloated_dreachset
+
+        cur_time = 1
+        for timeline in dPde.iter_load_timelines(0, toTimeStep, overlap=1):
+            while cur_time <= min(timeline.num_steps, toTimeStep):
+                u_dreachset, err_dreachset, bloated_dreachset = ReachSetAssembler.get_next_dreachset(
+                    dPde, cur_time, u_dreachset, err_dreachset, timeline)
+                yield u_dreachset, err_dreachset, bloated_dreachset
+                cur_time += 1
+
+    @staticmethod
+    def get_dreachset(dPde, toTimeStep):
+        'compute approximate discrete reachable set of u and e and the bloated u + e'
+
         u_dreachset_list = []
         err_dreachset_list = []
         bloated_dreachset_list = []
+        for u_dreachset, err_dreachset, bloated_dreachset in ReachSetAssembler.iter_dreachset(dPde, toTimeStep):
+            u_dreachset_list.append(u_dreachset)
+            err_dreachset_list.append(err_dreachset)
+            bloated_dreachset_list.append(bloated_dreachset)
 
-        for cur_time in xrange(0, toTimeStep + 1):
-            u_dreachset = DReachSet()
-            if cur_time == 0:
-                u_Vn = dPde.init_vector
-                u_ln = csc_matrix((dPde.init_vector.shape[0], 1), dtype=float)
-                u_dreachset.set_reach_set(dPde.alpha_range, dPde.beta_range, u_Vn, u_ln)
+        return u_dreachset_list, err_dreachset_list, bloated_dreachset_list
 
-            else:
-                cur_g_vec = Fem1Dw.load_assembler(dPde.xlist, dPde.f_xdom, dPde.time_step, cur_time)
-                u_dreachset = ReachSetAssembler.get_cur_u_dreachset(dPde.matrix_a, u_dreachset_list[cur_time - 1], cur_g_vec)																	
-	    u_dreachset_list.append(u_dreachset)									
-	 
-
-        for cur_time in xrange(0, toTimeStep + 1):
-	    err_dreachset = DReachSet()
-            if cur_time == 0:
-		err_Vn = csc_matrix((dPde.init_vector.shape[0], 1), dtype=float)
-		err_ln = csc_matrix((dPde.init_vector.shape[0], 1), dtype=float)
-		err_dreachset.set_reach_set(dPde.alpha_range, dPde.beta_range, err_Vn, err_ln)
+    @staticmethod
+    def get_bloated_intpl_sets(dPde, toTimeStep):
+        'generator of the interpolation sets of the bloated set on the slabs [t[n-1], t[n]], n = 1, ..., toTimeStep'
+
+        # the steps are computed one at a time when the next slab is requested, only the bloated set is
+        # interpolated
+        prev_bl = None
+        for cur_time, (_, _, cur_bl) in enumerate(ReachSetAssembler.iter_dreachset(dPde, toTimeStep)):
+            cur_bl_inspace = Interpolation.interpolate_in_space(dPde.xlist, cur_bl.Vn.todense(), cur_bl.ln.todense())
+            if prev_bl is not None:
+                yield Interpolation.increm_interpolation(dPde.time_step, cur_time, prev_bl_inspace, cur_bl_inspace,
+                                                         prev_bl, cur_bl)
+            prev_bl = cur_bl
+            prev_bl_inspace = cur_bl_inspace
 
+    @staticmethod
+    def iter_interpolationset(dPde, toTimeStep):
+        'generator of the interpolation sets of the steps 0, 1, ..., toTimeStep'
+
+        # step n gives (u, e, bloated) interpolated in space followed by (u, e, bloated) interpolated on
+        # the slab [t[n-1], t[n]], the last three are None for n = 0. Only the previous step is kept
+        prev = None
+        for i, dsets in enumerate(ReachSetAssembler.iter_dreachset(dPde, toTimeStep)):
+            inspace_sets = tuple([Interpolation.interpolate_in_space(dPde.xlist, dset.Vn.todense(), dset.ln.todense())
+                                  for dset in dsets])
+            if prev is None:
+                yield inspace_sets + (None, None, None)
             else:
-		cur_be = ReachSetAssembler.get_cur_be(u_dreachset_list[cur_time - 1], u_dreachset, dPde, cur_time)
-		err_dreachset = ReachSetAssembler.get_cur_err_dreachset(dPde.matrix_a, err_dreachset_list[cur_time - 1], cur_be)																
-	    
-	    err_dreachset_list.append(err_dreachset)
-	    bloated_dreachset = DReachSet()
-            bloated_dreachset.set_reach_set(dPde.alpha_range, dPde.beta_range, u_dreachset_list[cur_time].Vn + err_dreachset.Vn, u_dreachset_list[cur_time].ln + err_dreachset.ln)
-	    bloated_dreachset_list.append(bloated_dreachset)
-
-
-        return u_dreachset_list, err_dreachset_list, bloated_dreachset_list
+                prev_dsets, prev_inspace_sets = prev
+                yield inspace_sets + tuple([Interpolation.increm_interpolation(dPde.time_step, i, prev_inspace_sets[k],
+                                                                              inspace_sets[k], prev_dsets[k],
+                                                                              dsets[k]) for k in xrange(0, 3)])
+            prev = (dsets, inspace_sets)
 
     @staticmethod
     def get_interpolationset(dPde, toTimeStep):
         'compute the interpolation set in both space and time'
 
-        assert isinstance(dPde, DPdeAutomaton)
-        assert isinstance(toTimeStep, int) and toTimeStep >= 0
-
-        u_dset, e_dset, bl_dset = ReachSetAssembler.get_dreachset(dPde, toTimeStep)
-        n = len(u_dset)
-
-
         u_setinspace_list = []    # interpolation set of u set in space
         e_setinspace_list = []    # interpolation set of error set in space
         bl_setinspace_list = []    # interpolation set of bloated set in space
         u_set_list = []    # interpolation set of u in both time and space
         e_set_list = []    # interpolation set of error set in both time and space
         bl_set_list = []    # interpolation set of bloated set in both time and space
+        lists = (u_setinspace_list, e_setinspace_list, bl_setinspace_list, u_set_list, e_set_list, bl_set_list)
 
-        # interpolation set in space
-        for i in xrange(0, n):
-            u_setinspace_list.append(Interpolation.interpolate_in_space(dPde.xlist, u_dset[i].Vn.todense(), u_dset[i].ln.todense()))
-            e_setinspace_list.append(Interpolation.interpolate_in_space(dPde.xlist, e_dset[i].Vn.todense(), e_dset[i].ln.todense()))
-            bl_setinspace_list.append(Interpolation.interpolate_in_space(dPde.xlist, bl_dset[i].Vn.todense(), bl_dset[i].ln.todense()))
-
-        # interpolation set in both space and time
-        for i in xrange(1, n):
-            u_set_list.append(Interpolation.increm_interpolation(dPde.time_step, i, u_setinspace_list[i - 1], u_setinspace_list[i], u_dset[i - 1], u_dset[i]))
-            e_set_list.append(Interpolation.increm_interpolation(dPde.time_step, i, e_setinspace_list[i - 1], e_setinspace_list[i], e_dset[i - 1], e_dset[i]))
-            bl_set_list.append(Interpolation.increm_interpolation(dPde.time_step, i, bl_setinspace_list[i - 1], bl_setinspace_list[i], bl_dset[i - 1], bl_dset[i]))
+        for sets in ReachSetAssembler.iter_interpolationset(dPde, toTimeStep):
+            for k in xrange(0, 6):
+                if sets[k] is not None:
+                    lists[k].append(sets[k])
 
-        return u_setinspace_list, e_setinspace_list, bl_setinspace_list, u_set_list, e_set_list, bl_set_list
+        return lists
 
 class VerificationResult(object):
     'Result object for verification'
@@ -196,6 +253,24 @@ class Verifier(object):
 
         self.result = VerificationResult()
 
+    @staticmethod
+    def find_violation(bounds, u1, u2):
+        'first cell whose bounds violate u1 <= u <= u2, return (u, [t, x, alpha, beta]) where it is reached or None'
+
+        # bounds = (min_vec, min_points, max_vec, max_points) of the cells, u1 or u2 can be None
+        min_vec, min_points, max_vec, max_points = bounds
+        below = min_vec < u1 if u1 is not None else np.zeros(min_vec.shape, dtype=bool)
+        above = max_vec > u2 if u2 is not None else np.zeros(max_vec.shape, dtype=bool)
+        unsafe_cells = np.flatnonzero(below | above)
+        if unsafe_cells.shape[0] == 0:
+            return None
+
+        i = unsafe_cells[0]
+        if below[i]:
+            return float(min_vec[i]), [float(v) for v in min_points[i]]
+
+        return float(max_vec[i]), [float(v) for v in max_points[i]]
+
     def check_safety(self, dPde, safety_specification):
         'verify safety of Pde automaton'
 
@@ -221,9 +296,6 @@ class Verifier(object):
         T1 = safety_specification.t_range[0]
         T2 = safety_specification.t_range[1]
 
-        end_time_step = int(math.ceil(T2 / step))
-        start_time_step = int(math.floor(T1 / step))
-
         m = len(xlist)
         for i in xrange(1, m):
             if xlist[i - 1] <= x1 < xlist[i]:
@@ -241,144 +313,59 @@ class Verifier(object):
                 end_point = m - 2 - i
                 break
 
-        # compute continuous reachable set
-        _, _, _, _, _, bloated_set = ReachSetAssembler.get_interpolationset(dPde, end_time_step)
-
-        # decompose x1 x2 into list of x_range
-        x_range_list = []
-
-        for i in xrange(start_point, end_point):
-            if i == start_point:
-                x_range_list.append((x1, xlist[start_point + 1]))
-            elif i == end_point - 1:
-                x_range_list.append((xlist[end_point - 1], x2))
-            elif start_point < i < end_point - 1:
-                x_range_list.append((xlist[i], xlist[i + 1]))
-
-        # decompose T1, T2 into list of t_range
-        t_range_list = []
-        for j in xrange(start_time_step, end_time_step + 1):
-            if j == start_time_step:
-                t_range_list.append((T1, (start_time_step + 1) * step))
-            elif j == end_time_step:
-                t_range_list.append(((end_time_step - 1) * step, T2))
-            elif start_time_step < j < end_time_step:
-                t_range_list.append((j * step, (j + 1) * step))
-
-        # check safety
-        print "\nstart_time_step = {}".format(start_time_step)
-        print "\nend_time_step = {}".format(end_time_step)
-        for j in xrange(start_time_step, end_time_step):
-            print "\n j = {}".format(j)
-            bl_set = bloated_set[j]
-            time_range = t_range_list[j - start_time_step]
-            print "\ntime_range = {}".format(time_range)
-
-            for i in xrange(start_point, end_point):
-                print "\ni = {}".format(i)
-                x_range = x_range_list[i - start_point]
-                print "\nx_range = {}".format(x_range)
-
-                min_func = Functions.intpl_in_time_and_space_func(step, bl_set.delta_a_vec[i],
-                                                                  bl_set.delta_b_vec[i],
-                                                                  bl_set.delta_gamma_a_vec[i],
-                                                                  bl_set.delta_gamma_b_vec[i],
-                                                                  bl_set.delta_c_vec[i],
-                                                                  bl_set.delta_d_vec[i],
-                                                                  bl_set.delta_gamma_c_vec[i],
-                                                                  bl_set.delta_gamma_d_vec[i])
-
-                max_func = Functions.intpl_in_time_and_space_func(step, - bl_set.delta_a_vec[i],
-                                                                  - bl_set.delta_b_vec[i],
-                                                                  - bl_set.delta_gamma_a_vec[i],
-                                                                  - bl_set.delta_gamma_b_vec[i],
-                                                                  - bl_set.delta_c_vec[i],
-                                                                  - bl_set.delta_d_vec[i],
-                                                                  - bl_set.delta_gamma_c_vec[i],
-                                                                  - bl_set.delta_gamma_d_vec[i])
-
-                x0 = [time_range[0], x_range[0], dPde.alpha_range[0], dPde.beta_range[0]]
-
-                bnds = (time_range, x_range, dPde.alpha_range, dPde.beta_range)
-
-                min_res = minimize(
-                    min_func,
-                    x0,
-                    method='L-BFGS-B',
-                    bounds=bnds,
-                    tol=1e-10, options={'disp': False})    # add options={'disp': True} to display optimization result
-                max_res = minimize(
-                    max_func,
-                    x0,
-                    method='L-BFGS-B',
-                    bounds=bnds,
-                    tol=1e-10, options={'disp': False})    # add  options={'disp': True} to display optimization result
-
-                min_points = []
-                max_points = []
-                if min_res.status == 0:
-                    min_value = min_res.fun
-                    min_points.append(min_res.x)
-                else:
-                    print "\nmin_res.status = {}".format(min_res.status)
-                    print "\nminimization message: {}".format(min_res.message)
-                    raise ValueError(
-                        'minimization for interpolation function fail!')
-
-                if max_res.status == 0:
-                    max_value = -max_res.fun
-                    max_points.append(max_res.x)
-                else:
-                    print "\nmax_res.status = {}".format(max_res.status)
-                    print "\nmaximization message: {}".format(max_res.message)
-                    raise ValueError(
-                        'maximization for interpolation function fail!')
-
-                if u1 is not None and u2 is not None:
-                    if min_value < u1:
-                        self.result.status = 'Unsafe'
-                        self.result.unsafe_u_point = min_value
-                        feas_sol = min_points
-                        break
-                    elif max_value > u2:
-                        self.result.status = 'Unsafe'
-                        self.result.unsafe_u_point = max_value
-                        feas_sol = max_points
-                        break
-                elif u1 is None and u2 is not None:
-                    if max_value > u2:
-                        self.result.status = 'Unsafe'
-                        self.result.unsafe_u_point = max_value
-                        feas_sol = max_points
-                        break
-                elif u1 is not None and u2 is None:
-                    if min_value < u1:
-                        self.result.status = 'Unsafe'
-                        self.result.unsafe_u_point = min_value
-                        feas_sol = min_points
-                        break
-
-            if self.result.status == 'Unsafe':
-                fs = feas_sol[0]
-                self.result.unsafe_time_point = fs[0]
-                self.result.unsafe_x_point = fs[1]
-                alpha_value = fs[2]
-                beta_value = fs[3]
-                print "\nfeas_solution = {}".format(feas_sol)
+        # compute the interpolation sets of the bloated set slab by slab, the propagation stops at the
+        # first unsafe slab. The slabs are not kept, they are computed again for the unsafe trace
+        end_time_step = int(math.ceil(T2 / step))
+        start_time_step = int(math.floor(T1 / step))
+
+        # boxes [t, x, alpha, beta] of the cells [x[i], x[i + 1]], i = start_point, ..., end_point - 1, cut at x1, x2
+        cells = np.arange(start_point, end_point)
+        lower = np.zeros((cells.shape[0], 4), dtype=float)
+        upper = np.zeros((cells.shape[0], 4), dtype=float)
+        lower[:, 1] = np.maximum(np.asarray(xlist, dtype=float)[cells], x1)
+        upper[:, 1] = np.minimum(np.asarray(xlist, dtype=float)[cells + 1], x2)
+        lower[:, 2], upper[:, 2] = dPde.alpha_range
+        lower[:, 3], upper[:, 3] = dPde.beta_range
+
+        # check safety, all cells of a slab at once with the exact bounds at the vertices of the boxes
+        witness = None
+        for j, bl_set in enumerate(ReachSetAssembler.get_bloated_intpl_sets(dPde, end_time_step)):
+            if j < start_time_step:
+                continue
+
+            lower[:, 0] = max(j * step, T1)
+            upper[:, 0] = min((j + 1) * step, T2)
+            func = Functions.intpl_in_time_and_space_func_vec(step, bl_set.delta_a_vec[cells, None],
+                                                              bl_set.delta_b_vec[cells, None],
+                                                              bl_set.delta_gamma_a_vec[cells, None],
+                                                              bl_set.delta_gamma_b_vec[cells, None],
+                                                              bl_set.delta_c_vec[cells, None],
+                                                              bl_set.delta_d_vec[cells, None],
+                                                              bl_set.delta_gamma_c_vec[cells, None],
+                                                              bl_set.delta_gamma_d_vec[cells, None])
+            witness = Verifier.find_violation(BoundKernel.get_box_bounds(func, lower, upper), u1, u2)
+            if witness is not None:
                 break
 
         # return safe or unsafe and unsafe trace which is a list of function of t
         self.result.unsafe_trace_funcs = []
-        if self.result.status == 'Unsafe':
-            for j in xrange(0, end_time_step):
-                bl_set = bloated_set[j]
-                self.result.unsafe_trace_funcs.append(bl_set.get_trace_func(alpha_value, beta_value, self.result.unsafe_x_point))
+        if witness is not None:
+            u_value, point = witness
+            self.result.status = 'Unsafe'
+            self.result.unsafe_u_point = u_value
+            self.result.unsafe_time_point = point[0]
+            self.result.unsafe_x_point = point[1]
+            for bl_set in itertools.islice(ReachSetAssembler.get_bloated_intpl_sets(dPde, end_time_step), j + 1):
+                self.result.unsafe_trace_funcs.append(bl_set.get_trace_func(point[2], point[3], point[1]))
         else:
             self.result.status = 'Safe'
 
         return self.result
 		
 if __name__ == '__main__':
+	import matplotlib.pyplot as plt
+	from engine.plot import Plot
+
 	FEM = Fem1Dw()
 	mesh_points = [0.0, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5, 5.0]    # generate mesh points
 	step = 0.1    # time step of FEM
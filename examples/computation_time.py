@@ -6,7 +6,10 @@ Dung Tran: Dec/2017
 
 from engine.fem import Fem1D
 from engine.verifier import ReachSetAssembler
+from engine.cache import AssemblyCache
 import numpy as np
+import os
+import tempfile
 import time
 
 
@@ -36,9 +39,11 @@ def store_data(x_data, y_data, x_y_name, file_name):
         data_file.write("    {: < 28} {: < 28}\n".format(x_data[i], y_data[i]))
 
 
-def computationtime_vs_nummeshpoint():
+def computationtime_vs_nummeshpoint(cache=None):
     'measure reachability analysis computation time for time range [0, 10s] with different number of mesh points'
 
+    # cache = engine.cache.AssemblyCache of the assembled automata, None = no cache
+
     ##################################################
     # generate dPde automaton
     L = 10.0    # length of rod
@@ -59,7 +64,7 @@ def computationtime_vs_nummeshpoint():
         time_grid = np.arange(0, toTimeStep + 1, step=1)
         time_list = np.multiply(time_grid, step)
         xlist = mesh_points[1: mesh_points.shape[0] - 1]
-        dPde = Fem1D().get_dPde_automaton(mesh_points.tolist(), x_dom, step)
+        dPde = Fem1D().get_dPde_automaton(mesh_points.tolist(), x_dom, step, cache=cache)
 
         dPde.set_perturbation(alpha_range, beta_range)
 
@@ -76,9 +81,11 @@ def computationtime_vs_nummeshpoint():
     store_data(num_mesh_points, computation_time, ['number of mesh points', 'computation time'], 'computationtime_vs_nummeshpoints.dat')
 
 
-def computationtime_vs_numtimesteps():
+def computationtime_vs_numtimesteps(cache=None):
     'measure reachability analysis computation time for time range [0, 10s] with different number of time steps'
 
+    # cache = engine.cache.AssemblyCache of the assembled automata, None = no cache
+
     ##################################################
     # generate dPde automaton
     L = 10.0    # length of rod
@@ -101,7 +108,7 @@ def computationtime_vs_numtimesteps():
         time_grid = np.arange(0, toTimeStep + 1, step=1)
         time_list = np.multiply(time_grid, step)
         print "\ntime_list = {}".format(time_list)
-        dPde = Fem1D().get_dPde_automaton(mesh_points.tolist(), x_dom, step)
+        dPde = Fem1D().get_dPde_automaton(mesh_points.tolist(), x_dom, step, cache=cache)
         dPde.set_perturbation(alpha_range, beta_range)
 
         ############################################################
@@ -116,5 +123,7 @@ def computationtime_vs_numtimesteps():
 
 if __name__ == '__main__':
 
-    computationtime_vs_nummeshpoint()
-    computationtime_vs_numtimesteps()
+    # assembled automata are stored in a temporary directory, a second run of the script skips the assembly
+    assembly_cache = AssemblyCache(16, os.path.join(tempfile.gettempdir(), 'pde_assembly_cache'))
+    computationtime_vs_nummeshpoint(assembly_cache)
+    computationtime_vs_numtimesteps(assembly_cache)
@@ -0,0 +1,59 @@
+'''
+This script measures the import time of the engine modules and checks it against a budget
+
+Each module is imported in a fresh python process, so the numbers are what a short-lived
+verification job pays at startup. Headless numerical runs should not load sympy,
+matplotlib or scipy.optimize: these are imported by the engine only when they are used.
+'''
+
+import subprocess
+import sys
+
+IMPORT_TIME_BUDGET = 0.5    # seconds allowed for importing one engine module
+
+ENGINE_MODULES = ['engine.fem', 'engine.femwave', 'engine.functions', 'engine.interpolation',
+                  'engine.verifier', 'engine.verifierWave']
+
+DEFERRED_MODULES = ['sympy', 'matplotlib', 'scipy.optimize']
+
+MEASURE_SCRIPT = '''
+import sys, time
+start = time.time()
+import {}
+end = time.time()
+print(end - start)
+print(','.join([m for m in {} if m in sys.modules]))
+'''
+
+
+def measure_import_time(module_name):
+    'import module_name in a fresh python process, return import time and loaded deferred modules'
+
+    script = MEASURE_SCRIPT.format(module_name, DEFERRED_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', script])
+    lines = output.decode().strip().split('\n')
+    loaded = [m for m in lines[1].split(',') if m != ''] if len(lines) > 1 else []
+
+    return float(lines[0]), loaded
+
+
+def check_import_time_budget():
+    'measure the import time of all engine modules, return False if one of them is over budget'
+
+    within_budget = True
+    for module_name in ENGINE_MODULES:
+        import_time, loaded = measure_import_time(module_name)
+        status = 'ok'
+        if import_time > IMPORT_TIME_BUDGET or loaded != []:
+            status = 'OVER BUDGET'
+            within_budget = False
+
+        print "\n{: <24} {:.3f} s    {}    eagerly loaded: {}".format(module_name, import_time, status, loaded)
+
+    return within_budget
+
+
+if __name__ == '__main__':
+
+    if not check_import_time_budget():
+        sys.exit(1)
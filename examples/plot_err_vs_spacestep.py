@@ -7,6 +7,7 @@ import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 from engine.fem import Fem1D
 from engine.verifier import ReachSetAssembler
+from engine.interpolation import Interpolation
 from engine.plot import Plot
 import numpy as np
 
@@ -48,8 +49,10 @@ if __name__ == '__main__':
         ############################################################
         # compute error dicrete reachable set
         RSA = ReachSetAssembler()
-        _, e_inspace, _, _, _, _ = RSA.get_interpolationset(dPde, toTimeStep)
-        e_boxes = e_inspace[toTimeStep].get_2D_boxes(alpha_range, beta_range)
+        for _, e_set, _ in RSA.iter_dreachset(dPde, toTimeStep):
+            pass    # only the error set of the last step is interpolated
+        e_inspace = Interpolation.interpolate_in_space(dPde.xlist, e_set.Vn.todense(), e_set.ln.todense())
+        e_boxes = e_inspace.get_2D_boxes(alpha_range, beta_range)
 
         ax1 = pl1.plot_boxes(ax1, e_boxes, facecolor=colors[j], edgecolor=colors[j])
 
@@ -47,11 +47,10 @@ if __name__ == '__main__':
 
         ############################################################
         RSA = ReachSetAssembler()
-        _, e_dset, _ = RSA.get_dreachset(dPde, toTimeStep)    # compute discrete reachable set
         e_lines_at_x_8_list = []
 
-        for i in xrange(0, toTimeStep + 1):
-            e_lines_at_x_8, _, _, _, _ = e_dset[i].get_lines_set()
+        for _, e_set, _ in RSA.iter_dreachset(dPde, toTimeStep):    # compute discrete reachable set step by step
+            e_lines_at_x_8, _, _, _, _ = e_set.get_lines_set()
             e_lines_at_x_8_list.append(e_lines_at_x_8[x_ind])
 
         ax3 = pl3.plot_vlines(ax3, time_list.tolist(), e_lines_at_x_8_list, colors=colors[j], linestyles='solid')
@@ -9,9 +9,145 @@ import time
 import math
 from scipy import sparse
 from scipy.integrate import odeint
+from scipy.linalg import cholesky_banded, cho_solve_banded
 import numpy as np
 
 
+class TensorGridOperator(object):
+    """Kronecker-sum operator A = T_0 + ... + T_(D-1) on a tensor-product grid"""
+
+    # the state variables are the points of a grid of shape (n_0, ..., n_(D-1)) in C order, the last axis
+    # (x) varies fastest. T_d couples the neighbours along axis d with the constant coefficient
+    # couplings[d] and has the diagonal diagonals[d], an array broadcastable to the grid shape. If each
+    # diagonal only varies along its own axis A is a Kronecker sum of 1D operators, otherwise (a heat
+    # source on a part of a face) T_d is still a set of independent tridiagonal lines along axis d.
+    # Only the 1D coefficients are stored, A is applied and stepped in O(N) without assembling it.
+
+    def __init__(self, grid_shape, couplings, diagonals):
+
+        assert len(grid_shape) == len(couplings) == len(diagonals), 'inconsistent number of axes'
+
+        self.grid_shape = tuple([int(n) for n in grid_shape])
+        self.num_var = int(np.prod(self.grid_shape))
+        self.shape = (self.num_var, self.num_var)
+        self.couplings = [float(coeff) for coeff in couplings]
+        self.diagonals = [np.broadcast_to(np.asarray(diag, dtype=float), self.grid_shape) for diag in diagonals]
+
+    def multiply(self, factor):
+        'return the operator factor * A'
+
+        return TensorGridOperator(self.grid_shape, [factor * coeff for coeff in self.couplings],
+                                  [factor * diag for diag in self.diagonals])
+
+    def apply_axis(self, axis, grid_vec):
+        'T_axis * u, grid_vec has the grid shape (+ one trailing axis for a block of vectors)'
+
+        diag = self.diagonals[axis]
+        if grid_vec.ndim > len(self.grid_shape):
+            diag = diag[..., None]
+
+        res = diag * grid_vec
+        front = [slice(None)] * grid_vec.ndim
+        back = [slice(None)] * grid_vec.ndim
+        front[axis] = slice(0, -1)
+        back[axis] = slice(1, None)
+        res[tuple(front)] += self.couplings[axis] * grid_vec[tuple(back)]
+        res[tuple(back)] += self.couplings[axis] * grid_vec[tuple(front)]
+
+        return res
+
+    def dot(self, vec):
+        'A * vec, vec is an array of shape (N,) or (N, m)'
+
+        vec = np.asarray(vec, dtype=float)
+        grid_vec = vec.reshape(self.grid_shape + vec.shape[1:])
+        res = self.apply_axis(0, grid_vec)
+        for axis in xrange(1, len(self.grid_shape)):
+            res += self.apply_axis(axis, grid_vec)
+
+        return res.reshape(vec.shape)
+
+    def __mul__(self, vec):
+        return self.dot(vec)
+
+    def tocsr(self):
+        'assembled sparse matrix of A'
+
+        matrix = sparse.diags(np.sum(self.diagonals, axis=0).ravel(), 0, format='csr')
+        for axis, num in enumerate(self.grid_shape):
+            coeff = self.couplings[axis]
+            line = sparse.diags([coeff * np.ones(num - 1), coeff * np.ones(num - 1)], [-1, 1])
+            num_before = int(np.prod(self.grid_shape[0:axis]))
+            num_after = int(np.prod(self.grid_shape[axis + 1:]))
+            matrix = matrix + sparse.kron(sparse.kron(sparse.identity(num_before), line),
+                                          sparse.identity(num_after), format='csr')
+
+        return matrix.tocsr()
+
+    def get_adi_step(self, time_step):
+        'Douglas ADI step of du/dt = A * u + f, see ADIStep'
+
+        return ADIStep(self, time_step)
+
+
+class ADIStep(object):
+    """Douglas alternating direction implicit step of du/dt = A * u + f for a TensorGridOperator"""
+
+    # the Crank-Nicolson step (I - k/2 * A) u[n+1] = (I + k/2 * A) u[n] + k * f is split along the axes:
+    #     (I - k/2 * T_0) v_0 = u[n] + k * (A * u[n] + f) - k/2 * T_0 * u[n]
+    #     (I - k/2 * T_d) v_d = v_(d-1) - k/2 * T_d * u[n],  d = 1, ..., D - 1,  u[n+1] = v_(D-1)
+    # It is second order in time, unconditionally stable for the heat benchmarks (every T_d is
+    # symmetric negative semidefinite) and keeps the steady states of the Crank-Nicolson step. Each
+    # I - k/2 * T_d is a set of tridiagonal lines, it is factorized once as one banded Cholesky
+    # factorization with the grid reordered so that axis d varies fastest, a step is O(N).
+
+    def __init__(self, operator, time_step):
+
+        assert isinstance(operator, TensorGridOperator)
+        assert time_step > 0, 'invalid time step'
+
+        self.operator = operator
+        self.time_step = time_step
+        self.factors = []    # banded Cholesky factor of I - k/2 * T_d in the ordering with axis d last
+        for axis, num in enumerate(operator.grid_shape):
+            diag = np.moveaxis(operator.diagonals[axis], axis, -1).ravel()
+            off_diag = np.full((operator.num_var,), -time_step / 2 * operator.couplings[axis])
+            off_diag[0::num] = 0.0    # no coupling between the lines
+            ab = np.vstack((off_diag, 1.0 - time_step / 2 * diag))
+            self.factors.append(cholesky_banded(ab, lower=False))
+
+    def solve_axis(self, axis, grid_vec):
+        'solve (I - k/2 * T_axis) w = grid_vec along the lines of axis'
+
+        lines = np.moveaxis(grid_vec, axis, len(self.operator.grid_shape) - 1)
+        moved_shape = lines.shape
+        res = cho_solve_banded((self.factors[axis], False), lines.reshape(self.operator.num_var, -1))
+
+        return np.moveaxis(res.reshape(moved_shape), len(self.operator.grid_shape) - 1, axis)
+
+    def step(self, vec, input_vec=None):
+        'u[n+1] from u[n] = vec, an array of shape (N,) or (N, m), input_vec is f (constant on the step)'
+
+        op = self.operator
+        k = self.time_step
+        vec = np.asarray(vec, dtype=float)
+        grid_vec = vec.reshape(op.grid_shape + vec.shape[1:])
+
+        axis_terms = [op.apply_axis(axis, grid_vec) for axis in xrange(0, len(op.grid_shape))]
+        rhs = grid_vec + k * np.sum(axis_terms, axis=0)
+        if input_vec is not None:
+            input_vec = np.asarray(input_vec, dtype=float)
+            if vec.ndim > input_vec.ndim:
+                input_vec = input_vec.reshape(input_vec.shape + (1,))
+            rhs = rhs + k * input_vec.reshape(op.grid_shape + input_vec.shape[1:])
+
+        res = rhs
+        for axis in xrange(0, len(op.grid_shape)):
+            res = self.solve_axis(axis, res - k / 2 * axis_terms[axis])
+
+        return res.reshape(vec.shape)
+
+
 class HeatOneDimension(object):
     """Generate ODEs from 1-d diffusion heat equation"""
 
@@ -99,6 +235,15 @@ class HeatTwoDimension1(object):
 
     def get_odes(self, num_x, num_y):
         'obtain linear model of the benchmark'
+
+        matrix_a, matrix_b = self.get_tensor_odes(num_x, num_y)
+
+        return matrix_a.tocsr(), matrix_b
+
+    def get_tensor_odes(self, num_x, num_y):
+        'obtain linear model of the benchmark with matrix_a as a TensorGridOperator'
+
+        # the i-th state variable is the temperature at the mesh point (x_pos, y_pos), i = y_pos * num_x + x_pos
         assert isinstance(
             num_x, int), "number of mesh point should be an integer"
         assert isinstance(
@@ -115,49 +260,27 @@ class HeatTwoDimension1(object):
         print "\ndiscretization step along y-axis is: {} cm\n".format(disc_step_y)
 
         num_var = num_x * num_y  # number of discrezation state variables
-        # changing the sparsity structure of a csr_matrix is expensive.
-        # lil_matrix is more efficient
-        matrix_a = sparse.lil_matrix((num_var, num_var))
-        matrix_b = sparse.lil_matrix((num_var, 3))
-
         a = 1 / disc_step_x**2
         b = 1 / disc_step_y**2
-        c = -2 * (a + b)
         k = self.heat_lost_const
         step_x = disc_step_x
 
-        # fill matrix_a
+        # along x-axis
+        diag_x = np.full((num_x,), -2 * a)
+        diag_x[0] += a
+        diag_x[-1] += a / (1 + k * step_x)    # diffusion term
+        # along y-axis
+        diag_y = np.full((num_y,), -2 * b)
+        diag_y[-1] += b
+        matrix_a = TensorGridOperator((num_y, num_x), [b, a], [diag_y[:, None], diag_x[None, :]])
 
-        for i in xrange(0, num_var):
-            matrix_a[i, i] = c    # filling diagonal
-            x_pos = i % num_x     # x-position corresponding to i-th state variable
-            y_pos = int((i - x_pos) / num_x)
-            print "the {}th variable is the temperature at the mesh point ({},{})".format(i, x_pos, y_pos)
-            # fill along x - axis
-            if x_pos - 1 >= 0:
-                matrix_a[i, i - 1] = a
-            else:
-                matrix_a[i, i] = matrix_a[i, i] + a
-                matrix_b[i, 0] = math.sqrt(a)
-            if x_pos + 1 <= num_x - 1:
-                matrix_a[i, i + 1] = a
-            else:
-                # fill diffusion term
-                matrix_a[i, i] = matrix_a[i, i] + a / (1 + k * step_x)
-                matrix_b[i, 2] = a * (k * step_x) / (1 + k * step_x)
-            # fill along y-axis
-            if y_pos - 1 >= 0:
-                matrix_a[i, (y_pos - 1) * num_x + x_pos] = b
-            else:
-                matrix_b[i, 1] = b
+        matrix_b = np.zeros((num_y, num_x, 3))
+        matrix_b[:, 0, 0] = math.sqrt(a)
+        matrix_b[:, -1, 2] = a * (k * step_x) / (1 + k * step_x)
+        matrix_b[0, :, 1] = b
 
-            if y_pos + 1 <= num_y - 1:
-                matrix_a[i, (y_pos + 1) * num_x + x_pos] = b
-            else:
-                matrix_a[i, i] = matrix_a[i, i] + b
-
-        return self.diffusity_const * \
-            (matrix_a.tocsr()), self.diffusity_const * (matrix_b.tocsr())
+        return matrix_a.multiply(self.diffusity_const), \
+            self.diffusity_const * sparse.csr_matrix(matrix_b.reshape(num_var, 3))
 
 
 class HeatTwoDimension2(object):
@@ -210,6 +333,14 @@ class HeatTwoDimension2(object):
     def get_odes(self, num_x, num_y):
         'obtain the linear model of 2-d heat equation'
 
+        matrix_a, matrix_b = self.get_tensor_odes(num_x, num_y)
+
+        return matrix_a.tocsr(), matrix_b
+
+    def get_tensor_odes(self, num_x, num_y):
+        'obtain the linear model of 2-d heat equation with matrix_a as a TensorGridOperator'
+
+        # the i-th state variable is the temperature at the point (x_pos, y_pos), i = y_pos * num_x + x_pos
         assert isinstance(
             num_x, int), "number of mesh point should be an integer"
         assert isinstance(
@@ -225,6 +356,7 @@ class HeatTwoDimension2(object):
         disc_step_y = self.len_y / (num_y + 1)
         print "\ndiscretization step along y-axis:{}".format(disc_step_y)
 
+        heat_source = np.zeros((num_x,), dtype=bool)    # x-positions of the bottom heated by the source
         if self.has_heat_source:
             heat_start_pos_x = int(
                 math.floor(
@@ -234,60 +366,34 @@ class HeatTwoDimension2(object):
                     self.heat_source_pos[1] / disc_step_x)) - 1
 
             print "\nheat source is from point {} to point {} on x-axis\n".format(heat_start_pos_x, heat_end_pos_x)
+            x_pos = np.arange(0, num_x)
+            heat_source = (x_pos >= heat_start_pos_x) & (x_pos <= heat_end_pos_x)
 
         # we use explicit semi- finite-difference method to obtain the
         # linear model of heat equation
 
         num_var = num_x * num_y  # number of discrezation variables
-        # changing the sparsity structure of a csr_matrix is expensive.
-        # lil_matrix is more efficient
-        matrix_a = sparse.lil_matrix((num_var, num_var))
-        matrix_b = sparse.lil_matrix((num_var, 2))
         a = 1 / disc_step_x**2
         b = 1 / disc_step_y**2
-        c = -2 * (a + b)
         k = self.heat_lost_const
         step_x = disc_step_x
 
-        # fill matrix_a
+        # along x-axis
+        diag_x = np.full((num_x,), -2 * a)
+        diag_x[0] += a
+        diag_x[-1] += a / (1 + k * step_x)    # diffusion term
+        # along y-axis, the diagonal of the bottom depends on the heat source
+        diag_y = np.full((num_y, num_x), -2 * b)
+        diag_y[0, ~heat_source] += b
+        diag_y[-1, :] += b
+        matrix_a = TensorGridOperator((num_y, num_x), [b, a], [diag_y, diag_x[None, :]])
 
-        for i in xrange(0, num_var):
-            matrix_a[i, i] = c  # filling diagonal
-            x_pos = i % num_x  # x-position corresponding to i-th state variable
-            # y-position corresponding to i-th variable
-            y_pos = int((i - x_pos) / num_x)
-            print "the {}-th state variable is the temperature at the point ({},{})".format(i, x_pos, y_pos)
+        matrix_b = np.zeros((num_y, num_x, 2))
+        matrix_b[:, -1, 1] = a * (k * step_x) / (1 + k * step_x)
+        matrix_b[0, heat_source, 0] = b
 
-            # fill along x - axis
-            if x_pos - 1 >= 0:
-                matrix_a[i, i - 1] = a
-            else:
-                matrix_a[i, i] = matrix_a[i, i] + a
-
-            if x_pos + 1 <= num_x - 1:
-                matrix_a[i, i + 1] = a
-            else:
-                # fill diffusion term
-                matrix_a[i, i] = matrix_a[i, i] + a / (1 + k * step_x)
-                matrix_b[i, 1] = a * (k * step_x) / (1 + k * step_x)
-
-            # fill along y-axis
-            if y_pos - 1 >= 0:
-                matrix_a[i, (y_pos - 1) * num_x + x_pos] = b
-            else:
-
-                if self.has_heat_source and x_pos >= heat_start_pos_x and x_pos <= heat_end_pos_x:
-                    matrix_b[i, 0] = b
-                else:
-                    matrix_a[i, i] = matrix_a[i, i] + b
-
-            if y_pos + 1 <= num_y - 1:
-                matrix_a[i, (y_pos + 1) * num_x + x_pos] = b
-            else:
-                matrix_a[i, i] = matrix_a[i, i] + b
-
-        return self.diffusity_const * \
-            (matrix_a.tocsr()), self.diffusity_const * (matrix_b.tocsr())
+        return matrix_a.multiply(self.diffusity_const), \
+            self.diffusity_const * sparse.csr_matrix(matrix_b.reshape(num_var, 2))
 
 
 class HeatThreeDimension(object):
@@ -317,6 +423,17 @@ class HeatThreeDimension(object):
         self.heat_source_pos = heat_source_pos
 
     def get_odes(self, num_x, num_y, num_z):
+        'obtain the linear model of 3-d heat equation'
+
+        matrix_a, matrix_b = self.get_tensor_odes(num_x, num_y, num_z)
+
+        return matrix_a.tocsr(), matrix_b
+
+    def get_tensor_odes(self, num_x, num_y, num_z):
+        'obtain the linear model of 3-d heat equation with matrix_a as a TensorGridOperator'
+
+        # the i-th state variable is the temperature at (x_pos, y_pos, z_pos),
+        # i = z_pos * num_x * num_y + y_pos * num_x + x_pos
 
         assert isinstance(num_x, int)
         assert isinstance(num_y, int)
@@ -335,7 +452,6 @@ class HeatThreeDimension(object):
         a = 1 / step_x**2
         b = 1 / step_y**2
         c = 1 / step_z**2
-        d = -2 * (a + b + c)
 
         heat_start_pos_x = int(
             math.ceil(self.heat_source_pos[0, 0] / step_x)) - 1
@@ -352,65 +468,31 @@ class HeatThreeDimension(object):
         print"\n------------------"
         num_var = num_x * num_y * num_z
 
-        matrix_a = sparse.lil_matrix((num_var, num_var))
-        matrix_b = sparse.lil_matrix((num_var, 1))
-
-        for i in xrange(0, num_var):
-            z_pos = int(math.floor(i / num_x / num_y))
-            y_pos = int(math.floor((i - z_pos * num_x * num_y) / num_x))
-            x_pos = i - z_pos * num_x * num_y - y_pos * num_x
-
-            print"\nposition of the {}-th variable is: ({},{},{})".format(i, x_pos, y_pos, z_pos)
-
-            matrix_a[i, i] = d  # fill the diagonal
-
-            if x_pos - 1 >= 0:
-                matrix_a[i, i - 1] = matrix_a[i, i - 1] + a
-            if x_pos + 1 <= num_x - 1:
-                matrix_a[i, i + 1] = matrix_a[i, i + 1] + a
-
-            if y_pos - 1 >= 0:
-                ind = z_pos * num_x * num_y + (y_pos - 1) * num_x + x_pos
-                matrix_a[i, ind] = matrix_a[i, ind] + b
-            if y_pos + 1 <= num_y - 1:
-                ind = z_pos * num_x * num_y + (y_pos + 1) * num_x + x_pos
-                matrix_a[i, ind] = matrix_a[i, ind] + b
-
-            if z_pos - 1 >= 0:
-                ind = (z_pos - 1) * num_x * num_y + y_pos * num_x + x_pos
-                matrix_a[i, ind] = matrix_a[i, ind] + c
-            if z_pos + 1 <= num_z - 1:
-                ind = (z_pos + 1) * num_x * num_y + y_pos * num_x + x_pos
-                matrix_a[i, ind] = matrix_a[i, ind] + c
-
-            # boundary conditions
-
-            if x_pos == 0:   # u(0, j, k) = u(1, j, k): the left face
-                matrix_a[i, i] = matrix_a[i, i] + a
-            if y_pos == num_y - \
-                    1:  # u(i, num_y, k) = u(i, num_y - 1, k): the back face
-                matrix_a[i, i] = matrix_a[i, i] + b
-            if y_pos == 0:    # u(i, 0, k) = u(i, 1, k): the front face
-                matrix_a[i, i] = matrix_a[i, i] + b
-            if z_pos == num_z - \
-                    1:    # u(i, j, num_z) = u(i, j, num_z - 1): the top face
-                matrix_a[i, i] = matrix_a[i, i] + c
-
-            # heat source
-            if z_pos == 0:
-                if (x_pos >= heat_start_pos_x and x_pos <= heat_stop_pos_x and
-                        y_pos >= heat_start_pos_y and y_pos <= heat_stop_pos_y):
-                    matrix_b[i, 0] = c
-                else:
-                    matrix_a[i, i] = matrix_a[i, i] + c
-
-            # diffusion
-            if x_pos == num_x - 1:
-                matrix_a[i, i] = matrix_a[i, i] + a / \
-                    (1 + self.heat_exchange_const * step_x)
-
-        return self.diffusity_const * \
-            (matrix_a.tocsr()), self.diffusity_const * (matrix_b.tocsr())
+        x_pos = np.arange(0, num_x)
+        y_pos = np.arange(0, num_y)
+        heat_source = ((y_pos[:, None] >= heat_start_pos_y) & (y_pos[:, None] <= heat_stop_pos_y) &
+                       (x_pos[None, :] >= heat_start_pos_x) & (x_pos[None, :] <= heat_stop_pos_x))
+
+        # along x-axis: u(0, j, k) = u(1, j, k) on the left face, diffusion on the right face
+        diag_x = np.full((num_x,), -2 * a)
+        diag_x[0] += a
+        diag_x[-1] += a / (1 + self.heat_exchange_const * step_x)
+        # along y-axis: u(i, 0, k) = u(i, 1, k) on the front face, u(i, num_y, k) = u(i, num_y - 1, k) on the back face
+        diag_y = np.full((num_y,), -2 * b)
+        diag_y[0] += b
+        diag_y[-1] += b
+        # along z-axis: u(i, j, num_z) = u(i, j, num_z - 1) on the top face, heat source on the bottom face
+        diag_z = np.full((num_z, num_y, num_x), -2 * c)
+        diag_z[-1] += c
+        diag_z[0][~heat_source] += c
+        matrix_a = TensorGridOperator((num_z, num_y, num_x), [c, b, a],
+                                      [diag_z, diag_y[None, :, None], diag_x[None, None, :]])
+
+        matrix_b = np.zeros((num_z, num_y, num_x))
+        matrix_b[0][heat_source] = c
+
+        return matrix_a.multiply(self.diffusity_const), \
+            self.diffusity_const * sparse.csr_matrix(matrix_b.reshape(num_var, 1))
 
 
 class FirstOrderWaveEqOneDimension(object):
@@ -553,3 +635,20 @@ def sim_odeint_sparse(sparse_a_matrix, init_vec, input_vec, step, num_steps):
     runtime = time.time() - start
 
     return runtime, result
+
+
+def sim_adi(tensor_a_matrix, init_vec, input_vec, step, num_steps):
+    'use ADI steps of a TensorGridOperator, O(N) per step, same times as sim_odeint_sparse'
+
+    times = np.linspace(0, step, num_steps)
+    adi_step = tensor_a_matrix.get_adi_step(times[1] - times[0])
+    input_vec = np.asarray(input_vec, dtype=float).reshape(tensor_a_matrix.num_var)
+
+    start = time.time()
+    result = np.zeros((num_steps, tensor_a_matrix.num_var))
+    result[0] = init_vec
+    for i in xrange(1, num_steps):
+        result[i] = adi_step.step(result[i - 1], input_vec)
+    runtime = time.time() - start
+
+    return runtime, result